@@ -1,29 +1,170 @@
 import boto3
+import logging
 import os
+import threading
+from botocore.config import Config
 from dotenv import load_dotenv
 load_dotenv()
 
-def get_client(service_name):
+# Shared AWS clients: one session per process, one client/resource per service + endpoint + region,
+# all with the same tuned connection pool, retry and timeout settings. botocore clients are
+# thread-safe, so the cached ones are shared by FastAPI's threadpool and our own worker pools.
+
+_lock = threading.Lock()
+_session = None
+_session_pid = None
+_clients = {}
+_resources = {}
+
+
+def get_max_pool_connections():
+    return int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "50"))
+
+
+def get_client_config():
+    return Config(
+        max_pool_connections=get_max_pool_connections(),
+        retries={
+            "mode": os.getenv("AWS_RETRY_MODE", "adaptive"),
+            "max_attempts": int(os.getenv("AWS_MAX_ATTEMPTS", "5"))
+        },
+        connect_timeout=float(os.getenv("AWS_CONNECT_TIMEOUT", "3")),
+        read_timeout=float(os.getenv("AWS_READ_TIMEOUT", "10")),
+        tcp_keepalive=os.getenv("AWS_TCP_KEEPALIVE", "true").lower() == "true"
+    )
+
+
+def _endpoint_url():
     use_local = os.getenv("USE_LOCALSTACK", "false").lower() == "true"
-    kwargs = {
-        "region_name": os.getenv("REGION"),
-        "aws_access_key_id": os.getenv("AWS_ACCESS_KEY_ID"),
-        "aws_secret_access_key": os.getenv("AWS_SECRET_ACCESS_KEY")
-    }
-    if use_local:
-        kwargs["endpoint_url"] = "http://localhost:4566"
-    return boto3.client(service_name, **kwargs)
+    return "http://localhost:4566" if use_local else None
+
+
+class ClientStats:
+    # Per-service request, retry and concurrency counters, fed by botocore events
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._services = {}
+        self.pool_full_warnings = 0
+
+    def _service(self, name):
+        return self._services.setdefault(name, {
+            "requests": 0, "errors": 0, "retries": 0, "in_flight": 0, "peak_in_flight": 0
+        })
+
+    def before_call(self, service):
+        with self._lock:
+            stats = self._service(service)
+            stats["requests"] += 1
+            stats["in_flight"] += 1
+            stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+
+    def after_call(self, service, retries=0, error=False):
+        with self._lock:
+            stats = self._service(service)
+            stats["in_flight"] -= 1
+            stats["retries"] += retries
+            stats["errors"] += 1 if error else 0
+
+    def snapshot(self):
+        max_pool = get_max_pool_connections()
+        with self._lock:
+            services = {name: dict(stats) for name, stats in self._services.items()}
+        for stats in services.values():
+            # Close to 1: requests are queuing for a pooled connection
+            stats["pool_saturation"] = round(stats["peak_in_flight"] / max_pool, 3)
+        return {
+            "max_pool_connections": max_pool,
+            "pool_full_warnings": self.pool_full_warnings,
+            "services": services
+        }
+
+
+stats = ClientStats()
+
+
+class _PoolFullCounter(logging.Handler):
+    # urllib3 logs this when more connections were open than the pool keeps
+    def emit(self, record):
+        if "Connection pool is full" in record.getMessage():
+            with stats._lock:
+                stats.pool_full_warnings += 1
+
+
+logging.getLogger("urllib3.connectionpool").addHandler(_PoolFullCounter(level=logging.WARNING))
+
+
+def _instrument(client):
+    service = client.meta.service_model.service_name
+
+    def before_call(**kwargs):
+        stats.before_call(service)
+
+    def after_call(http_response=None, parsed=None, **kwargs):
+        metadata = (parsed or {}).get("ResponseMetadata", {})
+        error = http_response is not None and http_response.status_code >= 400
+        stats.after_call(service, retries=metadata.get("RetryAttempts", 0), error=error)
+
+    def after_call_error(**kwargs):
+        stats.after_call(service, error=True)
+
+    client.meta.events.register("before-call", before_call)
+    client.meta.events.register("after-call", after_call)
+    client.meta.events.register("after-call-error", after_call_error)
+    return client
+
+
+def get_session():
+    # A new session after fork: botocore connections must not be shared between processes
+    global _session, _session_pid
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = boto3.session.Session(
+                region_name=os.getenv("REGION"),
+                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
+            )
+            _session_pid = os.getpid()
+            _clients.clear()
+            _resources.clear()
+        return _session
+
+
+def get_client(service_name):
+    session = get_session()
+    key = (service_name, _endpoint_url(), os.getenv("REGION"))
+    with _lock:
+        if key not in _clients:
+            _clients[key] = _instrument(session.client(
+                service_name, endpoint_url=key[1], config=get_client_config()
+            ))
+        return _clients[key]
+
 
 def get_resource(service_name):
-    use_local = os.getenv("USE_LOCALSTACK", "false").lower() == "true"
-    kwargs = {
-        "region_name": os.getenv("REGION"),
-        "aws_access_key_id": os.getenv("AWS_ACCESS_KEY_ID"),
-        "aws_secret_access_key": os.getenv("AWS_SECRET_ACCESS_KEY")
-    }
-    if use_local:
-        kwargs["endpoint_url"] = "http://localhost:4566"
-    return boto3.resource(service_name, **kwargs)
+    # Modules keep the resource at import and create Table/Bucket objects from it per call;
+    # requests all go through the resource's one pooled client
+    session = get_session()
+    key = (service_name, _endpoint_url(), os.getenv("REGION"))
+    with _lock:
+        if key not in _resources:
+            resource = session.resource(service_name, endpoint_url=key[1], config=get_client_config())
+            _instrument(resource.meta.client)
+            _resources[key] = resource
+        return _resources[key]
+
+
+def client_stats():
+    return stats.snapshot()
+
+
+def reset_clients():
+    # Drops cached clients (tests, or after changing the AWS_* settings)
+    global _session
+    with _lock:
+        _session = None
+        _clients.clear()
+        _resources.clear()
 
 
 
@@ -44,4 +185,3 @@ def get_resource(service_name):
 #         "endpoint_url": os.getenv("ENDPOINT_URL", "http://localhost:4566")  # Always set
 #     }
 #     return boto3.resource(service_name, **kwargs)
-
@@ -2,7 +2,11 @@
 # Handles interactions with the DynamoDB
 
 import boto3
-from datetime import datetime
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from datetime import datetime, timedelta
+import base64
+import json
 import os
 from decimal import Decimal
 from dotenv import load_dotenv
@@ -15,6 +19,13 @@ dynamodb = get_resource("dynamodb")
 
 table = dynamodb.Table("PDF_Metadata")
 
+# Every file item carries LISTING_PARTITION so the uploaded_at-index lists them newest first
+LISTING_INDEX = "uploaded_at-index"
+LISTING_PARTITION = "files"
+LISTING_ATTRIBUTES = ["file_id", "filename", "uploaded_at", "status", "status_updated_at"]
+# Reserved item holding the running number of files (not a uuid, so never a real file_id)
+FILE_COUNT_ID = "#file_count"
+
 def convert_float_to_decimal(obj):
     """Convert float values to Decimal for DynamoDB compatibility"""
     if isinstance(obj, float):
@@ -26,18 +37,38 @@ def convert_float_to_decimal(obj):
     else:
         return obj
 
-def save_metadata(file_id, filename):
+def save_metadata(file_id, filename, status=None, content_hash=None):
     try:
         item = {
             "file_id": str(file_id),  # Ensure string
             "filename": str(filename),  # Ensure string
-            "uploaded_at": datetime.utcnow().isoformat()
+            "uploaded_at": datetime.utcnow().isoformat(),
+            "listing": LISTING_PARTITION
         }
+        if status:
+            item["status"] = str(status)
+            item["stages"] = {str(status): item["uploaded_at"]}
+        if content_hash:
+            item["content_hash"] = str(content_hash)
         
         # Convert any potential float values to Decimal
         item = convert_float_to_decimal(item)
         
-        table.put_item(Item=item)
+        try:
+            table.put_item(Item=item, ConditionExpression="attribute_not_exists(file_id)")
+            created = True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            table.put_item(Item=item)
+            created = False
+        if created:
+            # Counted once per new file_id; repaired by scripts.backfill_file_listing if it ever drifts
+            table.update_item(
+                Key={"file_id": FILE_COUNT_ID},
+                UpdateExpression="ADD file_count :one",
+                ExpressionAttributeValues={":one": 1}
+            )
         print(f"✅ Metadata saved successfully for file_id: {file_id}")
         
     except Exception as e:
@@ -45,7 +76,34 @@ def save_metadata(file_id, filename):
         print(f"Debug info - file_id: {file_id}, filename: {filename}")
         raise RuntimeError(f"Failed to save metadata to DynamoDB: {e}")
 
+def update_status(file_id, status, error=None, timings=None):
+    # Records the ingestion stage of a file (queued/extracting/embedding/indexed/failed)
+    # and optionally the per-stage timings in seconds
+    try:
+        now = datetime.utcnow().isoformat()
+        update = "SET #status = :status, status_updated_at = :now, #stages.#stage = :now"
+        values = {":status": str(status), ":now": now}
+        names = {"#status": "status", "#stages": "stages", "#stage": str(status)}
+        if error:
+            update += ", #error = :error"
+            values[":error"] = str(error)
+            names["#error"] = "error"
+        if timings:
+            update += ", timings = :timings"
+            values[":timings"] = convert_float_to_decimal(timings)
+        table.update_item(
+            Key={"file_id": str(file_id)},
+            UpdateExpression=update,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    except Exception as e:
+        print(f"❌ Failed to update status for file_id {file_id}: {e}")
+        raise RuntimeError(f"Failed to update status in DynamoDB: {e}")
+
 def get_metadata(file_id):
+    if str(file_id) == FILE_COUNT_ID:
+        return {}  # The counter item is not a file
     try:
         response = table.get_item(Key={"file_id": str(file_id)})
         item = response.get("Item", {})
@@ -67,28 +125,82 @@ def get_metadata(file_id):
         print(f"❌ Failed to get metadata: {e}")
         raise RuntimeError(f"Failed to get metadata: {e}")
 
-def list_metadata():
+def encode_cursor(last_evaluated_key):
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, sort_keys=True).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
     try:
-        response = table.scan()
-        items = response.get("Items", [])
-        
-        # Convert Decimal back to float for JSON serialization
-        def decimal_to_float(obj):
-            if isinstance(obj, Decimal):
-                return float(obj)
-            elif isinstance(obj, dict):
-                return {k: decimal_to_float(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [decimal_to_float(item) for item in obj]
-            else:
-                return obj
-        
-        return [decimal_to_float(item) for item in items]
-        
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor.")
+    if not isinstance(key, dict) or set(key) != {"file_id", "listing", "uploaded_at"}:
+        raise ValueError("Invalid cursor.")
+    return key
+
+
+def list_metadata_page(limit=10, cursor=None):
+    # One page of files, newest first, via the uploaded_at-index; returns (files, next_cursor).
+    # Reads only `limit` index entries, whatever the size of the table
+    try:
+        kwargs = {
+            "IndexName": LISTING_INDEX,
+            "KeyConditionExpression": Key("listing").eq(LISTING_PARTITION),
+            "ScanIndexForward": False,
+            "Limit": int(limit),
+            "ProjectionExpression": ", ".join(f"#{name}" for name in LISTING_ATTRIBUTES),
+            "ExpressionAttributeNames": {f"#{name}": name for name in LISTING_ATTRIBUTES}
+        }
+        if cursor:
+            kwargs["ExclusiveStartKey"] = decode_cursor(cursor)
+        response = table.query(**kwargs)
+        return response.get("Items", []), encode_cursor(response.get("LastEvaluatedKey"))
+
+    except ValueError:
+        raise
     except Exception as e:
         print(f"❌ Failed to list metadata: {e}")
         raise RuntimeError(f"Failed to list metadata: {e}")
 
+
+def count_files():
+    # Running total kept by save_metadata (a single GetItem instead of counting a scan)
+    try:
+        response = table.get_item(Key={"file_id": FILE_COUNT_ID})
+        return int(response.get("Item", {}).get("file_count", 0))
+    except Exception as e:
+        print(f"❌ Failed to count files: {e}")
+        raise RuntimeError(f"Failed to count files: {e}")
+
+def find_by_content_hash(content_hash, max_pending_age=None):
+    # Returns the newest indexed upload with these exact bytes, via the content_hash-index GSI.
+    # An unfinished one counts only if its status changed within max_pending_age seconds: its job
+    # lives in the memory of the process that ran it and never finishes if that process restarted
+    try:
+        response = table.query(
+            IndexName="content_hash-index",
+            KeyConditionExpression=Key("content_hash").eq(str(content_hash))
+        )
+        items = response.get("Items", [])
+        items.sort(key=lambda item: item.get("uploaded_at", ""), reverse=True)
+        for item in items:
+            if item.get("status", "indexed") == "indexed":
+                return item
+        if max_pending_age is not None:
+            cutoff = (datetime.utcnow() - timedelta(seconds=max_pending_age)).isoformat()
+            for item in items:
+                changed = item.get("status_updated_at") or item.get("uploaded_at", "")
+                if item.get("status") != "failed" and changed >= cutoff:
+                    return item
+        return None
+
+    except Exception as e:
+        print(f"❌ Failed to look up content hash: {e}")
+        raise RuntimeError(f"Failed to look up content hash: {e}")
+
 def test_table_connection():
     """Test function to verify table connectivity"""
     try:
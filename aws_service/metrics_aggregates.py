@@ -0,0 +1,201 @@
+# Running totals over LLM_Metrics, kept in LLM_Metrics_Aggregates so the summary is a single read.
+# One item per aggregate: "ALL", "FILE#<file_id>" and "DAY#<YYYY-MM-DD>", plus hourly percentile
+# sketches "SKETCH#ALL#<YYYY-MM-DDTHH>" and "SKETCH#FILE#<file_id>#<YYYY-MM-DDTHH>".
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from aws_service.metrics_sketch import LogHistogram
+
+AGGREGATES_TABLE = "LLM_Metrics_Aggregates"
+ALL_KEY = "ALL"
+
+COUNTERS = ("query_count", "tokens_sum", "response_time_sum", "cache_hits", "ttft_sum", "ttft_count",
+            "prompt_tokens_sum", "completion_tokens_sum", "token_split_count")
+
+# Sketch bucket counts are stored as top-level attributes "<prefix><bucket>" so ingestion can ADD to them
+SKETCHES = {"response_time": "rt:", "tokens_used": "tok:"}
+MAX_WINDOW_HOURS = 24 * 31
+# Keeps each UpdateExpression well under DynamoDB's 4 KB expression limit
+MAX_ADDS_PER_UPDATE = 50
+
+
+def file_key(file_id):
+    return f"FILE#{file_id}"
+
+
+def day_key(day):
+    return f"DAY#{day}"
+
+
+def sketch_key(hour, file_id=None):
+    if file_id is None:
+        return f"SKETCH#ALL#{hour}"
+    return f"SKETCH#FILE#{file_id}#{hour}"
+
+
+def sketch_keys(item):
+    if not item.get("timestamp"):
+        return []
+    hour = str(item["timestamp"])[:13]
+    return [sketch_key(hour), sketch_key(hour, item.get("file_id", "unknown"))]
+
+
+def sketch_deltas(item, histogram):
+    deltas = {"query_count": 1}
+    for field, prefix in SKETCHES.items():
+        deltas[prefix + histogram.bucket(float(item.get(field, 0)))] = 1
+    return deltas
+
+
+def aggregate_keys(item):
+    keys = [ALL_KEY, file_key(item.get("file_id", "unknown"))]
+    if item.get("timestamp"):
+        keys.append(day_key(str(item["timestamp"])[:10]))
+    return keys
+
+
+def item_deltas(item):
+    deltas = {
+        "query_count": 1,
+        "tokens_sum": int(item.get("tokens_used", 0)),
+        "response_time_sum": Decimal(str(item.get("response_time", 0))),
+        "cache_hits": 1 if item.get("cache_hit") else 0,
+    }
+    if item.get("time_to_first_token") is not None:
+        deltas["ttft_sum"] = Decimal(str(item["time_to_first_token"]))
+        deltas["ttft_count"] = 1
+    # Prompt/completion split, sent since token counts come from the LLM response
+    if item.get("prompt_tokens") is not None:
+        deltas["prompt_tokens_sum"] = int(item["prompt_tokens"])
+        deltas["completion_tokens_sum"] = int(item.get("completion_tokens", 0))
+        deltas["token_split_count"] = 1
+    return deltas
+
+
+def combine(items):
+    # {aggregate_id: {counter: total}} for a batch, so each aggregate gets one update
+    totals = defaultdict(lambda: defaultdict(int))
+    histogram = LogHistogram()
+    for item in items:
+        for keys, deltas in ((aggregate_keys(item), item_deltas(item)),
+                             (sketch_keys(item), sketch_deltas(item, histogram))):
+            for key in keys:
+                for name, value in deltas.items():
+                    totals[key][name] += value
+    return totals
+
+
+def update_actions(table_name, items):
+    # TransactWriteItems Update actions that ADD a batch's deltas, one per aggregate (split to stay under
+    # the expression limit), for a resource's client (it serializes the values). ADD is atomic, so
+    # concurrent Lambda invocations never lose an update.
+    actions = []
+    for key, deltas in combine(items).items():
+        names = list(deltas)
+        for start in range(0, len(names), MAX_ADDS_PER_UPDATE):
+            part = names[start:start + MAX_ADDS_PER_UPDATE]
+            actions.append({"Update": {
+                "TableName": table_name,
+                "Key": {"aggregate_id": key},
+                "UpdateExpression": "ADD " + ", ".join(f"#a{i} :a{i}" for i in range(len(part))),
+                "ExpressionAttributeNames": {f"#a{i}": name for i, name in enumerate(part)},
+                "ExpressionAttributeValues": {f":a{i}": deltas[name] for i, name in enumerate(part)},
+            }})
+    return actions
+
+
+def summarize(aggregate):
+    # Averages from one aggregate item
+    count = int(aggregate.get("query_count", 0))
+    if not count:
+        return {"total_queries": 0, "avg_response_time": 0, "avg_tokens_used": 0}
+    summary = {
+        "total_queries": count,
+        "avg_response_time": round(float(aggregate.get("response_time_sum", 0)) / count, 2),
+        "avg_tokens_used": round(int(aggregate.get("tokens_sum", 0)) / count, 2),
+        "cache_hit_rate": round(int(aggregate.get("cache_hits", 0)) / count, 4),
+    }
+    llm_calls = count - int(aggregate.get("cache_hits", 0))
+    if llm_calls:
+        # Cache hits use no tokens; capacity planning wants the cost of a call that reaches Gemini
+        summary["avg_tokens_per_llm_call"] = round(int(aggregate.get("tokens_sum", 0)) / llm_calls, 2)
+    split_count = int(aggregate.get("token_split_count", 0))
+    if split_count:
+        summary["avg_prompt_tokens"] = round(int(aggregate["prompt_tokens_sum"]) / split_count, 2)
+        summary["avg_completion_tokens"] = round(int(aggregate.get("completion_tokens_sum", 0)) / split_count, 2)
+    ttft_count = int(aggregate.get("ttft_count", 0))
+    if ttft_count:
+        summary["avg_time_to_first_token"] = round(float(aggregate["ttft_sum"]) / ttft_count, 3)
+    return summary
+
+
+def window_hours(hours, now=None):
+    # Hour buckets covering the last `hours` hours, including the current one
+    now = now or datetime.utcnow()
+    return [(now - timedelta(hours=h)).strftime("%Y-%m-%dT%H") for h in range(hours)]
+
+
+def get_items(table, keys):
+    # BatchGetItem in chunks of 100, following UnprocessedKeys
+    items = []
+    for start in range(0, len(keys), 100):
+        request = {table.name: {"Keys": [{"aggregate_id": key} for key in keys[start:start + 100]]}}
+        while request:
+            response = table.meta.client.batch_get_item(RequestItems=request)
+            items.extend(response.get("Responses", {}).get(table.name, []))
+            request = response.get("UnprocessedKeys") or None
+    return items
+
+
+def read_percentiles(table, hours, file_id=None, now=None):
+    # Merges the hourly sketches of the window; cost grows with the window, not with the raw table
+    keys = [sketch_key(hour, file_id) for hour in window_hours(hours, now)]
+    histograms = {field: LogHistogram() for field in SKETCHES}
+    for item in get_items(table, keys):
+        for name, count in item.items():
+            for field, prefix in SKETCHES.items():
+                if name.startswith(prefix):
+                    histograms[field].add_bucket(name[len(prefix):], count)
+    result = {
+        "window_hours": hours,
+        "count": histograms["response_time"].count,
+        "relative_accuracy": histograms["response_time"].relative_accuracy,
+    }
+    for field, histogram in histograms.items():
+        result[field] = histogram.percentiles()
+    return result
+
+
+def rebuild(metrics_table, aggregates_table):
+    # Recomputes every aggregate from the raw table (paginated scan) and replaces the stored ones
+    totals = defaultdict(lambda: defaultdict(int))
+    scanned = 0
+    kwargs = {}
+    while True:
+        response = metrics_table.scan(**kwargs)
+        for key, deltas in combine(response.get("Items", [])).items():
+            for name, value in deltas.items():
+                totals[key][name] += value
+        scanned += len(response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    stale = set()
+    kwargs = {"ProjectionExpression": "aggregate_id"}
+    while True:
+        response = aggregates_table.scan(**kwargs)
+        stale.update(item["aggregate_id"] for item in response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    stale -= set(totals)
+
+    with aggregates_table.batch_writer() as batch:
+        for key, counters in totals.items():
+            batch.put_item(Item={"aggregate_id": key, **counters})
+        for key in stale:
+            batch.delete_item(Key={"aggregate_id": key})
+    return {"scanned": scanned, "aggregates": len(totals), "removed": len(stale)}
@@ -0,0 +1,65 @@
+# Mergeable quantile sketch (DDSketch-style log histogram) for latency and token percentiles.
+# A value v is counted in bucket ceil(log_gamma(v)); any quantile read back is within
+# relative_accuracy of the true value, and two sketches merge by adding bucket counts.
+
+import math
+import os
+from collections import defaultdict
+
+ZERO = "zero"
+
+
+def get_relative_accuracy():
+    # Must be the same for writers and readers of the stored sketches
+    return float(os.getenv("SKETCH_RELATIVE_ACCURACY", "0.01"))
+
+
+class LogHistogram:
+
+    def __init__(self, relative_accuracy=None, min_value=1e-6):
+        self.relative_accuracy = relative_accuracy or get_relative_accuracy()
+        self.gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.min_value = min_value
+        self.counts = defaultdict(int)
+        self.count = 0
+
+    def bucket(self, value):
+        if value <= self.min_value:
+            return ZERO
+        return str(math.ceil(math.log(value) / self._log_gamma))
+
+    def add(self, value, count=1):
+        self.counts[self.bucket(float(value))] += count
+        self.count += count
+
+    def add_bucket(self, bucket, count):
+        self.counts[bucket] += int(count)
+        self.count += int(count)
+
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.add_bucket(bucket, count)
+
+    def _value(self, bucket):
+        if bucket == ZERO:
+            return 0.0
+        return 2 * self.gamma ** int(bucket) / (self.gamma + 1)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        buckets = sorted(self.counts, key=lambda b: -math.inf if b == ZERO else int(b))
+        for bucket in buckets:
+            seen += self.counts[bucket]
+            if seen > rank:
+                return self._value(bucket)
+        return self._value(buckets[-1])
+
+    def percentiles(self, digits=4):
+        return {
+            name: None if self.quantile(q) is None else round(self.quantile(q), digits)
+            for name, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))
+        }
@@ -0,0 +1,123 @@
+# Validates LLM query metrics and stores them into LLM_Metrics and the running aggregates.
+# Shared by the /metrics router and the metrics Lambda.
+
+import time
+from pydantic import BaseModel, ValidationError
+from typing import Optional
+from dotenv import load_dotenv
+from decimal import Decimal
+from datetime import datetime
+from aws_service.aws_client import get_resource
+import botocore.exceptions
+from aws_service.metrics_aggregates import AGGREGATES_TABLE, update_actions
+
+load_dotenv()
+
+# Attempts per record when its transaction conflicts with another one on the same aggregates
+TRANSACTION_ATTEMPTS = 4
+RETRYABLE_CANCELLATIONS = {"TransactionConflict", "ThrottlingError", "ProvisionedThroughputExceeded"}
+
+class Metric(BaseModel):
+    run_id: str
+    tokens_used: int
+    confidence_score: float
+    response_time: float
+    file_id: str = "unknown"
+    cache_hit: bool = False
+    time_to_first_token: Optional[float] = None
+    timestamp: Optional[str] = None
+    context_tokens_saved: Optional[int] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+dynamodb = get_resource("dynamodb")
+
+
+def metric_to_item(metric):
+    item = {
+        "run_id": metric.run_id,
+        "tokens_used": metric.tokens_used,
+        "confidence_score": Decimal(str(metric.confidence_score)),
+        "response_time": Decimal(str(metric.response_time)),
+        "file_id": metric.file_id,
+        "cache_hit": metric.cache_hit
+    }
+    if metric.time_to_first_token is not None:
+        item["time_to_first_token"] = Decimal(str(metric.time_to_first_token))
+    for field in ("context_tokens_saved", "prompt_tokens", "completion_tokens"):
+        if getattr(metric, field) is not None:
+            item[field] = getattr(metric, field)
+    # Ingestion time when the sender did not say when the query ran; the per-day aggregate needs one
+    item["timestamp"] = metric.timestamp or datetime.utcnow().isoformat()
+    return item
+
+
+def unpack_metrics(payload):
+    # One metric, a list of them, or {"metrics": [...]} -> list of raw records
+    if isinstance(payload, dict) and "metrics" in payload:
+        payload = payload["metrics"]
+    return payload if isinstance(payload, list) else [payload]
+
+
+def validate_metrics(records):
+    # Returns ([(index, Metric)], [failure]); one bad record does not reject the rest
+    valid, failed = [], []
+    for index, record in enumerate(records):
+        try:
+            valid.append((index, Metric.model_validate(record)))
+        except ValidationError as e:
+            run_id = record.get("run_id") if isinstance(record, dict) else None
+            failed.append({"index": index, "run_id": run_id, "error": str(e), "retryable": False})
+    return valid, failed
+
+
+def store_metric(table, aggregates_table, metric):
+    # The record and its aggregate ADDs in one transaction, conditional on the run_id being new: a
+    # redelivered record, even one processed concurrently, is counted once, and a record is never
+    # stored without its aggregates. Returns False for an already stored run_id
+    item = metric_to_item(metric)
+    actions = [{"Put": {
+        "TableName": table.name,
+        "Item": item,
+        "ConditionExpression": "attribute_not_exists(run_id)",
+    }}] + update_actions(aggregates_table.name, [item])
+    client = table.meta.client
+    for attempt in range(TRANSACTION_ATTEMPTS):
+        try:
+            client.transact_write_items(TransactItems=actions)
+            return True
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+            codes = [reason.get("Code") for reason in e.response.get("CancellationReasons", [])]
+            if codes and codes[0] == "ConditionalCheckFailed":
+                return False
+            if attempt == TRANSACTION_ATTEMPTS - 1 or not RETRYABLE_CANCELLATIONS.intersection(codes):
+                raise
+        time.sleep(0.05 * 2 ** attempt)
+
+
+def store_metrics(table, aggregates_table, metrics):
+    # metrics: [(index, Metric)]. Returns (items newly written, a failure per record that could not be
+    # written, which a retry may store: neither the record nor its aggregates were changed)
+    written, failed = [], []
+    for index, metric in metrics:
+        try:
+            if store_metric(table, aggregates_table, metric):
+                written.append(metric.run_id)
+        except Exception as e:
+            failed.append({"index": index, "run_id": metric.run_id, "error": str(e), "retryable": True})
+    return written, failed
+
+
+def ingest_metrics(records, table=None, aggregates_table=None):
+    # Validates and stores a batch together with the running aggregates;
+    # returns (stored count, per-record failures sorted by index)
+    table = table or dynamodb.Table("LLM_Metrics")
+    aggregates_table = aggregates_table or dynamodb.Table(AGGREGATES_TABLE)
+    valid, failed = validate_metrics(records)
+    written, write_failures = store_metrics(table, aggregates_table, valid)
+    failed += write_failures
+    failed.sort(key=lambda failure: failure["index"])
+    return len(records) - len(failed), failed
@@ -21,24 +21,49 @@ def convert_float_to_decimal(obj):
     else:
         return obj
 
-def log_query(run_id, query_text, response_text, confidence_score, file_id="unknown"):
+def build_log_item(run_id, query_text, response_text, confidence_score, file_id="unknown", cache_hit=False,
+                   timestamp=None, tokens_used=None):
+    # timestamp: when the query was answered (records may be written later by the outbox)
+    # Convert confidence_score to Decimal
+    confidence_decimal = Decimal(str(confidence_score)) if isinstance(confidence_score, (float, int)) else confidence_score
+
+    item = {
+        "run_id": str(run_id),  # Ensure string
+        "query_text": str(query_text),  # Ensure string
+        "response_text": str(response_text),  # Ensure string
+        "confidence_score": confidence_decimal,  # Convert to Decimal
+        "file_id": str(file_id),  # Ensure string
+        "cache_hit": bool(cache_hit),
+        "timestamp": timestamp or datetime.utcnow().isoformat()
+    }
+    if tokens_used is not None:
+        item["tokens_used"] = int(tokens_used)
+    # Partition of the time_bucket-timestamp-index: one per UTC day, newest read first
+    item["time_bucket"] = item["timestamp"][:10]
+    # Double-check all float values are converted
+    return convert_float_to_decimal(item)
+
+
+def write_query_logs(records):
+    # records: log_query keyword dicts. One BatchWriteItem (max 25 items);
+    # returns the indexes of records DynamoDB did not write, for the caller to retry
+    items = [build_log_item(**record) for record in records]
+    response = dynamodb.batch_write_item(
+        RequestItems={"QueryLog": [{"PutRequest": {"Item": item}} for item in items]}
+    )
+    unprocessed = {
+        request["PutRequest"]["Item"]["run_id"]
+        for request in response.get("UnprocessedItems", {}).get("QueryLog", [])
+    }
+    return [i for i, item in enumerate(items) if item["run_id"] in unprocessed]
+
+
+def log_query(run_id, query_text, response_text, confidence_score, file_id="unknown", cache_hit=False,
+              tokens_used=None):
     try:
         table = dynamodb.Table("QueryLog")
-        
-        # Convert confidence_score to Decimal
-        confidence_decimal = Decimal(str(confidence_score)) if isinstance(confidence_score, (float, int)) else confidence_score
-        
-        item = {
-            "run_id": str(run_id),  # Ensure string
-            "query_text": str(query_text),  # Ensure string
-            "response_text": str(response_text),  # Ensure string
-            "confidence_score": confidence_decimal,  # Convert to Decimal
-            "file_id": str(file_id),  # Ensure string
-            "timestamp": datetime.utcnow().isoformat()
-        }
-        
-        # Double-check all float values are converted
-        item = convert_float_to_decimal(item)
+        item = build_log_item(run_id, query_text, response_text, confidence_score, file_id, cache_hit,
+                              tokens_used=tokens_used)
         
         table.put_item(Item=item)
         print(f"✅ Query logged successfully for run_id: {run_id}")
@@ -58,6 +83,7 @@ def log_query(run_id, query_text, response_text, confidence_score, file_id="unkn
                 "file_id": str(file_id),
                 "timestamp": datetime.utcnow().isoformat()
             }
+            minimal_item["time_bucket"] = minimal_item["timestamp"][:10]
             table.put_item(Item=minimal_item)
             print(f"✅ Minimal query log saved for debugging")
         except Exception as debug_error:
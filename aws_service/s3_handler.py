@@ -6,6 +6,7 @@ import os
 from dotenv import load_dotenv
 from aws_service.aws_client import get_client
 from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
 
 load_dotenv()
 
@@ -13,13 +14,30 @@ s3 = get_client("s3")
 
 bucket = os.getenv("BUCKET_NAME")
 
+MB = 1024 * 1024
+
+# Large PDFs go up as parallel multipart uploads
+transfer_config = TransferConfig(
+    multipart_threshold=int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "8")) * MB,
+    multipart_chunksize=int(os.getenv("S3_MULTIPART_CHUNKSIZE_MB", "8")) * MB,
+    max_concurrency=int(os.getenv("S3_MAX_CONCURRENCY", "10")),
+    use_threads=True
+)
+
 def upload_to_s3(file_path, key):
     # Uploads a local file to the configured S3 bucket
     try:
-        s3.upload_file(file_path, bucket, key)
+        s3.upload_file(file_path, bucket, key, Config=transfer_config)
     except ClientError as e:
         raise RuntimeError(f"Failed to upload to S3: {e}")
 
+def delete_from_s3(key):
+    # Removes an object, e.g. when the rest of its ingestion failed
+    try:
+        s3.delete_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        raise RuntimeError(f"Failed to delete from S3: {e}")
+
 def download_from_s3(key, dest_path):
     # Downloads a file from S3 to the specified destination path.
     try:
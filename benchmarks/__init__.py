@@ -0,0 +1 @@
+# Benchmarks for the RAG server; run with python -m benchmarks.<name>
@@ -0,0 +1,170 @@
+'''Picks HNSW settings for the Chroma collections from data: builds synthetic corpora,
+then reports build time, memory, query latency and recall@k against exact search
+for each combination of M, construction_ef and search_ef.
+
+    python -m benchmarks.hnsw_recall --sizes 10000 100000 1000000 --m 16 32 \\
+        --construction-ef 100 200 --search-ef 10 50 100 --k 4 --output hnsw.jsonl
+
+Vectors are 384-dimensional (bge-small) and clustered, so neighbours are not trivially
+far apart as they would be with uniform noise. search_ef is changed on the built
+collection, like rag_chain.apply_search_ef does, and the index is reloaded so it takes
+effect; the graph is only rebuilt per (M, construction_ef). The chosen values go into
+HNSW_M, HNSW_CONSTRUCTION_EF, HNSW_SEARCH_EF and RETRIEVER_K.'''
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import chromadb
+from chromadb.api.client import SharedSystemClient
+
+
+def synthetic_vectors(rng, count, dim, centers):
+    # Gaussian clusters around random centers, like chunks of many documents on a few topics
+    labels = rng.integers(0, len(centers), size=count)
+    vectors = centers[labels] + rng.normal(scale=1.0, size=(count, dim)).astype(np.float32)
+    return vectors.astype(np.float32)
+
+
+def normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def exact_neighbours(corpus, queries, k, space, chunk=100000):
+    # Brute-force top-k with NumPy, in chunks so 1M x 384 does not need a full distance matrix
+    if space == "cosine":
+        corpus, queries = normalize(corpus), normalize(queries)
+    best_scores = np.full((len(queries), 0), np.inf, dtype=np.float32)
+    best_ids = np.empty((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(corpus), chunk):
+        block = corpus[start:start + chunk]
+        if space == "l2":
+            scores = (queries ** 2).sum(1)[:, None] - 2 * queries @ block.T + (block ** 2).sum(1)[None, :]
+        else:
+            scores = -(queries @ block.T)
+        scores = np.concatenate([best_scores, scores], axis=1)
+        ids = np.concatenate([best_ids, np.broadcast_to(np.arange(start, start + len(block)), (len(queries), len(block)))], axis=1)
+        top = np.argpartition(scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+    return [set(row) for row in best_ids.tolist()]
+
+
+def rss_mb():
+    # Current resident memory; Chroma's index lives in native code, so tracemalloc would miss it
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def dir_mb(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / 2 ** 20
+
+
+def build(client, corpus, space, m, construction_ef):
+    collection = client.create_collection(
+        f"bench-{m}-{construction_ef}",
+        metadata={"hnsw:space": space, "hnsw:M": m, "hnsw:construction_ef": construction_ef},
+        embedding_function=None
+    )
+    batch = client.get_max_batch_size()
+    for start in range(0, len(corpus), batch):
+        end = min(start + batch, len(corpus))
+        collection.add(ids=[str(i) for i in range(start, end)], embeddings=corpus[start:end])
+    return collection
+
+
+def reopen(persist_dir, name, search_ef):
+    # Chroma reads ef_search when it loads the index, so drop the cached one after changing it
+    chromadb.PersistentClient(path=persist_dir).get_collection(name).modify(
+        configuration={"hnsw": {"ef_search": search_ef}}
+    )
+    SharedSystemClient.clear_system_cache()
+    return chromadb.PersistentClient(path=persist_dir).get_collection(name)
+
+
+def measure_queries(collection, queries, truth, k):
+    timings, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[query], n_results=k, include=[])
+        timings.append((time.perf_counter() - start) * 1000)
+        hits += len(expected & {int(i) for i in result["ids"][0]})
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[max(int(len(timings) * 0.95) - 1, 0)], 3),
+        "recall": round(hits / (len(queries) * k), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--space", choices=["l2", "cosine", "ip"], default="l2")
+    parser.add_argument("--m", type=int, nargs="+", default=[16, 32])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100, 200])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centers = rng.normal(size=(args.clusters, args.dim)).astype(np.float32)
+
+    print(f"{'chunks':>8} {'M':>3} {'c_ef':>5} {'s_ef':>5} {'build s':>8} {'rss MB':>8} {'disk MB':>8} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'recall@' + str(args.k):>9}")
+    for size in sorted(args.sizes):
+        corpus = synthetic_vectors(rng, size, args.dim, centers)
+        queries = synthetic_vectors(rng, args.queries, args.dim, centers)
+        truth = exact_neighbours(corpus, queries, args.k, args.space)
+
+        for m in args.m:
+            for construction_ef in args.construction_ef:
+                persist_dir = tempfile.mkdtemp(prefix="bench_hnsw_")
+                try:
+                    client = chromadb.PersistentClient(path=persist_dir)
+                    rss_before = rss_mb()
+                    start = time.perf_counter()
+                    collection = build(client, corpus, args.space, m, construction_ef)
+                    build_seconds = time.perf_counter() - start
+                    rss_delta = rss_mb() - rss_before
+                    disk = dir_mb(persist_dir)
+
+                    for search_ef in args.search_ef:
+                        collection = reopen(persist_dir, collection.name, search_ef)
+                        result = {
+                            "chunks": size, "dim": args.dim, "space": args.space, "k": args.k,
+                            "M": m, "construction_ef": construction_ef, "search_ef": search_ef,
+                            "build_seconds": round(build_seconds, 2),
+                            "rss_mb": round(rss_delta, 1), "disk_mb": round(disk, 1),
+                            **measure_queries(collection, queries, truth, args.k)
+                        }
+                        print(f"{size:>8} {m:>3} {construction_ef:>5} {search_ef:>5} {build_seconds:>8.2f} "
+                              f"{rss_delta:>8.1f} {disk:>8.1f} {result['p50_ms']:>7.2f} {result['p95_ms']:>7.2f} "
+                              f"{result['recall']:>9.4f}")
+                        if args.output:
+                            with open(args.output, "a") as f:
+                                f.write(json.dumps(result) + "\n")
+                finally:
+                    SharedSystemClient.clear_system_cache()
+                    shutil.rmtree(persist_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
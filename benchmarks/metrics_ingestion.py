@@ -0,0 +1,93 @@
+'''Compares one-metric-per-invocation ingestion with batched ingestion through
+metrics_lambda.handler against an in-process DynamoDB (moto).
+
+    python -m benchmarks.metrics_ingestion --metrics 100 1000 5000 --batch-size 25
+
+Reports Lambda invocations and DynamoDB write requests as well as wall time;
+moto has no network latency, so request counts are what carries over to AWS.'''
+
+import argparse
+import json
+import os
+import time
+import uuid
+from unittest.mock import patch
+
+import boto3
+from moto import mock_aws
+
+
+def make_metric(i):
+    return {
+        "run_id": str(uuid.uuid4()),
+        "tokens_used": 300 + i % 50,
+        "confidence_score": 0.9,
+        "response_time": 1.0 + (i % 10) / 10,
+        "file_id": f"file-{i % 20}",
+        "cache_hit": i % 4 == 0
+    }
+
+
+def count_requests(client, counter):
+    def on_call(event_name, **kwargs):
+        counter[event_name.split(".")[-1]] = counter.get(event_name.split(".")[-1], 0) + 1
+    client.meta.events.register("before-call.dynamodb", on_call)
+
+
+def run(metrics, batch_size, mode):
+    # mode: "single" (one event per metric) or "batch" ({"metrics": [...]} per batch_size metrics)
+    from metrics_lambda import handler
+
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name=os.getenv("REGION", "us-east-1"))
+        dynamodb.create_table(
+            TableName="LLM_Metrics",
+            KeySchema=[{"AttributeName": "run_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "run_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST"
+        )
+        dynamodb.create_table(
+            TableName="LLM_Metrics_Aggregates",
+            KeySchema=[{"AttributeName": "aggregate_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "aggregate_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST"
+        )
+        requests = {}
+        count_requests(dynamodb.meta.client, requests)
+        payloads = [make_metric(i) for i in range(metrics)]
+        if mode == "single":
+            events = [{"body": json.dumps(payload)} for payload in payloads]
+        else:
+            events = [
+                {"body": json.dumps({"metrics": payloads[i:i + batch_size]})}
+                for i in range(0, metrics, batch_size)
+            ]
+
+        with patch.object(handler, "dynamodb", dynamodb):
+            start = time.perf_counter()
+            for event in events:
+                response = handler.lambda_handler(event, None)
+                assert response["statusCode"] == 200, response
+            wall = time.perf_counter() - start
+
+        stored = dynamodb.Table("LLM_Metrics").scan(Select="COUNT")["Count"]
+        assert stored == metrics
+        return wall, len(events), requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--metrics", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--batch-size", type=int, default=25)
+    args = parser.parse_args()
+
+    print(f"{'metrics':>8} {'mode':>7} {'invocations':>12} {'PutItem':>8} {'BatchWriteItem':>15} {'wall s':>8}")
+    for metrics in args.metrics:
+        for mode in ("single", "batch"):
+            wall, invocations, requests = run(metrics, args.batch_size, mode)
+            print(f"{metrics:>8} {mode:>7} {invocations:>12} {requests.get('PutItem', 0):>8} "
+                  f"{requests.get('BatchWriteItem', 0):>15} {wall:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
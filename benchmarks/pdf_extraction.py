@@ -0,0 +1,64 @@
+'''Compares single-threaded PyMuPDFLoader extraction with the process-pool
+engine in pdf_services.processor on synthetic multi-hundred-page PDFs.
+
+    python -m benchmarks.pdf_extraction --pages 200 500 1000 --workers 4'''
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import fitz
+from langchain_community.document_loaders import PyMuPDFLoader
+
+from pdf_services.processor import extract_text_parallel, get_extract_workers
+
+LINE = "Torque the flange bolts in a star pattern to 45 Nm and re-check after the first run. "
+
+
+def make_pdf(path, pages):
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        text = f"Section {number}\n" + "\n".join(LINE for _ in range(60))
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), text, fontsize=7)
+    doc.save(path)
+    doc.close()
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 500, 1000])
+    parser.add_argument("--workers", type=int, default=get_extract_workers())
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_pdf_")
+    try:
+        # Warm the pool so process start-up is not billed to the first file
+        warm = os.path.join(workdir, "warm.pdf")
+        make_pdf(warm, 4)
+        extract_text_parallel(warm, args.workers)
+
+        print(f"{'pages':>6} {'loader s':>9} {'parallel s':>11} {'speedup':>8}")
+        for pages in args.pages:
+            path = os.path.join(workdir, f"{pages}.pdf")
+            make_pdf(path, pages)
+            serial_s, serial = timed(lambda p: PyMuPDFLoader(p).load(), path)
+            parallel_s, parallel = timed(extract_text_parallel, path, args.workers)
+
+            assert [d.metadata["page"] for d in parallel] == list(range(pages))
+            assert [d.page_content.strip() for d in parallel] == [d.page_content.strip() for d in serial]
+            print(f"{pages:>6} {serial_s:>9.2f} {parallel_s:>11.2f} {serial_s / parallel_s:>7.1f}x")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
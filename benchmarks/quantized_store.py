@@ -0,0 +1,117 @@
+'''Measures what rag_module.quantized_store saves and costs against float32 storage:
+memory held for search, disk, query latency and recall@k against exact search,
+for int8 and binary codes at several rescore factors.
+
+    python -m benchmarks.quantized_store --sizes 10000 100000 1000000 --rescore 2 10 40 --chroma
+
+Corpora are the clustered synthetic 384-d vectors of benchmarks.hnsw_recall. Binary
+codes keep only the sign of each dimension, so their recall depends on the embedding
+being centered; check it on real vectors too before using binary. --chroma adds a
+default Chroma collection (float32 + HNSW) for the disk and memory comparison.'''
+
+import argparse
+import json
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.hnsw_recall import synthetic_vectors, exact_neighbours, dir_mb, rss_mb, build
+from rag_module.quantized_store import QuantizedVectorStore, exact_distances
+
+
+def measure(search, queries, truth, k):
+    timings, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        rows = search(query)
+        timings.append((time.perf_counter() - start) * 1000)
+        hits += len(expected & set(rows))
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[max(int(len(timings) * 0.95) - 1, 0)], 3),
+        "recall": round(hits / (len(queries) * k), 4),
+    }
+
+
+def report(result, output):
+    print(f"{result['chunks']:>8} {result['store']:>8} {str(result.get('rescore', '')):>7} "
+          f"{result['memory_mb']:>10.1f} {result['disk_mb']:>8.1f} {result['p50_ms']:>7.2f} "
+          f"{result['p95_ms']:>7.2f} {result['recall']:>7.4f}")
+    if output:
+        with open(output, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--space", choices=["l2", "cosine", "ip"], default="l2")
+    parser.add_argument("--rescore", type=int, nargs="+", default=[2, 10, 40])
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--chroma", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centers = rng.normal(size=(100, args.dim)).astype(np.float32)
+    print(f"{'chunks':>8} {'store':>8} {'rescore':>7} {'memory MB':>10} {'disk MB':>8} {'p50 ms':>7} {'p95 ms':>7} {'recall':>7}")
+    for size in sorted(args.sizes):
+        corpus = synthetic_vectors(rng, size, args.dim, centers)
+        queries = synthetic_vectors(rng, args.queries, args.dim, centers)
+        truth = exact_neighbours(corpus, queries, args.k, args.space)
+        base = {"chunks": size, "dim": args.dim, "space": args.space, "k": args.k}
+
+        # float32 held in memory and searched exactly: the baseline the compact stores are measured against
+        norms = np.linalg.norm(corpus, axis=1)
+        report({
+            **base, "store": "float32", "memory_mb": corpus.nbytes / 2 ** 20, "disk_mb": corpus.nbytes / 2 ** 20,
+            **measure(lambda q: np.argsort(exact_distances(corpus, norms, q, args.space))[:args.k].tolist(),
+                      queries, truth, args.k)
+        }, args.output)
+
+        if args.chroma:
+            import chromadb
+            from chromadb.api.client import SharedSystemClient
+            directory = tempfile.mkdtemp(prefix="bench_chroma_")
+            try:
+                before = rss_mb()
+                collection = build(chromadb.PersistentClient(path=directory), corpus, args.space, 16, 100)
+                resident = rss_mb() - before
+                report({
+                    **base, "store": "chroma", "memory_mb": resident, "disk_mb": dir_mb(directory),
+                    **measure(lambda q: [int(i) for i in collection.query(
+                        query_embeddings=[q], n_results=args.k, include=[])["ids"][0]], queries, truth, args.k)
+                }, args.output)
+            finally:
+                SharedSystemClient.clear_system_cache()
+                shutil.rmtree(directory, ignore_errors=True)
+
+        for quantization in ("int8", "binary"):
+            directory = tempfile.mkdtemp(prefix="bench_quantized_")
+            try:
+                store = QuantizedVectorStore(directory, None, quantization=quantization, space=args.space)
+                for start in range(0, size, 10000):
+                    end = min(start + 10000, size)
+                    store.add_vectors(corpus[start:end], [""] * (end - start), ids=[str(i) for i in range(start, end)])
+                stats = store.stats()
+                for factor in args.rescore:
+                    store.rescore_factor = factor
+                    report({
+                        **base, "store": quantization, "rescore": factor,
+                        "memory_mb": stats["memory_bytes"] / 2 ** 20, "disk_mb": stats["disk_bytes"] / 2 ** 20,
+                        **measure(lambda q: [row for row, _ in store.search_by_vector(q, args.k)], queries, truth, args.k)
+                    }, args.output)
+                store.close()
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+'''Load test for /query on a single in-process worker.
+
+Replaces the RAG chain with one that blocks for --llm-delay seconds (standing in
+for the embedding + Chroma + Gemini round trip) and fires --concurrency requests
+at once, reporting throughput and latency. With the blocking work on the bounded
+query pool, wall time stays close to one round trip instead of N of them.
+
+    python -m benchmarks.query_load --concurrency 1 10 50 --llm-delay 0.5'''
+
+import argparse
+import asyncio
+import statistics
+import time
+from unittest.mock import MagicMock, patch
+
+import httpx
+
+from rag_module import main
+
+
+class SlowChain:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def invoke(self, question):
+        time.sleep(self.delay)
+        return {"answer": f"answer to {question}", "packing": None, "confidence": 0.0, "usage": None}
+
+
+async def fire(concurrency):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i):
+            start = time.perf_counter()
+            response = await client.post("/query", json={"query": f"question {i}"})
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one(i) for i in range(concurrency)))
+        return time.perf_counter() - start, latencies
+
+
+def run(concurrency, delay):
+    # No rate limit, no answer cache hits and no AWS calls: measure the query path only
+    no_cache = MagicMock()
+    no_cache.get.return_value = None
+    with patch.object(main.limiter, "enabled", False), \
+            patch.object(main, "get_chain", return_value=SlowChain(delay)), \
+            patch.object(main, "get_answer_cache", return_value=no_cache), \
+            patch.object(main, "record_side_effects"):
+        return asyncio.run(fire(concurrency))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 25, 50])
+    parser.add_argument("--llm-delay", type=float, default=0.5)
+    args = parser.parse_args()
+
+    print(f"{'in-flight':>9} {'wall s':>8} {'req/s':>8} {'p50 s':>7} {'max s':>7}")
+    for concurrency in args.concurrency:
+        wall, latencies = run(concurrency, args.llm_delay)
+        print(f"{concurrency:>9} {wall:>8.2f} {concurrency / wall:>8.1f} "
+              f"{statistics.median(latencies):>7.2f} {max(latencies):>7.2f}")
+
+
+if __name__ == "__main__":
+    main_cli()
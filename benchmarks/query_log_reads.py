@@ -0,0 +1,125 @@
+'''Compares the old scan-based query-log reads with the GSI Query reads in
+metrics_lambda.query_log_api as QueryLog grows, against an in-process DynamoDB (moto).
+
+    python -m benchmarks.query_log_reads --sizes 1000 5000 20000 --files 50
+
+Reports items DynamoDB examined per request (ScannedCount) and latency.
+moto answers a Query by walking its in-memory table, so its latencies grow
+for every access path; the examined-item counts (what DynamoDB bills and
+what drives its latency) are what carries over to AWS. The scan also stops
+at the first 1 MB page, which is why its count plateaus.'''
+
+import argparse
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import boto3
+from moto import mock_aws
+
+from aws_service.query_log_handler import build_log_item
+
+
+def create_query_log_table(dynamodb):
+    # Same key schema and indexes as scripts/setup_localstack.py
+    return dynamodb.create_table(
+        TableName="QueryLog",
+        KeySchema=[{"AttributeName": "run_id", "KeyType": "HASH"}],
+        AttributeDefinitions=[
+            {"AttributeName": "run_id", "AttributeType": "S"},
+            {"AttributeName": "file_id", "AttributeType": "S"},
+            {"AttributeName": "time_bucket", "AttributeType": "S"},
+            {"AttributeName": "timestamp", "AttributeType": "S"}
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": "file_id-timestamp-index",
+                "KeySchema": [
+                    {"AttributeName": "file_id", "KeyType": "HASH"},
+                    {"AttributeName": "timestamp", "KeyType": "RANGE"}
+                ],
+                "Projection": {"ProjectionType": "ALL"}
+            },
+            {
+                "IndexName": "time_bucket-timestamp-index",
+                "KeySchema": [
+                    {"AttributeName": "time_bucket", "KeyType": "HASH"},
+                    {"AttributeName": "timestamp", "KeyType": "RANGE"}
+                ],
+                "Projection": {"ProjectionType": "ALL"}
+            }
+        ],
+        BillingMode="PAY_PER_REQUEST"
+    )
+
+
+def fill(table, start, end, files, now):
+    # Logs spread over the last 7 days and `files` files
+    with table.batch_writer() as batch:
+        for i in range(start, end):
+            timestamp = (now - timedelta(minutes=(i * 7) % (7 * 24 * 60))).isoformat()
+            batch.put_item(Item=build_log_item(
+                str(uuid.uuid4()), f"question {i}", "answer " * 40, 0.9,
+                file_id=f"file-{i % files}", timestamp=timestamp
+            ))
+
+
+def timed(func, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    from metrics_lambda import query_log_api
+
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name=os.getenv("REGION", "us-east-1"))
+        table = create_query_log_table(dynamodb)
+        now = datetime.utcnow()
+        target = "file-7"
+
+        def scan_by_file():
+            # Old /query-log/{file_id}: every item is read and filtered
+            response = table.scan(FilterExpression="file_id = :fid", ExpressionAttributeValues={":fid": target})
+            return response["ScannedCount"]
+
+        def query_by_file():
+            response = table.query(
+                IndexName=query_log_api.FILE_INDEX,
+                KeyConditionExpression="file_id = :fid",
+                ExpressionAttributeValues={":fid": target},
+                ScanIndexForward=False,
+                Limit=args.limit
+            )
+            return response["ScannedCount"]
+
+        def recent():
+            with patch.object(query_log_api, "dynamodb", dynamodb):
+                return len(query_log_api.get_query_logs(limit=args.limit, cursor=None)["items"])
+
+        print(f"{'logs':>7} {'scan+filter ms':>15} {'examined':>9} {'file GSI ms':>12} {'examined':>9} {'recent GSI ms':>14}")
+        filled = 0
+        for size in sorted(args.sizes):
+            fill(table, filled, size, args.files, now)
+            filled = size
+            scan_ms, scanned = timed(scan_by_file)
+            query_ms, queried = timed(query_by_file)
+            recent_ms, _ = timed(recent)
+            print(f"{size:>7} {scan_ms:>15.1f} {scanned:>9} {query_ms:>12.1f} {queried:>9} {recent_ms:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+'''Measures /query retrieval latency as the corpus grows, comparing a
+whole-corpus search, a metadata-filtered search on the corpus collection,
+and the per-file collections used by rag_module.retrieval.ScopedRetriever.
+
+    python -m benchmarks.scoped_retrieval --sizes 100 500 1000 2000 --chunks-per-file 20
+
+Uses deterministic fake embeddings so it measures the vector store, not the model.'''
+
+import argparse
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_community.vectorstores import Chroma
+
+from rag_module.retrieval import ScopedRetriever, file_collection_name
+
+
+def build_corpus(vectorstore, get_store, start_file, end_file, chunks_per_file):
+    # Mirrors index_document: chunks go to the corpus collection and to their file's collection
+    docs = []
+    for f in range(start_file, end_file):
+        file_docs = [
+            Document(
+                page_content=f"file {f} chunk {c} " + " ".join(random.choices(WORDS, k=40)),
+                metadata={"file_id": f"file-{f}", "page": c}
+            )
+            for c in range(chunks_per_file)
+        ]
+        get_store(f"file-{f}").add_documents(file_docs)
+        docs.extend(file_docs)
+    for i in range(0, len(docs), 5000):
+        vectorstore.add_documents(docs[i:i + 5000])
+
+
+def time_queries(retriever, queries):
+    timings = []
+    for q in queries:
+        start = time.perf_counter()
+        retriever.invoke(q)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), sorted(timings)[int(len(timings) * 0.95) - 1]
+
+
+WORDS = "apple orchard revenue contract clause footer warranty policy engine manual safety torque".split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000, 2000])
+    parser.add_argument("--chunks-per-file", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    random.seed(0)
+    persist_dir = tempfile.mkdtemp(prefix="bench_chroma_")
+    try:
+        embedding = DeterministicFakeEmbedding(size=384)
+        vectorstore = Chroma(
+            collection_name="bench",
+            embedding_function=embedding,
+            persist_directory=persist_dir
+        )
+        stores = {}
+
+        def get_store(file_id):
+            if file_id not in stores:
+                stores[file_id] = Chroma(
+                    client=vectorstore._client,
+                    collection_name=file_collection_name(file_id),
+                    embedding_function=embedding
+                )
+            return stores[file_id]
+
+        queries = [" ".join(random.choices(WORDS, k=8)) for _ in range(args.queries)]
+
+        print(f"{'pdfs':>6} {'chunks':>8} {'corpus p50/p95 ms':>18} {'filter p50/p95 ms':>18} {'per-file p50/p95 ms':>20}")
+        indexed = 0
+        for size in sorted(args.sizes):
+            build_corpus(vectorstore, get_store, indexed, size, args.chunks_per_file)
+            indexed = size
+
+            target = f"file-{size // 2}"
+            retrievers = [
+                vectorstore.as_retriever(),
+                vectorstore.as_retriever(search_kwargs={"filter": {"file_id": target}}),
+                ScopedRetriever(file_ids=(target,), get_store=get_store, embedding=embedding),
+            ]
+            cells = ["%.2f / %.2f" % time_queries(r, queries) for r in retrievers]
+            print(f"{size:>6} {size * args.chunks_per_file:>8} {cells[0]:>18} {cells[1]:>18} {cells[2]:>20}")
+    finally:
+        shutil.rmtree(persist_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
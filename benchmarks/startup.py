@@ -0,0 +1,107 @@
+'''Measures rag_module cold start: import time of rag_module.main in a fresh
+interpreter, and time until a uvicorn worker reports ready on GET /ready.
+
+    python -m benchmarks.startup --runs 3 --output startup.jsonl
+
+Each run starts a new process, so OS file caches are warm after the first one.
+With --output the results are appended as one JSON line tagged with the
+current git revision, to track cold-start time per release.'''
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import rag_module.main; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def import_time():
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_to_ready(timeout):
+    # Seconds from spawning uvicorn until /ready answers 200; None if it never does
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "rag_module.main:app", "--port", str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    listening = None
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=1) as response:
+                    if response.status == 200:
+                        return listening, time.perf_counter() - start
+            except urllib.error.HTTPError as e:
+                # 503: accepting requests, still warming up
+                if listening is None and e.code == 503:
+                    listening = time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                pass
+            if server.poll() is not None:
+                break
+            time.sleep(0.05)
+        return listening, None
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def revision():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--import-only", action="store_true")
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    imports = [import_time() for _ in range(args.runs)]
+    result = {
+        "revision": revision(),
+        "measured_at": datetime.utcnow().isoformat(),
+        "import_seconds": round(statistics.median(imports), 3),
+    }
+    if not args.import_only:
+        runs = [time_to_ready(args.timeout) for _ in range(args.runs)]
+        listening = [r[0] for r in runs if r[0] is not None]
+        ready = [r[1] for r in runs if r[1] is not None]
+        result["listening_seconds"] = round(statistics.median(listening), 3) if listening else None
+        result["ready_seconds"] = round(statistics.median(ready), 3) if ready else None
+
+    print(json.dumps(result))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
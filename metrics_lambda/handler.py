@@ -1,6 +1,7 @@
 '''AWS Lambda handler to receive and store LLM query metrics
 into the LLM_Metrics DynamoDB table. Expects a JSON payload
-with keys like run_id, tokens_used, confidence_score'''
+with keys like run_id, tokens_used, confidence_score, a list of
+them / {"metrics": [...]}, or an SQS batch of such messages'''
 
 import boto3
 import os
@@ -9,33 +10,69 @@ from decimal import Decimal
 from dotenv import load_dotenv
 import botocore.exceptions
 from aws_service.aws_client import get_resource
+from aws_service.metrics_store import unpack_metrics, ingest_metrics
+from aws_service.metrics_aggregates import AGGREGATES_TABLE
 
 load_dotenv()
 dynamodb = get_resource("dynamodb")
 
 
+def _parse(body):
+    if isinstance(body, (str, bytes)):
+        body = json.loads(body)
+    return body
+
+
+def _sqs_handler(table, aggregates_table, records):
+    # One SQS message may hold one metric or a batch. Only messages with a failed DynamoDB write are
+    # reported back (ReportBatchItemFailures) for redelivery; malformed or invalid records would fail
+    # the same way on every retry, so they are logged and dropped
+    metrics, owners, failures = [], [], []
+    for record in records:
+        try:
+            batch = unpack_metrics(_parse(record["body"]))
+        except Exception as e:
+            print(f"❌ Dropping unreadable metrics message {record['messageId']}: {e}")
+            continue
+        metrics.extend(batch)
+        owners.extend([record["messageId"]] * len(batch))
+    stored, failed = ingest_metrics(metrics, table, aggregates_table)
+    for failure in failed:
+        message_id = owners[failure["index"]]
+        if not failure["retryable"]:
+            print(f"❌ Dropping invalid metric {failure['run_id']} from message {message_id}: {failure['error']}")
+        elif message_id not in failures:
+            failures.append(message_id)
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failures]}
+
+
 def lambda_handler(event, context):
-    # stores the extracted metric into DynamoDB table
+    # stores the extracted metrics into DynamoDB table
     try:
         table = dynamodb.Table("LLM_Metrics")
+        aggregates_table = dynamodb.Table(AGGREGATES_TABLE)
+        if "Records" in event:
+            return _sqs_handler(table, aggregates_table, event["Records"])
 
-        # Parse input from API Gateway or Lambda test event
-        body = event.get("body")
-        if isinstance(body, str):
-            body = json.loads(body)
-
-        item = {
-            "run_id": body["run_id"],
-            "tokens_used": body["tokens_used"],
-            "confidence_score": Decimal(str(body["confidence_score"])),
-            "response_time": Decimal(str(body["response_time"])),
-            "file_id": body.get("file_id", "unknown")
-        }
+        # Parse input from API Gateway, a direct invoke or a Lambda test event
+        body = _parse(event["body"]) if "body" in event else event
+        single = isinstance(body, dict) and "metrics" not in body
+        stored, failed = ingest_metrics(unpack_metrics(body), table, aggregates_table)
 
-        table.put_item(Item=item)
+        if single and not failed:
+            return {
+                "statusCode": 200,
+                "body": json.dumps({"status": "Metric stored."})
+            }
+        if stored == 0:
+            return {
+                "statusCode": 500 if single else 400,
+                "body": json.dumps({"error": failed[0]["error"] if single else "No metrics stored.",
+                                    "failed": failed})
+            }
         return {
-            "statusCode": 200,
-            "body": json.dumps({"status": "Metric stored."})
+            "statusCode": 200 if not failed else 207,
+            "body": json.dumps({"status": "Metrics stored.", "stored": stored, "failed": failed})
         }
 
     except botocore.exceptions.ClientError as e:
@@ -1,12 +1,16 @@
 # Exposes a FastAPI endpoint to summarize stored metrics(Total queries,Average response time,Average tokens used)
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from dotenv import load_dotenv
 import boto3
 from decimal import Decimal
 from boto3.dynamodb.conditions import Key
 import os
+from typing import Optional
 from aws_service.aws_client import get_resource
+from aws_service.metrics_aggregates import (
+    AGGREGATES_TABLE, ALL_KEY, MAX_WINDOW_HOURS, file_key, day_key, summarize, read_percentiles
+)
 
 load_dotenv()
 
@@ -16,14 +20,17 @@ app = FastAPI()
 dynamodb = get_resource("dynamodb")
 
 @app.get("/metrics/summary")
-def get_metrics_summary():
-    # Returns summary statistics from LLM_Metrics DynamoDB table
+def get_metrics_summary(file_id: Optional[str] = None, day: Optional[str] = None):
+    # Returns summary statistics from the running aggregates kept by the metrics handler:
+    # one GetItem, whatever the size of LLM_Metrics. Optionally for one file_id or one day (YYYY-MM-DD)
+    if file_id and day:
+        raise HTTPException(status_code=400, detail="Pass either file_id or day, not both.")
     try:
-        table = dynamodb.Table("LLM_Metrics")
-        response = table.scan()
+        table = dynamodb.Table(AGGREGATES_TABLE)
+        key = file_key(file_id) if file_id else day_key(day) if day else ALL_KEY
+        aggregate = table.get_item(Key={"aggregate_id": key}).get("Item")
 
-        items = response.get("Items", [])
-        if not items:
+        if not aggregate:
             return {
                 "total_queries": 0,
                 "avg_response_time": 0,
@@ -31,18 +38,18 @@ def get_metrics_summary():
                 "notes": "No metrics available yet"
             }
 
-        total_queries = len(items)
-        total_tokens = sum(int(item.get("tokens_used", 0)) for item in items)
-        total_response_time = sum(float(item.get("response_time", 0)) for item in items)
+        return summarize(aggregate)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        avg_tokens = round(total_tokens / total_queries, 2)
-        avg_latency = round(total_response_time / total_queries, 2)
 
-        return {
-            "total_queries": total_queries,
-            "avg_response_time": avg_latency,
-            "avg_tokens_used": avg_tokens
-        }
 
+@app.get("/metrics/percentiles")
+def get_metrics_percentiles(hours: int = Query(24, ge=1, le=MAX_WINDOW_HOURS), file_id: Optional[str] = None):
+    # p50/p95/p99 of response_time and tokens_used over the last `hours` hours, overall or for one file_id,
+    # merged from the hourly sketches kept by the metrics handler
+    try:
+        return read_percentiles(dynamodb.Table(AGGREGATES_TABLE), hours, file_id)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,15 +1,27 @@
 '''Provides APIs to:
     - Fetch latest query logs
     - Filter logs by file_id
-    - Export logs in JSON or CSV'''
+    - Export logs as a streamed CSV, NDJSON or JSON download
+
+Listing reads go through QueryLog's GSIs (newest first, cursor-paginated),
+so their cost depends on the page size, not on the size of the table.'''
 
 from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from boto3.dynamodb.conditions import Key, Attr
+from datetime import datetime, date, timedelta
+from typing import Optional
+from decimal import Decimal
+import base64
 import boto3
 import os
 import csv
 import io
+import itertools
 import json
+import queue
+import threading
+import zlib
 from dotenv import load_dotenv
 from aws_service.aws_client import get_resource
 
@@ -19,55 +31,301 @@ app = FastAPI()
 
 dynamodb = get_resource("dynamodb")
 
-@app.get("/query-log")
-def get_query_logs(limit: int = 10):
-    # Returns up to `limit` recent query logs.
+FILE_INDEX = "file_id-timestamp-index"
+RECENT_INDEX = "time_bucket-timestamp-index"
+
+
+def get_lookback_days():
+    # How many consecutive empty days /query-log walks back before it stops looking for older logs
+    return int(os.getenv("QUERY_LOG_LOOKBACK_DAYS", "30"))
+
+
+def encode_cursor(state):
+    if not state:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(state, sort_keys=True).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
     try:
-        table = dynamodb.Table("QueryLog")
-        response = table.scan(Limit=limit)
-        return response.get("Items", [])
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if not isinstance(state, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return state
+
+
+def check_start_key(key, attributes, **expected):
+    # A LastEvaluatedKey we handed out: string attributes of the index, pinned to the partition being read.
+    # Anything else would reach DynamoDB as a malformed ExclusiveStartKey and fail with a 500
+    if key is None:
+        return None
+    valid = (
+        isinstance(key, dict) and set(key) == set(attributes)
+        and all(isinstance(value, str) for value in key.values())
+        and all(key[name] == value for name, value in expected.items())
+    )
+    if not valid:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return key
+
+
+def recent_logs(table, limit, cursor=None, today=None):
+    # Walks the daily time buckets newest first, reading at most `limit` items per request. Gaps in
+    # traffic are skipped; the walk ends after QUERY_LOG_LOOKBACK_DAYS empty buckets in a row
+    today = today or datetime.utcnow().date()
+    state = decode_cursor(cursor) if cursor else {"bucket": today.isoformat(), "key": None, "empty": 0}
+    try:
+        day = date.fromisoformat(state["bucket"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    empty = state.get("empty", 0)
+    if not isinstance(empty, int) or isinstance(empty, bool) or empty < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    start_key = check_start_key(state.get("key"), ("run_id", "time_bucket", "timestamp"),
+                                time_bucket=day.isoformat())
+    lookback = get_lookback_days()
+
+    items = []
+    # A bucket resumed from a cursor already had items
+    found = start_key is not None
+    while len(items) < limit and empty < lookback:
+        kwargs = {
+            "IndexName": RECENT_INDEX,
+            "KeyConditionExpression": Key("time_bucket").eq(day.isoformat()),
+            "ScanIndexForward": False,
+            "Limit": limit - len(items)
+        }
+        if start_key:
+            kwargs["ExclusiveStartKey"] = start_key
+        response = table.query(**kwargs)
+        page = response.get("Items", [])
+        items.extend(page)
+        found = found or bool(page)
+        start_key = response.get("LastEvaluatedKey")
+        if not start_key:
+            empty = 0 if found else empty + 1
+            found = False
+            day -= timedelta(days=1)
+
+    more = start_key is not None or empty < lookback
+    next_cursor = encode_cursor({"bucket": day.isoformat(), "key": start_key, "empty": empty}) if more else None
+    return items, next_cursor
+
+
+EXPORT_FIELDS = ["run_id", "timestamp", "file_id", "query_text", "response_text",
+                 "confidence_score", "tokens_used", "cache_hit", "time_bucket"]
+
+
+def get_export_segments():
+    # Parallel Scan segments (one thread each) when exporting the whole table
+    return int(os.getenv("QUERY_LOG_EXPORT_SEGMENTS", "4"))
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return str(value)
+
+
+def _time_range(since, until):
+    # ISO timestamps sort as strings; "~" sorts after every timestamp that starts with `until`,
+    # so a bare `until` date includes that whole day
+    return since or "", (until or "") + "~"
+
+
+def export_pages(table, file_id=None, since=None, until=None, segments=None, stop=None):
+    # Yields pages of matching logs. One file: Query on its index. Whole table: parallel segment Scans,
+    # each thread feeding a bounded queue, so memory stays at a few pages whatever the table size
+    low, high = _time_range(since, until)
+    stop = stop or threading.Event()
+    if file_id:
+        kwargs = {
+            "IndexName": FILE_INDEX,
+            "KeyConditionExpression": Key("file_id").eq(file_id) & Key("timestamp").between(low, high)
+        }
+        while not stop.is_set():
+            response = table.query(**kwargs)
+            yield response.get("Items", [])
+            if "LastEvaluatedKey" not in response:
+                return
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        return
+
+    segments = segments or get_export_segments()
+    pages = queue.Queue(maxsize=segments * 2)
+    done = object()
+
+    def put(page):
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def scan_segment(segment):
+        try:
+            kwargs = {"Segment": segment, "TotalSegments": segments}
+            if since or until:
+                kwargs["FilterExpression"] = Attr("timestamp").between(low, high)
+            while not stop.is_set():
+                response = table.scan(**kwargs)
+                if response.get("Items") and not put(response["Items"]):
+                    return
+                if "LastEvaluatedKey" not in response:
+                    return
+                kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    workers = [threading.Thread(target=scan_segment, args=(i,), daemon=True) for i in range(segments)]
+    for worker in workers:
+        worker.start()
+    try:
+        finished = 0
+        while finished < segments:
+            page = pages.get()
+            if page is done:
+                finished += 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield page
+    finally:
+        # Client went away or a segment failed: let the other scans exit
+        stop.set()
+
+
+def serialize(pages, format):
+    # Turns pages of items into text chunks, one chunk per page
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        yield buffer.getvalue()
+        for page in pages:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(page)
+            yield buffer.getvalue()
+    elif format == "ndjson":
+        for page in pages:
+            yield "".join(json.dumps(item, default=_json_default) + "\n" for item in page)
+    else:
+        yield "["
+        first = True
+        for page in pages:
+            if not page:
+                continue
+            yield ("" if first else ",") + ",".join(json.dumps(item, default=_json_default) for item in page)
+            first = False
+        yield "]"
+
+
+def prefetched(pages):
+    # Reads the first page now, so a missing table or a failed scan is raised before the 200 goes out
+    first = next(pages, None)
+    return pages if first is None else itertools.chain([first], pages)
+
+
+def error_marker(error, format):
+    # Last line of an export that failed after streaming began; the connection is then dropped too,
+    # so neither a reader of the body nor the HTTP client takes the partial file for a complete one
+    message = f"Export failed: {error}"
+    if format == "csv":
+        return f"\nERROR: {message}\n"
+    return "\n" + json.dumps({"error": message}) + "\n"
+
+
+def with_error_marker(chunks, format):
+    try:
+        yield from chunks
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        print(f"❌ Query log export failed mid-stream: {e}")
+        yield error_marker(e, format)
+        raise
 
-@app.get("/query-log/{file_id}")
-def get_logs_for_file(file_id: str):
-    # Returns all query logs related to a specific file_id.
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# Declared before /query-log/{file_id}, which would otherwise match "export" as a file_id
+@app.get("/query-log/export")
+def export_logs(
+    format: str = Query(default="json", enum=["json", "ndjson", "csv"]),
+    gzip: bool = False,
+    file_id: Optional[str] = None,
+    since: Optional[str] = Query(default=None, description="ISO date or datetime, inclusive"),
+    until: Optional[str] = Query(default=None, description="ISO date or datetime, inclusive")
+):
+    # Streams all matching logs; rows are written as they are read, never collected in memory
+    for value in (since, until):
+        if value:
+            try:
+                datetime.fromisoformat(value)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid date: {value}")
     try:
         table = dynamodb.Table("QueryLog")
-        response = table.scan(
-            FilterExpression="file_id = :fid",
-            ExpressionAttributeValues={":fid": file_id}
+        pages = prefetched(export_pages(table, file_id, since, until))
+        chunks = with_error_marker(serialize(pages, format), format)
+        media_type = {"json": "application/json", "ndjson": "application/x-ndjson", "csv": "text/csv"}[format]
+        filename = f"query_log.{format}"
+        if gzip:
+            return StreamingResponse(
+                gzipped(chunks),
+                media_type="application/gzip",
+                headers={"Content-Disposition": f"attachment; filename={filename}.gz"}
+            )
+        return StreamingResponse(
+            (chunk.encode("utf-8") for chunk in chunks),
+            media_type=media_type,
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
-        return response.get("Items", [])
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
 
-@app.get("/query-log/export")
-def export_logs(format: str = Query(default="json", enum=["json", "csv"])):
-    # Exports all logs in JSON or CSV format
+
+@app.get("/query-log")
+def get_query_logs(limit: int = Query(10, ge=1, le=100), cursor: Optional[str] = None):
+    # Returns up to `limit` query logs, newest first; pass next_cursor for the next page.
     try:
         table = dynamodb.Table("QueryLog")
-        response = table.scan()
-        logs = response.get("Items", [])
-
-        if not logs:
-            raise HTTPException(status_code=404, detail="No logs found")
-
-        if format == "json":
-            return JSONResponse(content=logs)
-
-        elif format == "csv":
-            # Convert to CSV string
-            output = io.StringIO()
-            writer = csv.DictWriter(output, fieldnames=logs[0].keys())
-            writer.writeheader()
-            writer.writerows(logs)
-
-            return Response(
-                content=output.getvalue(),
-                media_type="text/csv",
-                headers={"Content-Disposition": "attachment; filename=query_log.csv"}
-            )
+        items, next_cursor = recent_logs(table, limit, cursor)
+        return {"items": items, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/query-log/{file_id}")
+def get_logs_for_file(file_id: str, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
+    # Returns query logs related to a specific file_id, newest first, a page at a time.
+    try:
+        table = dynamodb.Table("QueryLog")
+        kwargs = {
+            "IndexName": FILE_INDEX,
+            "KeyConditionExpression": Key("file_id").eq(file_id),
+            "ScanIndexForward": False,
+            "Limit": limit
+        }
+        if cursor:
+            kwargs["ExclusiveStartKey"] = check_start_key(decode_cursor(cursor), ("run_id", "file_id", "timestamp"),
+                                                          file_id=file_id)
+        response = table.query(**kwargs)
+        return {"items": response.get("Items", []), "next_cursor": encode_cursor(response.get("LastEvaluatedKey"))}
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,194 @@
+# Background ingestion: /upload stores the PDF and hands it to a bounded worker pool,
+# which runs S3 upload, text extraction and embedding/indexing and records each stage.
+# The S3 transfer overlaps with extraction + indexing; a failure in either rolls both back.
+
+import contextvars
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from pdf_services.processor import extract_text
+from aws_service.s3_handler import upload_to_s3, delete_from_s3
+from aws_service.dynamo_handler import save_metadata, update_status
+from rag_module.indexing import index_document, delete_document
+from rag_module.tracing import tracer
+
+QUEUED = "queued"
+EXTRACTING = "extracting"
+EMBEDDING = "embedding"
+INDEXED = "indexed"
+FAILED = "failed"
+
+
+MAX_TRACKED_JOBS = 10000
+
+
+def get_ingest_workers():
+    return int(os.getenv("INGEST_WORKERS", "4"))
+
+
+def get_pending_upload_timeout():
+    # Seconds an unfinished upload without a job in this process is still trusted as a duplicate
+    return int(os.getenv("PENDING_UPLOAD_TIMEOUT_SECONDS", "1800"))
+
+
+class IngestionJobs:
+    # Tracks jobs in memory for fast polling and mirrors each stage to PDF_Metadata,
+    # so the status survives restarts and is visible from every API worker.
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or get_ingest_workers()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingest")
+        # One S3 transfer per running job, alongside its extraction/indexing
+        self._transfer_executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="s3")
+        self._jobs = {}
+        self._by_hash = {}
+        self._lock = threading.Lock()
+
+    def submit(self, file_id, filename, file_path, content_hash=None):
+        _, future = self.submit_unless_running(file_id, filename, file_path, content_hash=content_hash, check=False)
+        return future
+
+    def submit_unless_running(self, file_id, filename, file_path, content_hash=None, check=True):
+        # Checks for a live job with the same bytes and registers this one under the same lock, so two
+        # identical uploads arriving together are indexed once. Returns (existing job, None) or (None, future)
+        now = datetime.utcnow().isoformat()
+        with self._lock:
+            if check and content_hash:
+                existing = self._active_by_hash(content_hash)
+                if existing is not None:
+                    return existing, None
+            self._jobs[file_id] = {
+                "file_id": file_id,
+                "filename": filename,
+                "status": QUEUED,
+                "stages": {QUEUED: now},
+                "error": None,
+                "content_hash": content_hash,
+                "timings": {}
+            }
+            if content_hash:
+                self._by_hash[content_hash] = file_id
+            # Forget the oldest finished jobs; their status remains in DynamoDB
+            if len(self._jobs) > MAX_TRACKED_JOBS:
+                for old_id in list(self._jobs):
+                    if len(self._jobs) <= MAX_TRACKED_JOBS:
+                        break
+                    if self._jobs[old_id]["status"] in (INDEXED, FAILED):
+                        old = self._jobs.pop(old_id)
+                        if self._by_hash.get(old["content_hash"]) == old_id:
+                            del self._by_hash[old["content_hash"]]
+        try:
+            save_metadata(file_id=file_id, filename=filename, status=QUEUED, content_hash=content_hash)
+        except Exception:
+            # The job will never run: forget it, or identical uploads would be answered with it
+            with self._lock:
+                self._jobs.pop(file_id, None)
+                if self._by_hash.get(content_hash) == file_id:
+                    del self._by_hash[content_hash]
+            raise
+        # The job's spans join the /upload trace that submitted it
+        return None, self._executor.submit(contextvars.copy_context().run, self._run, file_id, file_path)
+
+    def _set_stage(self, file_id, stage, error=None, timings=None):
+        with self._lock:
+            job = self._jobs.get(file_id)
+            if job is not None:
+                job["status"] = stage
+                job["stages"][stage] = datetime.utcnow().isoformat()
+                job["error"] = error
+                if timings:
+                    job["timings"] = dict(timings)
+        try:
+            update_status(file_id, stage, error=error, timings=timings)
+        except Exception:
+            # The in-memory status is still correct; don't fail the job over bookkeeping
+            traceback.print_exc()
+
+    @staticmethod
+    def _timed(timings, name, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        finally:
+            timings[name] = round(time.perf_counter() - start, 4)
+
+    def _run(self, file_id, file_path):
+        with tracer.span("ingest"):
+            self._ingest(file_id, file_path)
+
+    def _ingest(self, file_id, file_path):
+        timings = {}
+        start = time.perf_counter()
+        s3_key = os.path.basename(file_path)
+        s3_upload = self._transfer_executor.submit(
+            contextvars.copy_context().run, self._timed, timings, "s3_upload", upload_to_s3, file_path, s3_key
+        )
+        index_started = False
+        try:
+            self._set_stage(file_id, EXTRACTING)
+            docs = self._timed(timings, "extract", extract_text, file_path)
+
+            # A failed S3 upload fails the job anyway: stop before the expensive embedding
+            self._check_transfer(s3_upload)
+            self._set_stage(file_id, EMBEDDING)
+            index_started = True
+            self._timed(timings, "index", index_document, docs, file_id=file_id)
+
+            s3_upload.result()
+            timings["total"] = round(time.perf_counter() - start, 4)
+            # Whichever branch finished last decided the job's latency
+            processing = timings["extract"] + timings["index"]
+            timings["critical_path"] = "s3_upload" if timings["s3_upload"] > processing else "extract+index"
+            self._set_stage(file_id, INDEXED, timings=timings)
+        except Exception as e:
+            traceback.print_exc()
+            self._rollback(file_id, s3_key, s3_upload, index_started)
+            timings["total"] = round(time.perf_counter() - start, 4)
+            self._set_stage(file_id, FAILED, error=str(e), timings=timings)
+
+    @staticmethod
+    def _check_transfer(s3_upload):
+        if s3_upload.done() and s3_upload.exception() is not None:
+            raise s3_upload.exception()
+
+    def _rollback(self, file_id, s3_key, s3_upload, index_started):
+        # Undo whatever half of the pipeline did succeed, so a failed file leaves nothing behind
+        if s3_upload.exception() is None:
+            try:
+                delete_from_s3(s3_key)
+            except Exception:
+                traceback.print_exc()
+        if index_started:
+            try:
+                delete_document(file_id)
+            except Exception:
+                traceback.print_exc()
+
+    def get(self, file_id):
+        with self._lock:
+            job = self._jobs.get(file_id)
+            return None if job is None else {**job, "stages": dict(job["stages"]), "timings": dict(job["timings"])}
+
+    def find_by_hash(self, content_hash):
+        # Upload of the same bytes handled by this worker that has not failed
+        with self._lock:
+            return self._active_by_hash(content_hash)
+
+    def _active_by_hash(self, content_hash):
+        file_id = self._by_hash.get(content_hash)
+        job = self._jobs.get(file_id)
+        if job is None or job["status"] == FAILED:
+            return None
+        return {**job, "stages": dict(job["stages"]), "timings": dict(job["timings"])}
+
+    def pending(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job["status"] not in (INDEXED, FAILED))
+
+
+jobs = IngestionJobs()
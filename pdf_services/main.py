@@ -1,13 +1,16 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request
-import uuid, os, shutil, traceback
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query
+import uuid, os, traceback, hashlib
+from typing import Optional
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-import fitz
+from fastapi.concurrency import run_in_threadpool
 
-from pdf_services.processor import extract_text
-from aws_service.s3_handler import upload_to_s3
-from aws_service.dynamo_handler import save_metadata, get_metadata, list_metadata
-from rag_module.indexing import index_document
+from aws_service.dynamo_handler import get_metadata, list_metadata_page, count_files, find_by_content_hash
+from pdf_services.jobs import jobs, get_pending_upload_timeout
+from pdf_services.processor import is_encrypted
+from aws_service.aws_client import client_stats
+from rag_module.tracing import tracer
 
 # Rate limiter
 from slowapi import Limiter
@@ -16,9 +19,16 @@ from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 
 
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Spans of the last uploads still queued for export
+    tracer.flush()
+
+
 # Set up app + limiter
 limiter = Limiter(key_func=get_remote_address)
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.state.limiter = limiter
 app.add_middleware(SlowAPIMiddleware)
 
@@ -38,8 +48,30 @@ async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
 
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def find_duplicate(content_hash):
+    # An upload with the same bytes that is indexed, or still being indexed by a live job here.
+    # Unfinished uploads from elsewhere are trusted only for a while: their job may be gone
+    job = jobs.find_by_hash(content_hash)
+    if job:
+        return job
+    try:
+        return find_by_content_hash(content_hash, max_pending_age=get_pending_upload_timeout())
+    except Exception:
+        # Without the lookup we just index the file again
+        traceback.print_exc()
+        return None
+
+def duplicate_response(existing):
+    return {
+        "file_id": existing["file_id"],
+        "status": existing.get("status", "indexed"),
+        "duplicate": True,
+        "message": "Identical PDF already uploaded"
+    }
 
-import fitz
 
 @app.post("/upload")
 @limiter.limit("5/minute")
@@ -51,24 +83,51 @@ async def upload_file(request: Request, file: UploadFile = File(...)):
 
         # Save uploaded file locally
         file_id = str(uuid.uuid4())
-        filename = f"{file_id}.pdf"
-        file_path = os.path.join(UPLOAD_DIR, filename)
-
-        with open(file_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-
-        # Check if PDF is encrypted
-        doc = fitz.open(file_path)
-        if doc.is_encrypted:
-            raise HTTPException(status_code=400, detail="Encrypted PDFs are not supported.")
-
-        # Process and store
-        upload_to_s3(file_path, filename)
-        docs = extract_text(file_path)
-        save_metadata(file_id=file_id, filename=file.filename)
-        index_document(docs)
-
-        return {"file_id": file_id, "message": "Uploaded and indexed successfully"}
+        with tracer.trace("upload", file_id=file_id):
+            filename = f"{file_id}.pdf"
+            file_path = os.path.join(UPLOAD_DIR, filename)
+
+            # Hash the bytes while streaming them to disk
+            with tracer.span("save"):
+                hasher = hashlib.sha256()
+                with open(file_path, "wb") as f:
+                    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                        hasher.update(chunk)
+                        f.write(chunk)
+                content_hash = hasher.hexdigest()
+
+            # Same PDF already uploaded: skip S3, extraction and embedding
+            with tracer.span("duplicate_check"):
+                existing = find_duplicate(content_hash)
+            if existing:
+                os.remove(file_path)
+                return duplicate_response(existing)
+
+            # Check if PDF is encrypted, in a thread: it may wait for the PyMuPDF lock held by an ingest job
+            with tracer.span("encryption_check"):
+                encrypted = await run_in_threadpool(is_encrypted, file_path)
+            if encrypted:
+                os.remove(file_path)
+                raise HTTPException(status_code=400, detail="Encrypted PDFs are not supported.")
+
+            # S3 upload, extraction and indexing run in the background worker pool. The in-memory check
+            # is repeated atomically with the submit, for an identical upload that arrived meanwhile
+            try:
+                existing, _ = jobs.submit_unless_running(file_id, file.filename, file_path,
+                                                         content_hash=content_hash)
+            except Exception:
+                os.remove(file_path)
+                raise
+            if existing:
+                os.remove(file_path)
+                return duplicate_response(existing)
+
+            return JSONResponse(status_code=202, content={
+                "file_id": file_id,
+                "status": "queued",
+                "status_url": f"/status/{file_id}",
+                "message": "Upload accepted, indexing in progress"
+            })
 
     except HTTPException as http_exc:
         raise http_exc
@@ -78,6 +137,29 @@ async def upload_file(request: Request, file: UploadFile = File(...)):
 
 
 
+@app.get("/status/{file_id}")
+@limiter.limit("60/minute")
+def ingestion_status(request: Request, file_id: str):
+    # Per-stage progress of an upload: queued/extracting/embedding/indexed/failed
+    job = jobs.get(file_id)
+    if job:
+        return job
+    try:
+        metadata = get_metadata(file_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not metadata:
+        raise HTTPException(status_code=404, detail="File not found.")
+    return {
+        "file_id": file_id,
+        "filename": metadata.get("filename"),
+        "status": metadata.get("status", "indexed"),
+        "stages": metadata.get("stages", {}),
+        "timings": metadata.get("timings", {}),
+        "error": metadata.get("error")
+    }
+
+
 @app.get("/retrieve/{file_id}")
 @limiter.limit("20/minute")
 def retrieve_file_metadata(request: Request, file_id: str):
@@ -87,23 +169,38 @@ def retrieve_file_metadata(request: Request, file_id: str):
         if metadata:
             return metadata
         raise HTTPException(status_code=404, detail="File not found.")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/list")
 @limiter.limit("10/minute")
-def list_files(request: Request, page: int = 1, limit: int = 10):
-    #Paginated list of all uploaded files from DynamoDB.
+def list_files(request: Request, limit: int = Query(10, ge=1, le=100), cursor: Optional[str] = None):
+    # Cursor-paginated list of uploaded files from DynamoDB, newest first;
+    # pass next_cursor from the previous page to get the next one
     try:
-        all_items = list_metadata()
-        start = (page - 1) * limit
-        end = start + limit
+        files, next_cursor = list_metadata_page(limit=limit, cursor=cursor)
         return {
-            "total": len(all_items),
-            "page": page,
+            "total": count_files(),
             "limit": limit,
-            "files": all_items[start:end]
+            "files": files,
+            "next_cursor": next_cursor
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/metrics/stages")
+def stage_metrics(request: Request):
+    # Per-stage latency of /upload and its background ingestion from the tracing spans, since startup
+    return {"pipelines": tracer.breakdown(), "export": tracer.export_stats()}
+
+
+@app.get("/metrics/aws-clients")
+def aws_client_metrics(request: Request):
+    # Requests, retries and connection pool use of the shared S3/DynamoDB clients
+    return client_stats()
@@ -1,10 +1,106 @@
-#Extracts text content from PDF files using LangChain's PyMuPDFLoader
+#Extracts text content from PDF files using LangChain's PyMuPDFLoader,
+#or for large PDFs, PyMuPDF directly with the page range split across a process pool
 
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+from langchain_core.documents import Document
 from langchain_community.document_loaders import PyMuPDFLoader
+
+
+def get_extract_workers():
+    return int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+
+
+def get_parallel_min_pages():
+    return int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+# PyMuPDF is not thread-safe, even across documents: every fitz call in this process (ingest workers,
+# the upload's encryption check) goes through this lock. Large files are still read in parallel by the
+# worker processes of the pool, which have their own copy of the library
+_fitz_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    # One long-lived pool per process; "spawn" because uvicorn/ingest threads make fork unsafe
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def _extract_range(file_path, start, end):
+    # Runs in a worker process: returns the text of pages [start, end)
+    with fitz.open(file_path) as doc:
+        return [doc[number].get_text() for number in range(start, end)]
+
+
+def _page_ranges(page_count, parts):
+    size = -(-page_count // parts)
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+def _document_metadata(doc, file_path):
+    # Same keys PyMuPDFLoader puts on each page
+    return {
+        "source": file_path,
+        "file_path": file_path,
+        "total_pages": len(doc),
+        **{k: v for k, v in doc.metadata.items() if isinstance(v, (str, int))}
+    }
+
+
+def is_encrypted(file_path: str):
+    with _fitz_lock, fitz.open(file_path) as doc:
+        return doc.is_encrypted
+
+
+def extract_text_parallel(file_path: str, workers=None):
+    # Splits the page range across the process pool, keeping page order and page metadata
+    workers = workers or get_extract_workers()
+    with _fitz_lock, fitz.open(file_path) as doc:
+        if doc.is_encrypted:
+            raise ValueError("Encrypted PDFs are not supported.")
+        metadata = _document_metadata(doc, file_path)
+        page_count = len(doc)
+
+    # A few ranges per worker keeps them busy when some pages are much heavier than others
+    ranges = _page_ranges(page_count, min(page_count, workers * 4))
+    pool = _get_pool(workers)
+    futures = [pool.submit(_extract_range, file_path, start, end) for start, end in ranges]
+
+    docs = []
+    for (start, _), future in zip(ranges, futures):
+        for offset, text in enumerate(future.result()):
+            docs.append(Document(page_content=text, metadata={**metadata, "page": start + offset}))
+    return docs
+
+
 def extract_text(file_path: str):
     try:
+        with _fitz_lock, fitz.open(file_path) as opened:
+            page_count = len(opened)
+        workers = get_extract_workers()
+        if workers > 1 and page_count >= get_parallel_min_pages():
+            return extract_text_parallel(file_path, workers)
+
+        # Small files: process start-up would cost more than it saves
         loader = PyMuPDFLoader(file_path)
-        docs = loader.load()
+        with _fitz_lock:
+            docs = loader.load()
         return docs
     except Exception as e:
         raise RuntimeError(f"Failed to extract text from PDF: {e}")
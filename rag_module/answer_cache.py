@@ -0,0 +1,171 @@
+
+# In-memory cache of /query answers with TTL, LRU eviction and index-aware invalidation.
+
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+CORPUS_KEY = "__corpus__"
+
+
+def get_answer_cache_ttl():
+    return float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+
+
+def get_answer_cache_max_bytes():
+    return int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def normalize_question(question):
+    # "  What is the document ABOUT? " and "what is the document about" share one entry
+    text = re.sub(r"\s+", " ", question.strip().lower())
+    return text.rstrip("?!. ")
+
+
+class IndexVersions:
+    # Per-file version markers kept next to the vector store on disk, so the
+    # upload service (which indexes) and the query service (which caches) agree
+    # on when a file's chunks last changed.
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, file_id):
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", str(file_id))
+        return os.path.join(self.directory, safe)
+
+    def get(self, file_id):
+        try:
+            with open(self._path(file_id)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+
+    def bump(self, file_id):
+        path = self._path(file_id)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp, path)
+
+
+class AnswerCache:
+    # LRU of answers keyed on (normalized question, file_ids), bounded by total size in bytes
+
+    def __init__(self, versions, ttl=None, max_bytes=None):
+        self.versions = versions
+        self.ttl = get_answer_cache_ttl() if ttl is None else ttl
+        self.max_bytes = get_answer_cache_max_bytes() if max_bytes is None else max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_bytes > 0
+
+    @staticmethod
+    def _file_ids(file_key):
+        if not file_key:
+            return None
+        if isinstance(file_key, str):
+            file_key = [file_key]
+        return tuple(sorted(str(f) for f in file_key))
+
+    def _key(self, question, file_key):
+        return (normalize_question(question), self._file_ids(file_key))
+
+    def version(self, file_key):
+        # Scoped answers only depend on their own files; unscoped ones on the whole corpus.
+        # Callers read it before retrieval and store the answer under it (see put)
+        file_ids = self._file_ids(file_key)
+        if not file_ids:
+            return (self.versions.get(CORPUS_KEY),)
+        return tuple(self.versions.get(file_id) for file_id in file_ids)
+
+    @staticmethod
+    def _size(key, answer):
+        return len(key[0].encode("utf-8")) + len(str(answer).encode("utf-8")) + 200
+
+    def get(self, question, file_key=None, version=None):
+        if not self.enabled:
+            return None
+        key = self._key(question, file_key)
+        version = self.version(file_key) if version is None else version
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            answer, expires_at, entry_version, size = entry
+            if expires_at < time.monotonic() or entry_version != version:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def put(self, question, file_key, answer, version=None):
+        # version: the index version read before the answer was retrieved. Reading it now would file an
+        # answer built from the old chunks under a reindex that finished during the LLM call
+        if not self.enabled:
+            return
+        key = self._key(question, file_key)
+        size = self._size(key, answer)
+        if size > self.max_bytes:
+            return
+        version = self.version(file_key) if version is None else version
+        entry = (answer, time.monotonic() + self.ttl, version, size)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[3]
+
+    def invalidate_file(self, file_id=None):
+        # Called when chunks are indexed; stale entries are dropped in every process on next lookup
+        self.versions.bump(CORPUS_KEY)
+        if file_id:
+            self.versions.bump(file_id)
+        with self._lock:
+            stale = [key for key in self._entries if key[1] is None or file_id in key[1]]
+            for key in stale:
+                self._remove(key)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,195 @@
+# Packs retrieved chunks into the prompt context. index_document splits with a 200 character
+# overlap, so neighbouring hits repeat text; here chunks that overlap or touch on the same page are
+# merged, near-duplicates are dropped and passages fill a token budget in relevance order.
+
+import os
+import re
+import threading
+
+from rag_module.tokens import estimate_tokens
+
+# Shorter shared prefix/suffix than this is a coincidence, not splitter overlap
+MIN_OVERLAP_CHARS = 20
+SHINGLE_WORDS = 5
+
+
+def get_context_token_budget():
+    return int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+
+def get_dedup_threshold():
+    # Share of a passage's word 5-grams already in a better-ranked passage for it to be dropped
+    return float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+
+
+def overlap_length(left, right):
+    # Length of the longest suffix of left that is also a prefix of right
+    for size in range(min(len(left), len(right)), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _position(metadata):
+    # Where the chunk sits in its page: start_index from the splitter, else the chunk_id ordinal
+    if metadata.get("start_index") is not None:
+        return ("start", int(metadata["start_index"]))
+    ordinal = str(metadata.get("chunk_id", "")).rsplit("-", 1)[-1]
+    if ordinal.isdigit():
+        return ("ordinal", int(ordinal))
+    return None
+
+
+def _page_key(metadata):
+    owner = metadata.get("file_id") or metadata.get("source")
+    if owner is None or metadata.get("page") is None:
+        return None
+    return (owner, metadata.get("page"))
+
+
+def _adjacent(current, passage):
+    # Contiguous on the page even though no text overlaps
+    if current["position"] is None or passage["position"] is None:
+        return False
+    kind, value = passage["position"]
+    if kind != current["position"][0]:
+        return False
+    if kind == "start":
+        return value <= current["end"] + 2
+    return value == current["last"] + 1
+
+
+def merge_overlapping(passages):
+    # passages: relevance-ordered dicts; returns the merged passages and how many chunks were folded in
+    groups, merged, count = {}, [], 0
+    for passage in passages:
+        key = _page_key(passage["metadata"])
+        if key is None or passage["position"] is None:
+            merged.append(passage)
+        else:
+            groups.setdefault(key, []).append(passage)
+    for group in groups.values():
+        group.sort(key=lambda p: p["position"][1])
+        current = group[0]
+        for passage in group[1:]:
+            overlap = overlap_length(current["text"], passage["text"])
+            if passage["text"] in current["text"]:
+                pass
+            elif overlap:
+                current["text"] += passage["text"][overlap:]
+            elif _adjacent(current, passage):
+                current["text"] += "\n" + passage["text"]
+            else:
+                merged.append(current)
+                current = passage
+                continue
+            current["rank"] = min(current["rank"], passage["rank"])
+            current["sources"] += passage["sources"]
+            current["end"] = max(current["end"], passage["end"])
+            current["last"] = passage["last"]
+            count += 1
+        merged.append(current)
+    merged.sort(key=lambda p: p["rank"])
+    return merged, count
+
+
+def shingles(text):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def drop_near_duplicates(passages, threshold):
+    kept, seen, dropped = [], [], 0
+    for passage in passages:
+        grams = shingles(passage["text"])
+        if any(len(grams & other) >= threshold * len(grams) for other in seen):
+            dropped += 1
+            continue
+        kept.append(passage)
+        seen.append(grams)
+    return kept, dropped
+
+
+def fill_budget(passages, budget):
+    # Best-ranked passages first; one that does not fit is skipped so a smaller one can still go in
+    chosen, used, skipped = [], 0, 0
+    for passage in passages:
+        tokens = estimate_tokens(passage["text"])
+        if used + tokens <= budget:
+            chosen.append(passage)
+            used += tokens
+        elif not chosen:
+            # Even the best passage is over budget: keep its beginning, cut at a word boundary
+            text = passage["text"][:budget * 4]
+            passage["text"] = text[:text.rfind(" ")] if " " in text else text
+            chosen.append(passage)
+            used = estimate_tokens(passage["text"])
+        else:
+            skipped += 1
+    return chosen, skipped
+
+
+def pack_context(docs, budget=None, threshold=None):
+    # Returns (context text, report); the report says what was merged, dropped and saved
+    budget = budget or get_context_token_budget()
+    threshold = threshold or get_dedup_threshold()
+    passages = []
+    for rank, doc in enumerate(docs):
+        metadata = doc.metadata or {}
+        position = _position(metadata)
+        passages.append({
+            "text": doc.page_content,
+            "rank": rank,
+            "metadata": metadata,
+            "sources": [metadata.get("chunk_id")] if metadata.get("chunk_id") else [],
+            "position": position,
+            "end": position[1] + len(doc.page_content) if position else 0,
+            "last": position[1] if position else 0,
+        })
+
+    passages, merged = merge_overlapping(passages)
+    passages, duplicates = drop_near_duplicates(passages, threshold)
+    passages, over_budget = fill_budget(passages, budget)
+
+    text = "\n".join(passage["text"] for passage in passages)
+    tokens_before = estimate_tokens("\n".join(doc.page_content for doc in docs))
+    tokens_after = estimate_tokens(text)
+    report = {
+        "chunks": len(docs),
+        "passages": len(passages),
+        "merged": merged,
+        "duplicates": duplicates,
+        "over_budget": over_budget,
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": max(tokens_before - tokens_after, 0),
+    }
+    stats.record(report)
+    return text, report
+
+
+class PackingStats:
+    # Process-wide totals for /metrics/context-packing
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    def record(self, report):
+        with self._lock:
+            self._totals["queries"] = self._totals.get("queries", 0) + 1
+            for name, value in report.items():
+                self._totals[name] = self._totals.get(name, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            totals = dict(self._totals)
+        before = totals.get("tokens_before", 0)
+        totals["saved_ratio"] = round(totals.get("tokens_saved", 0) / before, 4) if before else 0
+        totals["budget"] = get_context_token_budget()
+        return totals
+
+
+stats = PackingStats()
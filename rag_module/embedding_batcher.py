@@ -0,0 +1,123 @@
+
+# Micro-batches concurrent query embeddings into a single forward pass.
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+
+from rag_module.tracing import tracer
+
+
+def get_batch_size():
+    return int(os.getenv("EMBED_BATCH_SIZE", "32"))
+
+
+def get_batch_wait_ms():
+    return float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+
+
+class BatchingEmbeddings(Embeddings):
+    # Wraps an embedding model so that concurrent embed_query calls share one encode.
+    # embed_documents (used by indexing) already works on a batch and goes straight
+    # to document_base (defaults to base).
+
+    def __init__(self, base, max_batch_size=None, max_wait_ms=None, document_base=None):
+        self.base = base
+        self.document_base = document_base or base
+        self.max_batch_size = max(1, max_batch_size or get_batch_size())
+        self.max_wait = (get_batch_wait_ms() if max_wait_ms is None else max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._items = 0
+        self._max_batch = 0
+        self._batch_size_counts = {}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def embed_documents(self, texts):
+        with tracer.span("embed", chunks=len(texts)):
+            return self.document_base.embed_documents(texts)
+
+    def embed_query(self, text):
+        # The span covers the wait for the shared batch as well as the encode
+        with tracer.span("embed_query"):
+            future = Future()
+            self._ensure_worker()
+            self._queue.put((text, time.monotonic(), future))
+            return future.result()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _collect(self):
+        # Blocks for the first request, then gathers more until the window closes or the batch is full
+        batch = [self._queue.get()]
+        deadline = batch[0][1] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            self._record(len(batch), [started - enqueued for _, enqueued, _ in batch])
+            try:
+                vectors = self.base.embed_documents([text for text, _, _ in batch])
+                for (_, _, future), vector in zip(batch, vectors):
+                    future.set_result(vector)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+
+    def _record(self, size, waits):
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._max_batch = max(self._max_batch, size)
+            self._batch_size_counts[size] = self._batch_size_counts.get(size, 0) + 1
+            self._wait_total += sum(waits)
+            self._wait_max = max(self._wait_max, max(waits))
+
+    def stats(self):
+        # Batch size and queue wait metrics since start (or the last reset)
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "batches": self._batches,
+                "queries_embedded": self._items,
+                "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0,
+                "largest_batch": self._max_batch,
+                "batch_size_histogram": dict(sorted(self._batch_size_counts.items())),
+                "avg_queue_wait_ms": round(self._wait_total / self._items * 1000, 3) if self._items else 0,
+                "max_queue_wait_ms": round(self._wait_max * 1000, 3),
+                "queue_depth": self._queue.qsize(),
+            }
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._reset_stats()
@@ -0,0 +1,41 @@
+
+# Bounded thread pool that keeps blocking work (embedding, Chroma, Gemini, AWS calls)
+# off the uvicorn event loop, so one worker can serve many in-flight queries.
+
+import asyncio
+import contextvars
+import functools
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+def get_query_workers():
+    return int(os.getenv("QUERY_MAX_WORKERS", "64"))
+
+
+query_executor = ThreadPoolExecutor(max_workers=get_query_workers(), thread_name_prefix="query")
+
+
+async def run_blocking(func, *args, **kwargs):
+    # Runs a blocking call on the query pool and awaits its result; the caller's context goes
+    # along so tracing spans opened in the thread attach to the request's trace
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(query_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+def submit_blocking(func, *args, **kwargs):
+    # Fire-and-forget on the query pool, for code that cannot await (a stream being closed);
+    # nobody waits for the result, so a failure is logged here
+    context = contextvars.copy_context()
+    future = query_executor.submit(context.run, functools.partial(func, *args, **kwargs))
+    future.add_done_callback(functools.partial(_log_failure, getattr(func, "__name__", repr(func))))
+    return future
+
+
+def _log_failure(name, future):
+    error = future.exception()
+    if error is not None:
+        print(f"❌ Background {name} failed: {error}")
+        traceback.print_exception(error)
@@ -1,38 +1,53 @@
 
 # Handles chunking and embedding documents using LangChain + ChromaDB.
 
+import uuid
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
-import os
-from rag_module.rag_chain import get_embedding
+from rag_module.rag_chain import get_vectorstore, get_file_vectorstore, drop_file_vectorstore, get_answer_cache
+from rag_module.tracing import tracer
 
-embedding = HuggingFaceEmbeddings(model_name="BAAI/bge-small-en-v1.5")
-
-def index_document(docs):
+def index_document(docs, file_id=None):
     try:
-        persist_dir = "./chroma_db"
-        os.makedirs(persist_dir, exist_ok=True)
-
         # Split documents into chunks
-        splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        splits = splitter.split_documents(docs)
-
-        # Check if DB already exists
-        if os.path.exists(os.path.join(persist_dir, "index")):
-            vectorstore = Chroma(
-                embedding_function=get_embedding(),
-                persist_directory=persist_dir
-            )
-            vectorstore.add_documents(splits)
-        else:
-            vectorstore = Chroma.from_documents(
-                documents=splits,
-                embedding=embedding,
-                persist_directory=persist_dir
-            )
-
-        vectorstore.persist()
+        with tracer.span("split", pages=len(docs)) as span:
+            splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, add_start_index=True)
+            splits = splitter.split_documents(docs)
+
+            # Tag every chunk with its file (so retrieval can be scoped to it) and a stable id
+            prefix = str(file_id) if file_id else uuid.uuid4().hex
+            ids = []
+            for i, split in enumerate(splits):
+                if file_id:
+                    split.metadata["file_id"] = str(file_id)
+                split.metadata["chunk_id"] = f"{prefix}-{i}"
+                ids.append(split.metadata["chunk_id"])
+            if span:
+                span.set(chunks=len(splits))
+
+        # Embedding happens inside add_documents and is traced as a child "embed" span
+        with tracer.span("persist"):
+            # Reuse the process-wide vector store (and its loaded embedding model)
+            vectorstore = get_vectorstore()
+            vectorstore.add_documents(splits, ids=ids)
+            vectorstore.persist()
+
+            # Also store the chunks in the file's own collection for scoped queries;
+            # the vectors come straight back from the embedding cache
+            if file_id:
+                get_file_vectorstore(file_id, create=True).add_documents(splits, ids=ids)
+
+        # Cached answers built from the old index are no longer valid
+        get_answer_cache().invalidate_file(file_id)
 
     except Exception as e:
         raise RuntimeError(f"Failed to index document: {e}")
+
+
+def delete_document(file_id):
+    # Removes every chunk of a file from the corpus and its own collection
+    try:
+        get_vectorstore().delete(where={"file_id": str(file_id)})
+        drop_file_vectorstore(file_id)
+        get_answer_cache().invalidate_file(file_id)
+    except Exception as e:
+        raise RuntimeError(f"Failed to delete document from index: {e}")
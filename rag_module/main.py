@@ -1,13 +1,24 @@
 # Handles LLM querying using LangChain, Gemini API, vector retrieval,and logs metrics + query logs via internal/external services.
 
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-import os, time, uuid, traceback
+import os, time, uuid, traceback, json, threading
+from datetime import datetime
+from contextlib import asynccontextmanager
 
-from rag_module.rag_chain import get_vectorstore, create_chain_from_retriever
-from rag_module.metrics_client import send_metrics
-from aws_service.query_log_handler import log_query
+from rag_module.rag_chain import (
+    get_chain, get_batching_embedding, get_embedding_cache, get_answer_cache, normalize_file_ids,
+    get_retriever, create_answer_chain, prompt_text, warm_up_with_retry, readiness, get_warmup_enabled, unknown_file_ids, UnknownFileError
+)
+from rag_module.retrieval import retrieval_confidence
+from rag_module.tokens import message_text, token_usage
+from rag_module.context_packing import pack_context, stats as packing_stats
+from rag_module.retrieval import chunk_id
+from rag_module.executors import run_blocking, submit_blocking
+from rag_module.outbox import get_outbox, METRIC, QUERY_LOG
+from rag_module.tracing import tracer
+from aws_service.aws_client import client_stats
 
 
 # Rate limiting
@@ -16,9 +27,22 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
 
+
+@asynccontextmanager
+async def lifespan(app):
+    # Resumes delivery of side effects left in the outbox by a previous run
+    get_outbox().start()
+    # The server accepts connections right away; /ready turns 200 once the models and store are loaded
+    if get_warmup_enabled():
+        threading.Thread(target=warm_up_with_retry, name="warm-up", daemon=True).start()
+    yield
+    get_outbox().stop(flush=True)
+    tracer.flush()
+
+
 # App setup
 limiter = Limiter(key_func=get_remote_address)
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.state.limiter = limiter
 app.add_middleware(SlowAPIMiddleware)
 
@@ -36,53 +60,321 @@ app.add_middleware(
 async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
     return JSONResponse(status_code=429, content={"detail": "Rate limit exceeded"})
 
+@app.get("/ready")
+def ready(request: Request):
+    # Readiness probe: 503 until warm-up has loaded the embedding model, vector store and LLM client
+    # (always 200 with WARMUP_ON_STARTUP=false)
+    state = readiness()
+    return JSONResponse(status_code=200 if state["ready"] else 503, content=state)
+
+
+def record_side_effects(metric, log):
+    # Metrics and the query log go to the local outbox in one transaction; AWS is written in the background
+    timestamp = datetime.utcnow().isoformat()
+    with tracer.span("outbox_write"):
+        get_outbox().add([(METRIC, {**metric, "timestamp": timestamp}), (QUERY_LOG, {**log, "timestamp": timestamp})])
+
+
+def lookup_answer(answer_cache, question, file_ids):
+    # (index version, cached entry or None); a fresh answer is stored under this version, read before retrieval
+    version = answer_cache.version(file_ids)
+    return version, answer_cache.get(question, file_ids, version=version)
+
+
+def answer_question(question, file_ids):
+    # Blocking part of /query: answer cache lookup or embedding + Chroma + Gemini round trip.
+    # Returns (answer, cached, {"confidence", "usage", "packing"}); usage and packing are None on a cache hit
+    answer_cache = get_answer_cache()
+    with tracer.span("answer_cache"):
+        version, entry = lookup_answer(answer_cache, question, file_ids)
+    if entry is not None:
+        return entry["answer"], True, {"confidence": entry["confidence"], "usage": None, "packing": None}
+    # Embedding model + vectorstore are loaded once per worker
+    chain = get_chain(file_ids)
+    output = chain.invoke(question)
+    answer_cache.put(question, file_ids, {"answer": output["answer"], "confidence": output["confidence"]},
+                     version=version)
+    return output["answer"], False, output
+
+
+async def read_json(request):
+    # Request body as a JSON object; anything else is the client's error, not a 500
+    try:
+        data = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body.")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Expected a JSON object.")
+    return data
+
+
+async def check_file_ids(file_ids):
+    # A scoped query must name indexed files; an unknown id is a 404, not an empty context
+    unknown = await run_blocking(unknown_file_ids, file_ids) if file_ids else []
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown file_key: {', '.join(unknown)}")
+
+
+def accounting(details):
+    # Metric and query-log fields for the tokens the LLM call used and the retrieval confidence
+    # A cache hit makes no LLM call: no split is sent, so it does not drag the prompt/completion averages down
+    usage = details.get("usage") or {}
+    return {
+        "tokens_used": usage.get("total_tokens", 0),
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+        "confidence": details["confidence"],
+    }
+
+
 @app.post("/query")
 @limiter.limit("10/minute")
 async def query(request: Request):
     # Accepts a question + file key
     try:
-        data = await request.json()
-        question = data.get("query", "").strip()
-        file_id = data.get("file_key")
+        data = await read_json(request)
+        question = str(data.get("query") or "").strip()
+        # file_key may be one file_id or a list of them; retrieval is scoped to those files
+        file_ids = normalize_file_ids(data.get("file_key"))
+        file_id = ",".join(file_ids) if file_ids else data.get("file_key")
 
 
         if not question:
             raise HTTPException(status_code=400, detail="Empty query.")
-
-        # Access vectorstore
-        vectorstore = get_vectorstore()
-        # Retriever
-        retriever = vectorstore.as_retriever()
-        # Create ragchain 
-        chain = create_chain_from_retriever(retriever)
+        await check_file_ids(file_ids)
 
         run_id = str(uuid.uuid4())
         start = time.time()
-        result = chain.invoke(question)
-        latency = time.time() - start
-
-        # Send metrices to dynamodb
-        send_metrics(
-            run_id=run_id,
-            tokens_used=345,
-            confidence=0.92,
-            response_time=latency,
-            file_id=file_id
-        )
-        # Log the full query and response
-        log_query(
-            run_id=run_id,
-            query_text=question,
-            response_text=result,
-            confidence_score=0.92,
-            file_id=file_id
-        )
 
+        with tracer.trace("query", run_id=run_id, file_id=file_id):
+            # Runs on the bounded query pool so the event loop stays free for other requests
+            result, cached, details = await run_blocking(answer_question, question, file_ids)
+            latency = time.time() - start
+            tokens_saved = details["packing"]["tokens_saved"] if details.get("packing") else 0
+            counts = accounting(details)
 
-        return {"run_id": run_id, "reply": result}
+            # Metrics and the full query + response, queued for the background flusher
+            await run_blocking(
+                record_side_effects,
+                metric=dict(
+                    run_id=run_id,
+                    **counts,
+                    response_time=latency,
+                    file_id=file_id,
+                    cache_hit=cached,
+                    context_tokens_saved=tokens_saved
+                ),
+                log=dict(
+                    run_id=run_id,
+                    query_text=question,
+                    response_text=result,
+                    confidence_score=counts["confidence"],
+                    file_id=file_id,
+                    cache_hit=cached,
+                    tokens_used=counts["tokens_used"]
+                )
+            )
+
+
+        return {
+            "run_id": run_id,
+            "reply": result,
+            "cached": cached,
+            "confidence": counts["confidence"],
+            "tokens_used": counts["tokens_used"],
+            "context_tokens_saved": tokens_saved
+        }
 
     except HTTPException as he:
         raise he
+    except UnknownFileError as e:
+        # The file was deleted after the check above
+        raise HTTPException(status_code=404, detail=f"Unknown file_key: {e}")
     except Exception as e:
         traceback.print_exc()
         return JSONResponse(status_code=500, content={"error": str(e)})
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/query/stream")
+@limiter.limit("10/minute")
+async def query_stream(request: Request):
+    # Same input as /query; answers as server-sent events:
+    # "start" (run_id + source chunk ids), one "token" per chunk of text, then "end" or "error"
+    data = await read_json(request)
+    question = str(data.get("query") or "").strip()
+    file_ids = normalize_file_ids(data.get("file_key"))
+    file_id = ",".join(file_ids) if file_ids else data.get("file_key")
+
+    if not question:
+        raise HTTPException(status_code=400, detail="Empty query.")
+    await check_file_ids(file_ids)
+
+    run_id = str(uuid.uuid4())
+    start = time.time()
+
+    async def events():
+        state = {
+            "run_id": run_id, "question": question, "file_ids": file_ids, "file_id": file_id, "start": start,
+            "tokens": [], "first_token_at": None, "tokens_saved": 0, "message": None, "cached": False,
+            "confidence": 0.0, "context": None, "cache_version": None,
+        }
+        recorded = failed = False
+        # Opened inside the generator: the stream is consumed after query_stream has returned
+        with tracer.trace("query", run_id=run_id, file_id=file_id, stream=True) as span:
+            answer_cache = get_answer_cache()
+            try:
+                try:
+                    with tracer.span("answer_cache"):
+                        state["cache_version"], entry = await run_blocking(lookup_answer, answer_cache, question,
+                                                                           file_ids)
+                    state["cached"] = entry is not None
+                    if state["cached"]:
+                        state["confidence"] = entry["confidence"]
+                        yield sse_event("start", {"run_id": run_id, "sources": [], "cached": True})
+                        state["first_token_at"] = time.time()
+                        state["tokens"].append(entry["answer"])
+                        yield sse_event("token", {"token": entry["answer"]})
+                    else:
+                        # Retrieval blocks (embedding + Chroma); the Gemini stream itself is async
+                        docs = await run_blocking(get_retriever(file_ids).invoke, question)
+                        with tracer.span("prompt_build"):
+                            context, packing = pack_context(docs)
+                        state.update(
+                            context=context, tokens_saved=packing["tokens_saved"],
+                            confidence=retrieval_confidence(docs)
+                        )
+                        yield sse_event("start", {
+                            "run_id": run_id,
+                            "sources": [chunk_id(doc) for doc in docs],
+                            "cached": False,
+                            "context_tokens_saved": state["tokens_saved"]
+                        })
+                        with tracer.span("llm_call"):
+                            async for chunk in create_answer_chain().astream(
+                                {"context": context, "question": question}
+                            ):
+                                # Chunks add up to one message carrying Gemini's total usage
+                                state["message"] = chunk if state["message"] is None else state["message"] + chunk
+                                token = message_text(chunk)
+                                if not token:
+                                    continue
+                                if state["first_token_at"] is None:
+                                    state["first_token_at"] = time.time()
+                                state["tokens"].append(token)
+                                yield sse_event("token", {"token": token})
+                except Exception as e:
+                    failed = True
+                    traceback.print_exc()
+                    span.error = f"{type(e).__name__}: {e}"
+                    yield sse_event("error", {"run_id": run_id, "error": str(e)})
+                    return
+
+                state["end"] = time.time()
+                # Set before awaiting: a disconnect now cancels only the wait, finish_stream still runs
+                recorded = True
+                counts = await run_blocking(finish_stream, state, complete=True)
+                yield sse_event("end", {
+                    "run_id": run_id,
+                    "latency": state["end"] - start,
+                    "time_to_first_token": (state["first_token_at"] or state["end"]) - start,
+                    "confidence": counts["confidence"],
+                    "tokens_used": counts["tokens_used"]
+                })
+            finally:
+                if not recorded and not failed:
+                    # The client went away mid-stream: still queue the metric and the partial answer's log.
+                    # Nothing can be awaited while the generator is being closed or cancelled
+                    submit_blocking(finish_stream, state, complete=False)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def finish_stream(state, complete):
+    # Token usage, answer cache and side effects of one streamed answer; a partial answer is not cached
+    result = "".join(state["tokens"])
+    end = state.get("end") or time.time()
+    latency = end - state["start"]
+    time_to_first_token = (state["first_token_at"] or end) - state["start"]
+    usage = None
+    if not state["cached"] and state["context"] is not None:
+        if complete:
+            get_answer_cache().put(
+                state["question"], state["file_ids"], {"answer": result, "confidence": state["confidence"]},
+                version=state["cache_version"]
+            )
+        # Falls back to the local tokenizer when the stream carried no usage metadata
+        usage = token_usage(
+            state["message"], prompt_text({"context": state["context"], "question": state["question"]}), result
+        )
+    counts = accounting({"usage": usage, "confidence": state["confidence"]})
+    record_side_effects(
+        metric=dict(
+            run_id=state["run_id"],
+            **counts,
+            response_time=latency,
+            file_id=state["file_id"],
+            cache_hit=state["cached"],
+            time_to_first_token=time_to_first_token,
+            context_tokens_saved=state["tokens_saved"]
+        ),
+        log=dict(
+            run_id=state["run_id"],
+            query_text=state["question"],
+            response_text=result,
+            confidence_score=counts["confidence"],
+            file_id=state["file_id"],
+            cache_hit=state["cached"],
+            tokens_used=counts["tokens_used"]
+        )
+    )
+    return counts
+
+
+@app.get("/metrics/embedding")
+def embedding_metrics(request: Request):
+    # Batch sizes and queue wait times of the query embedding batcher
+    return get_batching_embedding().stats()
+
+
+@app.get("/metrics/embedding-cache")
+def embedding_cache_metrics(request: Request):
+    # Hit/miss counters and size of the content-addressed chunk embedding cache
+    return get_embedding_cache().stats()
+
+
+@app.get("/metrics/answer-cache")
+def answer_cache_metrics(request: Request):
+    # Hit/miss counters and memory use of the /query answer cache
+    return get_answer_cache().stats()
+
+
+@app.get("/metrics/context-packing")
+def context_packing_metrics(request: Request):
+    # Chunks merged or dropped and prompt tokens saved by context packing, since startup
+    return packing_stats.snapshot()
+
+
+@app.get("/metrics/outbox")
+def outbox_metrics(request: Request):
+    # Backlog, retries and dead records of the metrics/query-log outbox
+    return get_outbox().stats()
+
+
+@app.get("/metrics/stages")
+def stage_metrics(request: Request):
+    # Per-stage latency of /query (and of outbox deliveries) from the tracing spans, since startup
+    return {"pipelines": tracer.breakdown(), "export": tracer.export_stats()}
+
+
+@app.get("/metrics/aws-clients")
+def aws_client_metrics(request: Request):
+    # Requests, retries and connection pool use of the shared Lambda/DynamoDB clients
+    return client_stats()
@@ -11,20 +11,69 @@ load_dotenv()
 
 lambda_client = get_client("lambda")
 
-def send_metrics(run_id, tokens_used, confidence, response_time, file_id="unknown"):
+def get_metrics_batch_invoke():
+    # Send outbox batches as one {"metrics": [...]} invocation (false: one invocation per metric)
+    return os.getenv("METRICS_BATCH_INVOKE", "true").lower() == "true"
+
+
+def build_metric_payload(run_id, tokens_used, confidence, response_time, file_id="unknown", cache_hit=False,
+                         time_to_first_token=None, timestamp=None, context_tokens_saved=None,
+                         prompt_tokens=None, completion_tokens=None):
     payload = {
         "run_id": run_id,
         "tokens_used": tokens_used,
         "confidence_score": confidence,
         "response_time": response_time,
-        "file_id": file_id
+        "file_id": file_id,
+        "cache_hit": cache_hit
     }
+    if time_to_first_token is not None:
+        payload["time_to_first_token"] = time_to_first_token
+    if timestamp is not None:
+        payload["timestamp"] = timestamp
+    if context_tokens_saved is not None:
+        payload["context_tokens_saved"] = context_tokens_saved
+    if prompt_tokens is not None:
+        payload["prompt_tokens"] = prompt_tokens
+    if completion_tokens is not None:
+        payload["completion_tokens"] = completion_tokens
+    return payload
+
+
+def _invoke(payload):
+    return lambda_client.invoke(
+        FunctionName="logMetricsFunction",
+        InvocationType="Event",
+        Payload=json.dumps(payload)
+    )
+
+
+def send_metrics_batch(records):
+    # records: send_metrics keyword dicts. Returns the indexes that were not handed to Lambda
+    payloads = [build_metric_payload(**record) for record in records]
+    if get_metrics_batch_invoke():
+        try:
+            _invoke({"metrics": payloads})
+            return []
+        except Exception as e:
+            print(f"❌ Failed to send metrics batch to AWS Lambda: {e}")
+            return list(range(len(payloads)))
+    failed = []
+    for i, payload in enumerate(payloads):
+        try:
+            _invoke(payload)
+        except Exception as e:
+            print(f"❌ Failed to send metrics to AWS Lambda: {e}")
+            failed.append(i)
+    return failed
+
+
+def send_metrics(run_id, tokens_used, confidence, response_time, file_id="unknown", cache_hit=False,
+                 time_to_first_token=None):
+    payload = build_metric_payload(run_id, tokens_used, confidence, response_time, file_id, cache_hit,
+                                   time_to_first_token)
     try:
-        response = lambda_client.invoke(
-            FunctionName="logMetricsFunction",
-            InvocationType="Event",
-            Payload=json.dumps(payload)
-        )
+        response = _invoke(payload)
         print("✅ Metrics sent to AWS Lambda.")
     except Exception as e:
         print(f"❌ Failed to send metrics to AWS Lambda: {e}")
@@ -0,0 +1,228 @@
+
+# Durable outbox for per-query side effects (metrics + query log).
+# /query only appends to a local SQLite file; a background flusher drains it to AWS in batches,
+# so records survive slow or unavailable AWS and process restarts.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+from rag_module.tracing import tracer
+
+METRIC = "metric"
+QUERY_LOG = "query_log"
+# Deliveries are batched across queries, so each batch is its own trace tagged with the run_ids it carries
+FLUSH_SPANS = {METRIC: "metrics_send", QUERY_LOG: "log_write"}
+
+
+def get_outbox_path():
+    return os.getenv("OUTBOX_PATH", os.path.join("outbox", "side_effects.sqlite3"))
+
+
+def get_flush_interval_ms():
+    return float(os.getenv("OUTBOX_FLUSH_INTERVAL_MS", "500"))
+
+
+def get_outbox_batch_size():
+    # BatchWriteItem takes at most 25 items
+    return min(int(os.getenv("OUTBOX_BATCH_SIZE", "25")), 25)
+
+
+def get_outbox_max_attempts():
+    return int(os.getenv("OUTBOX_MAX_ATTEMPTS", "20"))
+
+
+def backoff_seconds(attempts, base=0.5, cap=300.0):
+    return min(cap, base * (2 ** max(attempts - 1, 0)))
+
+
+class Outbox:
+    # Rows wait in SQLite until their sender accepts them. Failed rows are retried with
+    # exponential backoff; after max_attempts they are kept as "dead" instead of being dropped.
+
+    def __init__(self, path, senders, batch_size=None, flush_interval_ms=None, max_attempts=None):
+        # senders: {kind: callable(list of payloads) -> list of indexes that were not delivered}
+        self.path = path
+        self.senders = senders
+        self.batch_size = batch_size or get_outbox_batch_size()
+        self.flush_interval = (get_flush_interval_ms() if flush_interval_ms is None else flush_interval_ms) / 1000
+        self.max_attempts = max_attempts or get_outbox_max_attempts()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # One flush at a time: stop() flushing while the worker is still in a slow send would read and
+        # send the same due rows twice
+        self._flush_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, "
+            "created_at REAL NOT NULL, dead INTEGER NOT NULL DEFAULT 0, last_error TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_due ON outbox(dead, kind, next_attempt_at)")
+        self._conn.commit()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._worker = None
+        self._added = 0
+        self.sent = 0
+        self.retries = 0
+        self.flushes = 0
+        self.last_error = None
+
+    def add(self, records):
+        # records: [(kind, payload dict)]; written in one transaction
+        now = time.time()
+        rows = [(kind, json.dumps(payload, default=str), now, now) for kind, payload in records]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO outbox (kind, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+            self._added += len(rows)
+            full = self._added >= self.batch_size
+        # Flush early once a full batch is waiting, otherwise on the next interval
+        if full:
+            self._wake.set()
+
+    def _due(self, kind, now):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, payload, attempts FROM outbox "
+                "WHERE dead = 0 AND kind = ? AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (kind, now, self.batch_size)
+            ).fetchall()
+
+    def flush(self):
+        # Sends every batch that is due; returns how many records were delivered
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        delivered = 0
+        for kind, sender in self.senders.items():
+            while True:
+                rows = self._due(kind, time.time())
+                if not rows:
+                    break
+                payloads = [json.loads(payload) for _, payload, _ in rows]
+                with tracer.trace(FLUSH_SPANS.get(kind, kind), run_ids=[p["run_id"] for p in payloads if p.get("run_id")]) as span:
+                    try:
+                        failed = set(sender(payloads))
+                        error = "not delivered"
+                    except Exception as e:
+                        traceback.print_exc()
+                        failed = set(range(len(rows)))
+                        error = str(e)
+                    span.set(records=len(rows), failed=len(failed))
+                self._settle(rows, failed, error)
+                delivered += len(rows) - len(failed)
+                self.flushes += 1
+                if failed:
+                    # Back off this kind; the failed rows are not due again yet
+                    self.last_error = error
+                    break
+        return delivered
+
+    def _settle(self, rows, failed, error):
+        now = time.time()
+        done = [(row_id,) for i, (row_id, _, _) in enumerate(rows) if i not in failed]
+        retry, dead = [], []
+        for i in failed:
+            row_id, _, attempts = rows[i]
+            attempts += 1
+            if attempts >= self.max_attempts:
+                dead.append((attempts, error, row_id))
+            else:
+                retry.append((attempts, now + backoff_seconds(attempts), error, row_id))
+        with self._lock:
+            self._conn.executemany("DELETE FROM outbox WHERE id = ?", done)
+            self._conn.executemany(
+                "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?", retry
+            )
+            self._conn.executemany(
+                "UPDATE outbox SET attempts = ?, dead = 1, last_error = ? WHERE id = ?", dead
+            )
+            self._conn.commit()
+        self.sent += len(done)
+        self.retries += len(retry)
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopped.clear()
+                self._worker = threading.Thread(target=self._run, name="outbox-flusher", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            with self._lock:
+                self._added = 0
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def start(self):
+        # Starts the flusher, which also picks up records left over from a previous run
+        self._ensure_worker()
+
+    def stop(self, flush=True):
+        self._stopped.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+        if flush:
+            self.flush()
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE dead = 0").fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._conn.execute(
+                "SELECT kind, COUNT(*) FROM outbox WHERE dead = 0 GROUP BY kind"
+            ).fetchall())
+            dead = self._conn.execute("SELECT COUNT(*) FROM outbox WHERE dead = 1").fetchone()[0]
+            oldest = self._conn.execute("SELECT MIN(created_at) FROM outbox WHERE dead = 0").fetchone()[0]
+        return {
+            "pending": sum(counts.values()),
+            "pending_by_kind": counts,
+            "dead": dead,
+            "sent": self.sent,
+            "retries": self.retries,
+            "flushes": self.flushes,
+            "oldest_pending_age_seconds": round(time.time() - oldest, 3) if oldest else 0,
+            "last_error": self.last_error,
+        }
+
+    def close(self):
+        self.stop(flush=False)
+        with self._lock:
+            self._conn.close()
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    # One outbox (and flusher thread) per process, sending metrics to Lambda and logs to QueryLog
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            from rag_module.metrics_client import send_metrics_batch
+            from aws_service.query_log_handler import write_query_logs
+            _outbox = Outbox(get_outbox_path(), {METRIC: send_metrics_batch, QUERY_LOG: write_query_logs})
+            _outbox.start()
+        return _outbox
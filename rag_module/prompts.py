@@ -0,0 +1,16 @@
+
+# Prompt templates kept in the repo, so startup needs no LangChain Hub download.
+
+from langchain_core.prompts import ChatPromptTemplate
+
+# Text of the "rlm/rag-prompt" hub prompt the service used to pull at import
+RAG_TEMPLATE = (
+    "You are an assistant for question-answering tasks. Use the following pieces of retrieved "
+    "context to answer the question. If you don't know the answer, just say that you don't know. "
+    "Use three sentences maximum and keep the answer concise.\n"
+    "Question: {question} \n"
+    "Context: {context} \n"
+    "Answer:"
+)
+
+rag_prompt = ChatPromptTemplate.from_messages([("human", RAG_TEMPLATE)])
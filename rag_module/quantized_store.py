@@ -0,0 +1,377 @@
+# Compact vector store: int8 or binary codes in memory for candidate search, exact rescoring
+# over the full-precision vectors kept in a memory-mapped file. An alternative to a Chroma
+# collection when the float32 vectors and HNSW graph no longer fit comfortably in RAM.
+#
+# On disk, one directory per collection:
+#   vectors.f32  float32 vectors, appended, read through np.memmap (only rescored rows are paged in)
+#   codes.bin    int8 (dim bytes) or sign-bit (dim / 8 bytes) codes, loaded into memory
+#   meta.f32     per row: vector norm and int8 scale
+#   docs.sqlite3 chunk ids, text, metadata and the add/delete generation of every row
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+QUANTIZATIONS = ("int8", "binary")
+# Rows scored per step of the candidate search; small blocks keep the float32 copy in cache
+SCAN_ROWS = 4096
+# Number of set bits of every byte value, for Hamming distances
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def get_rescore_factor():
+    # Candidates rescored exactly per requested result; binary codes need more than int8
+    return int(os.getenv("QUANTIZED_RESCORE_FACTOR", "10"))
+
+
+def quantize(vectors, quantization):
+    # Returns (codes, scales) for a float32 matrix
+    if quantization == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    return np.packbits(vectors > 0, axis=1), np.ones(len(vectors), dtype=np.float32)
+
+
+def hamming(codes, bits):
+    # Differing bits per row; 64-bit words and np.bitwise_count (NumPy 2) when they fit
+    if hasattr(np, "bitwise_count") and codes.shape[1] % 8 == 0 and codes.flags.c_contiguous:
+        return np.bitwise_count(codes.view(np.uint64) ^ bits.view(np.uint64)).sum(axis=1)
+    return POPCOUNT[codes ^ bits].sum(axis=1)
+
+
+def exact_distances(vectors, norms, query, space):
+    # Same distances Chroma reports for each space: lower is closer
+    dots = vectors @ query
+    if space == "cosine":
+        return 1 - dots / np.maximum(norms * np.linalg.norm(query), 1e-12)
+    if space == "ip":
+        return 1 - dots
+    return norms ** 2 - 2 * dots + float(query @ query)
+
+
+def _grow(buffer, size, extra):
+    # Capacity-doubling append buffer, so adding chunks does not copy the whole index each time
+    if size + extra <= len(buffer):
+        return buffer
+    grown = np.empty((max(size + extra, 2 * len(buffer)),) + buffer.shape[1:], dtype=buffer.dtype)
+    grown[:size] = buffer[:size]
+    return grown
+
+
+class QuantizedVectorStore(VectorStore):
+
+    def __init__(self, directory, embedding, quantization="int8", space="l2", rescore_factor=None):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}")
+        self.directory = directory
+        self.embedding = embedding
+        self.quantization = quantization
+        self.space = space
+        self.rescore_factor = rescore_factor or get_rescore_factor()
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        # timeout: the upload service writes while the query service reads
+        self._conn = sqlite3.connect(os.path.join(directory, "docs.sqlite3"), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS docs ("
+            "row INTEGER PRIMARY KEY, id TEXT NOT NULL, file_id TEXT, text TEXT NOT NULL, "
+            "metadata TEXT NOT NULL, added_gen INTEGER NOT NULL, deleted_gen INTEGER);"
+            "CREATE INDEX IF NOT EXISTS idx_docs_id ON docs(id);"
+            "CREATE INDEX IF NOT EXISTS idx_docs_file ON docs(file_id);"
+            "CREATE INDEX IF NOT EXISTS idx_docs_added ON docs(added_gen);"
+            "CREATE INDEX IF NOT EXISTS idx_docs_deleted ON docs(deleted_gen);"
+        )
+        self._conn.commit()
+        self.dim = None
+        self._size = 0
+        self._generation = 0
+        self._codes = self._meta = self._alive = None
+        self._vectors = None
+        try:
+            self._refresh()
+        except Exception:
+            self._conn.close()
+            raise
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    @staticmethod
+    def exists(directory):
+        # True if a store was created in directory (opening one creates it)
+        return os.path.exists(os.path.join(directory, "docs.sqlite3"))
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _setting(self, key):
+        row = self._conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _code_width(self):
+        return self.dim if self.quantization == "int8" else (self.dim + 7) // 8
+
+    def _read_rows(self, name, dtype, width, start, end):
+        with open(self._path(name), "rb") as f:
+            f.seek(start * width * np.dtype(dtype).itemsize)
+            data = np.frombuffer(f.read((end - start) * width * np.dtype(dtype).itemsize), dtype=dtype)
+        return data.reshape(end - start, width)
+
+    def _init_dim(self, dim):
+        self.dim = dim
+        self._codes = np.empty((0, self._code_width()), dtype=np.int8 if self.quantization == "int8" else np.uint8)
+        self._meta = np.empty((0, 2), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+
+    def _refresh(self):
+        # Picks up rows added or deleted since the last look, also by other processes
+        with self._lock:
+            generation = int(self._setting("generation") or 0)
+            if generation == self._generation:
+                return
+            if self.dim is None:
+                self._check_quantization()
+                self._init_dim(int(self._setting("dim")))
+            # Rows past the committed count may belong to a write still in progress
+            rows = int(self._setting("rows"))
+            if rows > self._size:
+                self._codes = _grow(self._codes, self._size, rows - self._size)
+                self._meta = _grow(self._meta, self._size, rows - self._size)
+                self._alive = _grow(self._alive, self._size, rows - self._size)
+                self._codes[self._size:rows] = self._read_rows("codes.bin", self._codes.dtype, self._code_width(), self._size, rows)
+                self._meta[self._size:rows] = self._read_rows("meta.f32", np.float32, 2, self._size, rows)
+                self._alive[self._size:rows] = False
+                self._size = rows
+            for (row,) in self._conn.execute(
+                "SELECT row FROM docs WHERE added_gen > ? AND deleted_gen IS NULL AND row < ?",
+                (self._generation, self._size)
+            ):
+                self._alive[row] = True
+            for (row,) in self._conn.execute(
+                "SELECT row FROM docs WHERE deleted_gen > ? AND row < ?", (self._generation, self._size)
+            ):
+                self._alive[row] = False
+            self._generation = generation
+
+    def _check_quantization(self):
+        # Every writer appends codes in its own mode, so one store never mixes int8 and binary codes;
+        # switching VECTOR_STORE_MODE means reindexing into a new store
+        stored = self._setting("quantization")
+        if stored is not None and stored != self.quantization:
+            raise ValueError(
+                f"Store {self.directory} holds {stored} codes, not {self.quantization}; reindex to switch modes"
+            )
+
+    def add_vectors(self, vectors, texts, metadatas=None, ids=None):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        if not len(vectors):
+            return ids
+        codes, scales = quantize(vectors, self.quantization)
+        meta = np.column_stack([np.linalg.norm(vectors, axis=1), scales]).astype(np.float32)
+        with self._lock:
+            # BEGIN IMMEDIATE serializes writers across processes while rows are numbered
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self._setting("dim") is None:
+                    self._conn.executemany("INSERT OR REPLACE INTO settings VALUES (?, ?)", [
+                        ("dim", str(vectors.shape[1])), ("quantization", self.quantization),
+                        ("generation", "0"), ("rows", "0")
+                    ])
+                    for name in ("vectors.f32", "codes.bin", "meta.f32"):
+                        open(self._path(name), "wb").close()
+                self._check_quantization()
+                dim = int(self._setting("dim"))
+                if vectors.shape[1] != dim:
+                    raise ValueError(f"Vectors have {vectors.shape[1]} dimensions, the store has {dim}")
+                generation = int(self._setting("generation")) + 1
+                start = int(self._setting("rows"))
+                for name, data in (("codes.bin", codes), ("meta.f32", meta), ("vectors.f32", vectors)):
+                    with open(self._path(name), "r+b") as f:
+                        f.seek(start * data.shape[1] * data.itemsize)
+                        f.write(data.tobytes())
+                        f.truncate()
+                # Adding an existing id replaces it, like Chroma's upsert
+                self._conn.executemany(
+                    "UPDATE docs SET deleted_gen = ? WHERE id = ? AND deleted_gen IS NULL",
+                    [(generation, id_) for id_ in ids]
+                )
+                self._conn.executemany(
+                    "INSERT INTO docs (row, id, file_id, text, metadata, added_gen) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (start + i, id_, metadata.get("file_id"), text, json.dumps(metadata), generation)
+                        for i, (id_, text, metadata) in enumerate(zip(ids, texts, metadatas))
+                    ]
+                )
+                self._conn.executemany("UPDATE settings SET value = ? WHERE key = ?", [
+                    (str(generation), "generation"), (str(start + len(vectors)), "rows")
+                ])
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._refresh()
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        return self.add_vectors(self.embedding.embed_documents(texts), texts, metadatas, ids)
+
+    def delete(self, ids=None, where=None, **kwargs):
+        # Supports the deletes index_document and delete_document make: by ids or by {"file_id": ...}
+        if where and set(where) != {"file_id"}:
+            raise ValueError("Only {'file_id': ...} filters are supported")
+        with self._lock:
+            if self._setting("dim") is None:
+                return  # Nothing was ever added
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                generation = int(self._setting("generation")) + 1
+                if ids:
+                    self._conn.executemany(
+                        "UPDATE docs SET deleted_gen = ? WHERE id = ? AND deleted_gen IS NULL",
+                        [(generation, id_) for id_ in ids]
+                    )
+                if where:
+                    self._conn.execute(
+                        "UPDATE docs SET deleted_gen = ? WHERE file_id = ? AND deleted_gen IS NULL",
+                        (generation, str(where["file_id"]))
+                    )
+                self._conn.execute("UPDATE settings SET value = ? WHERE key = 'generation'", (str(generation),))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._refresh()
+
+    def _candidates(self, codes, meta, alive, query, count):
+        # First stage: approximate distances from the in-memory codes
+        approx = np.empty(len(codes), dtype=np.float32)
+        if self.quantization == "binary":
+            bits = np.packbits(query > 0)
+            for start in range(0, len(codes), SCAN_ROWS):
+                approx[start:start + SCAN_ROWS] = hamming(codes[start:start + SCAN_ROWS], bits)
+        else:
+            for start in range(0, len(codes), SCAN_ROWS):
+                block = meta[start:start + SCAN_ROWS]
+                dots = (codes[start:start + SCAN_ROWS].astype(np.float32) @ query) * block[:, 1]
+                if self.space == "cosine":
+                    approx[start:start + SCAN_ROWS] = -dots / np.maximum(block[:, 0], 1e-12)
+                elif self.space == "ip":
+                    approx[start:start + SCAN_ROWS] = -dots
+                else:
+                    approx[start:start + SCAN_ROWS] = block[:, 0] ** 2 - 2 * dots
+        approx[~alive] = np.inf
+        count = min(count, int(alive.sum()))
+        if count <= 0:
+            return np.empty(0, dtype=np.int64)
+        rows = np.argpartition(approx, count - 1)[:count] if count < len(approx) else np.arange(len(approx))
+        return np.sort(rows[np.isfinite(approx[rows])])
+
+    def _vector_file(self):
+        if self._vectors is None or len(self._vectors) < self._size:
+            self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(self._size, self.dim))
+        return self._vectors
+
+    def search_by_vector(self, query, k=4):
+        # [(row, distance)] of the k closest live rows
+        self._refresh()
+        with self._lock:
+            if not self._size:
+                return []
+            # Appends swap in new buffers, so these views stay consistent without holding the lock
+            size = self._size
+            codes, meta, alive = self._codes[:size], self._meta[:size], self._alive[:size].copy()
+            vectors = self._vector_file()
+        query = np.asarray(query, dtype=np.float32)
+        rows = self._candidates(codes, meta, alive, query, k * self.rescore_factor)
+        if not len(rows):
+            return []
+        # Second stage: exact distances over the full-precision vectors of the candidates only
+        distances = exact_distances(np.asarray(vectors[rows]), meta[rows, 0], query, self.space)
+        order = np.argsort(distances)[:k]
+        return [(int(rows[i]), float(distances[i])) for i in order]
+
+    def _documents(self, rows):
+        placeholders = ",".join("?" * len(rows))
+        with self._lock:
+            found = {
+                row: Document(page_content=text, metadata=json.loads(metadata))
+                for row, text, metadata in self._conn.execute(
+                    f"SELECT row, text, metadata FROM docs WHERE row IN ({placeholders})", rows
+                )
+            }
+        return [found[row] for row in rows]
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, **kwargs):
+        hits = self.search_by_vector(embedding, k)
+        if not hits:
+            return []
+        docs = self._documents([row for row, _ in hits])
+        return [(doc, distance) for doc, (_, distance) in zip(docs, hits)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_relevance_scores(self.embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k)]
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        return {
+            "cosine": self._cosine_relevance_score_fn,
+            "ip": self._max_inner_product_relevance_score_fn,
+        }.get(self.space, self._euclidean_relevance_score_fn)
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, directory=None, **kwargs):
+        store = cls(directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+    def persist(self):
+        # Writes are durable once add/delete return; kept for the Chroma-style call in index_document
+        pass
+
+    def stats(self):
+        self._refresh()
+        with self._lock:
+            disk = sum(
+                os.path.getsize(self._path(name)) for name in os.listdir(self.directory)
+                if os.path.isfile(self._path(name))
+            )
+            return {
+                "quantization": self.quantization,
+                "space": self.space,
+                "rows": self._size,
+                "live_rows": int(self._alive[:self._size].sum()) if self._size else 0,
+                "dim": self.dim,
+                "memory_bytes": int(self._codes[:self._size].nbytes + self._meta[:self._size].nbytes) if self._size else 0,
+                "float32_bytes": self._size * (self.dim or 0) * 4,
+                "disk_bytes": disk,
+            }
+
+    def close(self):
+        with self._lock:
+            self._vectors = None
+            self._conn.close()
+
+    def drop(self):
+        # Removes the whole collection from disk
+        self.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -1,35 +1,477 @@
 
 # Defines the RAG chain
 
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings.huggingface import HuggingFaceEmbeddings
-from langchain_google_genai import ChatGoogleGenerativeAI
+import importlib
+import os
+import shutil
+import threading
+import time
+
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain import hub
+from langchain_core.runnables import RunnableLambda, RunnablePassthrough
+from rag_module.prompts import rag_prompt
+from rag_module.embedding_batcher import BatchingEmbeddings, get_batch_size, get_batch_wait_ms
+from rag_module.embedding_cache import EmbeddingCache, CachedEmbeddings, get_cache_max_entries
+from rag_module.answer_cache import AnswerCache, IndexVersions
+from rag_module.retrieval import ScopedRetriever, CorpusRetriever, file_collection_name, retrieval_confidence
+from rag_module.quantized_store import QuantizedVectorStore, get_rescore_factor
+from rag_module.context_packing import pack_context
+from rag_module.tokens import get_tokenizer, token_usage
+from rag_module.tracing import tracer
+from collections import OrderedDict
 from dotenv import load_dotenv
 load_dotenv()
 
-def get_embedding():
-    return HuggingFaceEmbeddings(model_name="BAAI/bge-small-en-v1.5")
-prompt = hub.pull("rlm/rag-prompt")
-llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash-latest")
+prompt = rag_prompt
 parser = StrOutputParser()
 
+# Heavy imports (chromadb, sentence-transformers/torch, Google client) are deferred to first use,
+# so importing this module stays fast and needs no network
+_LAZY_IMPORTS = {
+    "Chroma": ("langchain_community.vectorstores", "Chroma"),
+    "HuggingFaceEmbeddings": ("langchain_community.embeddings.huggingface", "HuggingFaceEmbeddings"),
+    "ChatGoogleGenerativeAI": ("langchain_google_genai", "ChatGoogleGenerativeAI"),
+    "NotFoundError": ("chromadb.errors", "NotFoundError"),
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        module, attr = _LAZY_IMPORTS[name]
+        value = getattr(importlib.import_module(module), attr)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _lazy(name):
+    # Module attribute if already imported (or patched in tests), else imports it
+    return globals().get(name) or __getattr__(name)
+
+# Process-wide singletons, shared by every request in this worker.
+# They are rebuilt only when the configuration they were built from changes.
+_lock = threading.RLock()
+_embedding = None
+_embedding_config = None
+_embedding_cache = None
+_embedding_cache_config = None
+_batcher = None
+_batcher_config = None
+_vectorstore = None
+_vectorstore_config = None
+_file_vectorstores = OrderedDict()
+MAX_OPEN_FILE_STORES = 1024
+_chain = None
+_chain_config = None
+_answer_cache = None
+_answer_cache_config = None
+_llm = None
+_llm_config = None
+_warmup = {"ready": False, "error": None, "timings": {}, "attempts": 0}
+
+
+def get_embedding_model_name():
+    return os.getenv("EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5")
+
+
+def get_llm_model_name():
+    return os.getenv("LLM_MODEL", "gemini-1.5-flash-latest")
+
+
+def get_warmup_enabled():
+    return os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+
+
+def get_warmup_retry_delays():
+    # First and largest pause (seconds) between attempts after a failed warm-up
+    return float(os.getenv("WARMUP_RETRY_DELAY", "2")), float(os.getenv("WARMUP_RETRY_MAX_DELAY", "60"))
+
+
+def get_persist_dir():
+    return os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
+
+
+def get_hnsw_config():
+    # Collection-level HNSW settings (Chroma defaults). space, M and construction_ef only apply
+    # when a collection is created. search_ef is left at Chroma's default (100) unless
+    # HNSW_SEARCH_EF is set, in which case it is also applied to existing collections.
+    config = {
+        "hnsw:space": os.getenv("HNSW_SPACE", "l2"),
+        "hnsw:M": int(os.getenv("HNSW_M", "16")),
+        "hnsw:construction_ef": int(os.getenv("HNSW_CONSTRUCTION_EF", "100")),
+    }
+    if os.getenv("HNSW_SEARCH_EF"):
+        config["hnsw:search_ef"] = int(os.getenv("HNSW_SEARCH_EF"))
+    return config
+
+
+def get_vector_mode():
+    # "chroma" (HNSW over float32 vectors) or a compact QuantizedVectorStore: "int8" or "binary"
+    return os.getenv("VECTOR_STORE_MODE", "chroma").lower()
+
+
+def get_retriever_k():
+    return int(os.getenv("RETRIEVER_K", "4"))
+
+
+def apply_search_ef(store, search_ef=None):
+    # Existing collections keep the graph they were built with, but ef_search can be changed.
+    # Chroma reads it when the index is loaded, i.e. on first use after the process starts.
+    # Without a configured search_ef the collection keeps whatever it has.
+    collection = store._collection
+    try:
+        built = collection.metadata or {}
+        if built.get("hnsw:space", "l2") != get_hnsw_config()["hnsw:space"]:
+            print(f"⚠️  Collection {collection.name} uses {built.get('hnsw:space', 'l2')} distance; "
+                  f"re-index it to apply HNSW_SPACE")
+        current = (collection.configuration or {}).get("hnsw") or {}
+        if search_ef is not None and current.get("ef_search") != search_ef:
+            collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+    except Exception as e:
+        print(f"❌ Could not set search_ef on {collection.name}: {e}")
+    return store
+
+
+def open_collection(**kwargs):
+    # Chroma store with the configured HNSW settings, or the quantized store of the same name
+    hnsw = get_hnsw_config()
+    mode = get_vector_mode()
+    if mode != "chroma":
+        return QuantizedVectorStore(
+            os.path.join(get_persist_dir(), "quantized", kwargs.get("collection_name", "langchain")),
+            get_batching_embedding(),
+            quantization=mode,
+            space=hnsw["hnsw:space"],
+            rescore_factor=get_rescore_factor()
+        )
+    store = _lazy("Chroma")(
+        collection_metadata=hnsw,
+        embedding_function=get_batching_embedding(),
+        persist_directory=get_persist_dir(),
+        **kwargs
+    )
+    return apply_search_ef(store, hnsw.get("hnsw:search_ef"))
+
+
+def get_embedding():
+    # Returns the shared embedding model, loading the weights only once
+    global _embedding, _embedding_config
+    config = get_embedding_model_name()
+    if _embedding is not None and _embedding_config == config:
+        return _embedding
+    with _lock:
+        if _embedding is None or _embedding_config != config:
+            _embedding = _lazy("HuggingFaceEmbeddings")(model_name=config)
+            _embedding_config = config
+        return _embedding
+
+
+def get_embedding_cache_path():
+    return os.getenv(
+        "EMBED_CACHE_PATH",
+        os.path.join(get_persist_dir(), "embedding_cache.sqlite3")
+    )
+
+
+def get_embedding_cache():
+    # Returns the shared on-disk cache of chunk embeddings
+    global _embedding_cache, _embedding_cache_config
+    config = (get_embedding_cache_path(), get_cache_max_entries())
+    if _embedding_cache is not None and _embedding_cache_config == config:
+        return _embedding_cache
+    with _lock:
+        if _embedding_cache is None or _embedding_cache_config != config:
+            if _embedding_cache is not None:
+                _embedding_cache.close()
+            _embedding_cache = EmbeddingCache(config[0], max_entries=config[1])
+            _embedding_cache_config = config
+        return _embedding_cache
+
+
+def get_batching_embedding():
+    # Returns the shared micro-batching layer in front of the embedding model
+    global _batcher, _batcher_config
+    config = (
+        get_embedding_model_name(), get_batch_size(), get_batch_wait_ms(),
+        get_embedding_cache_path(), get_cache_max_entries()
+    )
+    if _batcher is not None and _batcher_config == config:
+        return _batcher
+    with _lock:
+        if _batcher is None or _batcher_config != config:
+            # Chunks being indexed go through the content-addressed cache, queries do not
+            _batcher = BatchingEmbeddings(
+                get_embedding(),
+                max_batch_size=config[1],
+                max_wait_ms=config[2],
+                document_base=CachedEmbeddings(get_embedding(), get_embedding_cache(), config[0])
+            )
+            _batcher_config = config
+        return _batcher
+
+
 def get_vectorstore():
-    # Loads existing Chroma vector store from disk
-    embedding = get_embedding()
-    return Chroma(
-        embedding_function=embedding,
-        persist_directory="./chroma_db"
+    # Returns the shared vector store persisted on disk
+    global _vectorstore, _vectorstore_config
+    config = (
+        get_persist_dir(), get_batching_embedding(), tuple(get_hnsw_config().items()),
+        get_vector_mode(), get_rescore_factor()
     )
+    if _vectorstore is not None and _vectorstore_config == config:
+        return _vectorstore
+    with _lock:
+        if _vectorstore is None or _vectorstore_config != config:
+            os.makedirs(get_persist_dir(), exist_ok=True)
+            _vectorstore = open_collection()
+            _vectorstore_config = config
+            _close_file_vectorstores()
+        return _vectorstore
+
+
+def _close_file_vectorstore(store):
+    # Quantized stores hold a SQLite connection and a memory map each; Chroma collections share the client
+    if isinstance(store, QuantizedVectorStore):
+        store.close()
+
+
+def _close_file_vectorstores():
+    for store in _file_vectorstores.values():
+        _close_file_vectorstore(store)
+    _file_vectorstores.clear()
+
+
+class UnknownFileError(LookupError):
+    # A file_key with no indexed collection: never uploaded, deleted or mistyped
+    pass
+
+
+def file_vectorstore_exists(file_id):
+    # Looks the collection up without creating it
+    vectorstore = get_vectorstore()
+    name = file_collection_name(file_id)
+    if isinstance(vectorstore, QuantizedVectorStore):
+        return QuantizedVectorStore.exists(os.path.join(get_persist_dir(), "quantized", name))
+    try:
+        vectorstore._client.get_collection(name)
+        return True
+    except (ValueError, _lazy("NotFoundError")):
+        return False
+
+
+def unknown_file_ids(file_ids):
+    return [file_id for file_id in file_ids
+            if str(file_id) not in _file_vectorstores and not file_vectorstore_exists(file_id)]
+
+
+def get_file_vectorstore(file_id, create=False):
+    # Returns the per-file collection, sharing the Chroma client and embedding of the main store.
+    # Only indexing creates one; on the read path an unknown file raises UnknownFileError
+    vectorstore = get_vectorstore()
+    file_id = str(file_id)
+    with _lock:
+        store = _file_vectorstores.get(file_id)
+        if store is None:
+            if not create and not file_vectorstore_exists(file_id):
+                raise UnknownFileError(file_id)
+            store = open_collection(
+                client=getattr(vectorstore, "_client", None), collection_name=file_collection_name(file_id)
+            )
+            _file_vectorstores[file_id] = store
+            if len(_file_vectorstores) > MAX_OPEN_FILE_STORES:
+                _close_file_vectorstore(_file_vectorstores.popitem(last=False)[1])
+        else:
+            _file_vectorstores.move_to_end(file_id)
+        return store
+
+
+def drop_file_vectorstore(file_id):
+    # Deletes a file's own collection (used when its ingestion is rolled back)
+    vectorstore = get_vectorstore()
+    with _lock:
+        store = _file_vectorstores.pop(str(file_id), None)
+        try:
+            if isinstance(vectorstore, QuantizedVectorStore):
+                if store is not None:
+                    store.drop()
+                else:
+                    shutil.rmtree(os.path.join(get_persist_dir(), "quantized", file_collection_name(file_id)))
+            else:
+                vectorstore._client.delete_collection(file_collection_name(file_id))
+        except (FileNotFoundError, ValueError, _lazy("NotFoundError")):
+            pass  # Collection was never created
+        except Exception as e:
+            # Left behind, the collection would make the file look indexed to unknown_file_ids
+            print(f"❌ Failed to drop the collection of {file_id}: {e}")
+            raise
+
+
+def normalize_file_ids(file_key):
+    # Accepts a single file_id, a comma-separated string or a list and returns a sorted tuple
+    if not file_key:
+        return ()
+    if isinstance(file_key, str):
+        file_key = file_key.split(",")
+    return tuple(sorted({str(f).strip() for f in file_key if str(f).strip()}))
+
+
+def get_retriever(file_ids=()):
+    # Retriever over the whole corpus, or over only the given files' collections
+    k = get_retriever_k()
+    if not file_ids:
+        return CorpusRetriever(store=get_vectorstore(), k=k)
+    return ScopedRetriever(
+        file_ids=tuple(file_ids),
+        get_store=get_file_vectorstore,
+        embedding=get_batching_embedding(),
+        k=k
+    )
+
+
+def get_chain(file_ids=()):
+    # Returns the RAG chain; the unscoped one is shared, scoped ones are cheap to compose per request
+    global _chain, _chain_config
+    if file_ids:
+        return create_chain_from_retriever(get_retriever(file_ids))
+    config = (get_vectorstore(), get_retriever_k())
+    if _chain is not None and _chain_config == config:
+        return _chain
+    with _lock:
+        if _chain is None or _chain_config != config:
+            _chain = create_chain_from_retriever(get_retriever())
+            _chain_config = config
+        return _chain
+
+
+def get_llm():
+    # Returns the shared Gemini chat model, created on first use
+    global _llm, _llm_config
+    config = get_llm_model_name()
+    if _llm is not None and _llm_config == config:
+        return _llm
+    with _lock:
+        if _llm is None or _llm_config != config:
+            _llm = _lazy("ChatGoogleGenerativeAI")(model=config)
+            _llm_config = config
+        return _llm
+
+
+def get_answer_cache():
+    # Returns the shared /query answer cache; index versions live next to the vector store
+    global _answer_cache, _answer_cache_config
+    config = get_persist_dir()
+    if _answer_cache is not None and _answer_cache_config == config:
+        return _answer_cache
+    with _lock:
+        if _answer_cache is None or _answer_cache_config != config:
+            _answer_cache = AnswerCache(IndexVersions(os.path.join(config, "index_versions")))
+            _answer_cache_config = config
+        return _answer_cache
+
+
+def reset_singletons():
+    # Drops the shared instances so the next call rebuilds them (tests, config reloads)
+    global _embedding, _embedding_config, _embedding_cache, _embedding_cache_config
+    global _batcher, _batcher_config, _vectorstore, _vectorstore_config, _chain, _chain_config
+    global _answer_cache, _answer_cache_config, _llm, _llm_config
+    with _lock:
+        _embedding = _embedding_config = None
+        if _embedding_cache is not None:
+            _embedding_cache.close()
+        _embedding_cache = _embedding_cache_config = None
+        _batcher = _batcher_config = None
+        _vectorstore = _vectorstore_config = None
+        _close_file_vectorstores()
+        _chain = _chain_config = None
+        _answer_cache = _answer_cache_config = None
+        _llm = _llm_config = None
+        _warmup.update(ready=False, error=None, timings={}, attempts=0)
+
+
+def warm_up():
+    # Loads everything the first query would otherwise pay for; readiness flips once it is all in place
+    timings = {}
+    _warmup["attempts"] += 1
+    steps = [
+        ("embedding_model", lambda: get_embedding().embed_query("warm up")),
+        ("vectorstore", get_vectorstore),
+        ("llm", get_llm),
+        ("chain", get_chain),
+        ("answer_cache", get_answer_cache),
+        ("tokenizer", get_tokenizer),
+    ]
+    try:
+        for name, step in steps:
+            start = time.perf_counter()
+            step()
+            timings[name] = round(time.perf_counter() - start, 3)
+        _warmup.update(ready=True, error=None, timings=timings)
+    except Exception as e:
+        _warmup.update(ready=False, error=str(e), timings=timings)
+        raise
+    return timings
+
+
+def warm_up_with_retry(sleep=time.sleep):
+    # Keeps retrying with exponential backoff, so a failure at boot (model hub or Gemini briefly
+    # unreachable) does not leave the service unready until it is restarted
+    delay, max_delay = get_warmup_retry_delays()
+    while True:
+        try:
+            return warm_up()
+        except Exception as e:
+            print(f"⚠️ Warm-up attempt {_warmup['attempts']} failed ({e}); retrying in {delay:g}s")
+        sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+
+def readiness():
+    state = {"ready": _warmup["ready"], "error": _warmup["error"], "timings": dict(_warmup["timings"]),
+             "attempts": _warmup["attempts"]}
+    if not get_warmup_enabled():
+        # Nothing is preloaded; the first query loads the models itself
+        state.update(ready=True, warm_up="disabled")
+    return state
+
+
+def create_answer_chain():
+    # Prompt -> LLM over context that was already retrieved. Yields AI messages rather than
+    # text so the caller gets Gemini's usage metadata (streaming chunks add up with +).
+    return prompt | get_llm()
+
+
+def prompt_text(inputs):
+    return prompt.invoke({"context": inputs["context"], "question": inputs["question"]}).to_string()
+
+
+@tracer.traced("prompt_build")
+def pack_docs(inputs):
+    # Retrieved chunks -> prompt inputs, with the packing report and retrieval confidence
+    context, report = pack_context(inputs["docs"])
+    return {
+        "context": context,
+        "question": inputs["question"],
+        "packing": report,
+        "confidence": retrieval_confidence(inputs["docs"]),
+    }
+
+
+def call_llm(inputs):
+    with tracer.span("llm_call"):
+        return create_answer_chain().invoke(inputs)
+
+
+def finish_answer(inputs):
+    answer = parser.invoke(inputs["message"])
+    usage = token_usage(inputs["message"], prompt_text(inputs), answer)
+    return {key: value for key, value in inputs.items() if key != "message"} | {"answer": answer, "usage": usage}
+
 
 def create_chain_from_retriever(retriever):
-    # Builds the RAG chain from the retriever, prompt, LLM, and parser.
-    def format_docs(docs): return "\n".join(doc.page_content for doc in docs)
+    # Builds the RAG chain from the retriever, context packing, prompt, LLM, and parser.
+    # Returns {"answer", "usage", "confidence", "packing", "context", "question"}.
     return (
-        {"context": retriever | format_docs, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-        | parser
+        {"docs": retriever, "question": RunnablePassthrough()}
+        | RunnableLambda(pack_docs)
+        | RunnablePassthrough.assign(message=RunnableLambda(call_llm))
+        | RunnableLambda(finish_answer)
     )
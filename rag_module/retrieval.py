@@ -0,0 +1,91 @@
+
+# Retrieval scoped to one or more uploaded files, each stored in its own Chroma collection.
+
+import math
+import re
+from typing import Any, Callable, List, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from rag_module.tracing import tracer
+
+
+def file_collection_name(file_id):
+    # Chroma collection names: 3-512 chars of [a-zA-Z0-9._-], starting and ending alphanumeric
+    safe = re.sub(r"[^A-Za-z0-9._-]", "_", str(file_id)).strip("._-")
+    return f"file-{safe or 'unknown'}"[:512]
+
+
+def chunk_id(doc):
+    # Stable id of a retrieved chunk, assigned by index_document
+    metadata = doc.metadata or {}
+    if metadata.get("chunk_id"):
+        return metadata["chunk_id"]
+    return f"{metadata.get('source', 'unknown')}#page={metadata.get('page', '?')}"
+
+
+def relevance(store, distance):
+    # Distance -> 0..1 relevance with the store's own function for its distance space
+    try:
+        score = float(store._select_relevance_score_fn()(distance))
+    except Exception:
+        score = 1.0 - float(distance) / math.sqrt(2)
+    return min(max(score, 0.0), 1.0)
+
+
+def scored(store, hits):
+    # Keeps each hit's relevance in its metadata, for confidence reporting
+    for doc, distance in hits:
+        doc.metadata = {**(doc.metadata or {}), "relevance_score": round(relevance(store, distance), 4)}
+    return hits
+
+
+def retrieval_confidence(docs):
+    # Rank-discounted mean relevance of the retrieved chunks (weights 1, 1/2, 1/3, ...); 0 if none
+    weighted = [
+        (1 / (rank + 1), doc.metadata["relevance_score"])
+        for rank, doc in enumerate(docs) if (doc.metadata or {}).get("relevance_score") is not None
+    ]
+    if not weighted:
+        return 0.0
+    return round(sum(w * s for w, s in weighted) / sum(w for w, _ in weighted), 4)
+
+
+class CorpusRetriever(BaseRetriever):
+    # Top-k over the whole corpus store, with relevance scores on the returned chunks
+
+    store: Any
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # The store embeds the question itself; embed_query shows up as a child span
+        with tracer.span("vector_search", k=self.k):
+            hits = self.store.similarity_search_with_score(query, k=self.k)
+        return [doc for doc, _ in scored(self.store, hits)]
+
+
+class ScopedRetriever(BaseRetriever):
+    # Embeds the question once, searches each file's collection and merges the top-k hits.
+    # Cost depends on the size of the requested files, not on the whole corpus.
+
+    file_ids: Tuple[str, ...]
+    get_store: Callable[[str], Any]
+    embedding: Any
+    k: int = 4
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector = self.embedding.embed_query(query)
+        hits = []
+        with tracer.span("vector_search", k=self.k, files=len(self.file_ids)):
+            for file_id in self.file_ids:
+                store = self.get_store(file_id)
+                hits.extend(scored(store, store.similarity_search_by_vector_with_relevance_scores(vector, k=self.k)))
+        # Chroma returns distances, lower is closer
+        hits.sort(key=lambda hit: hit[1])
+        return [doc for doc, _ in hits[:self.k]]
@@ -0,0 +1,82 @@
+# Token accounting for the query path: Gemini's own usage metadata when the response has it,
+# otherwise a count from a local tokenizer, otherwise a character-based estimate.
+
+import os
+import threading
+
+_lock = threading.Lock()
+_tokenizer = None
+_tokenizer_config = None
+
+
+def get_tokenizer_model():
+    # Gemini's tokenizer is not available offline; the embedding model's one is already on disk
+    return os.getenv("TOKENIZER_MODEL", os.getenv("EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5"))
+
+
+def estimate_tokens(text):
+    # Gemini averages about 4 characters per token on English text
+    return (len(text) + 3) // 4
+
+
+def get_tokenizer():
+    # Returns the local tokenizer, or None if it cannot be loaded (tried once per model name)
+    global _tokenizer, _tokenizer_config
+    config = get_tokenizer_model()
+    if _tokenizer_config == config:
+        return _tokenizer
+    with _lock:
+        if _tokenizer_config != config:
+            try:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(config)
+            except Exception as e:
+                print(f"❌ Tokenizer {config} unavailable, estimating tokens from length: {e}")
+                _tokenizer = None
+            _tokenizer_config = config
+        return _tokenizer
+
+
+def count_tokens(text):
+    # Returns (tokens, source) with source "tokenizer" or "estimate"
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        try:
+            return len(tokenizer.encode(text, add_special_tokens=False)), "tokenizer"
+        except Exception:
+            pass
+    return estimate_tokens(text), "estimate"
+
+
+def message_text(message):
+    # Text of an AI message or stream chunk; Gemini content may be a list of parts
+    content = getattr(message, "content", message)
+    if isinstance(content, list):
+        return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+    return content or ""
+
+
+def token_usage(message, prompt_text, answer_text):
+    # {"prompt_tokens", "completion_tokens", "total_tokens", "source"} for one LLM call
+    usage = getattr(message, "usage_metadata", None) or {}
+    if usage.get("total_tokens"):
+        return {
+            "prompt_tokens": int(usage.get("input_tokens", 0)),
+            "completion_tokens": int(usage.get("output_tokens", 0)),
+            "total_tokens": int(usage["total_tokens"]),
+            "source": "gemini",
+        }
+    prompt_tokens, source = count_tokens(prompt_text)
+    completion_tokens, _ = count_tokens(answer_text)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "source": source,
+    }
+
+
+def reset_tokenizer():
+    global _tokenizer, _tokenizer_config
+    with _lock:
+        _tokenizer = _tokenizer_config = None
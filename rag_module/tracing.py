@@ -0,0 +1,354 @@
+# Lightweight in-process tracing for the query and upload pipelines.
+# tracer.trace() opens a request's root span; tracer.span() nests stages under it, all sharing the
+# root's run_id/file_id. Finished spans feed a per-stage latency breakdown and, if TRACE_EXPORT is
+# set, are written in the background as JSON lines and/or OTLP/HTTP JSON to a local collector.
+
+import contextvars
+import functools
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from collections import deque
+from contextlib import contextmanager
+
+# Stage spans outside any trace (warm-up, scripts, tests) are not recorded
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+def get_trace_exporters():
+    # Comma-separated: "jsonl", "otlp"; empty keeps spans in memory for the breakdown only
+    return {name.strip().lower() for name in os.getenv("TRACE_EXPORT", "").split(",") if name.strip()}
+
+
+def get_trace_file():
+    return os.getenv("TRACE_FILE", os.path.join("traces", "spans.jsonl"))
+
+
+def get_otlp_endpoint():
+    return os.getenv("OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+
+
+def get_service_name():
+    return os.getenv("OTEL_SERVICE_NAME", "pdf-rag")
+
+
+def get_trace_window():
+    # Recent durations kept per stage for the percentiles
+    return int(os.getenv("TRACE_WINDOW", "2000"))
+
+
+def get_trace_queue_size():
+    return int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(int(len(ordered) * q), len(ordered) - 1)], 3)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent", "name", "pipeline", "shared", "attributes",
+                 "start_ns", "_start", "duration_ms", "children_ms", "error")
+
+    def __init__(self, name, parent=None, **attributes):
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.name = name
+        self.pipeline = parent.pipeline if parent else name
+        # run_id/file_id given to the root are carried by every span of the trace
+        self.shared = parent.shared if parent else attributes
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.duration_ms = None
+        self.children_ms = 0.0
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        if self.parent is not None and self.parent.duration_ms is None:
+            self.parent.children_ms += self.duration_ms
+
+    @property
+    def self_ms(self):
+        # Time not covered by child spans; children running concurrently can make it 0
+        return max(self.duration_ms - self.children_ms, 0.0)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "pipeline": self.pipeline,
+            "service": get_service_name(),
+            "start": self.start_ns / 1e9,
+            "duration_ms": round(self.duration_ms, 3),
+            "self_ms": round(self.self_ms, 3),
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": {**self.shared, **self.attributes},
+        }
+
+
+class Tracer:
+    # Per-stage durations for /metrics/stages plus the background exporter
+
+    def __init__(self, window=None):
+        self.window = window or get_trace_window()
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._exporter = None
+
+    @contextmanager
+    def trace(self, name, **attributes):
+        # Root span of one request; nested spans (also in run_blocking threads) attach to it
+        with self._open(Span(name, **attributes)) as span:
+            yield span
+
+    @contextmanager
+    def span(self, name, **attributes):
+        parent = _current.get()
+        if parent is None:
+            yield None
+            return
+        with self._open(Span(name, parent, **attributes)) as span:
+            yield span
+
+    @contextmanager
+    def _open(self, span):
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # A streaming response closed from another context; the span still ends below
+                pass
+            span.end()
+            self._finish(span)
+
+    def traced(self, name):
+        # Decorator form of span()
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def _finish(self, span):
+        with self._lock:
+            stage = self._stages.get((span.pipeline, span.name))
+            if stage is None:
+                stage = self._stages[(span.pipeline, span.name)] = {
+                    "count": 0, "errors": 0, "self_sum": 0.0, "duration_sum": 0.0,
+                    "root": span.parent is None,
+                    "durations": deque(maxlen=self.window),
+                }
+            stage["count"] += 1
+            stage["errors"] += 1 if span.error else 0
+            stage["duration_sum"] += span.duration_ms
+            stage["self_sum"] += span.self_ms
+            stage["durations"].append(span.duration_ms)
+        if get_trace_exporters():
+            self._get_exporter().export(span.to_dict())
+
+    def _get_exporter(self):
+        with self._lock:
+            if self._exporter is None:
+                self._exporter = SpanExporter()
+            return self._exporter
+
+    def breakdown(self):
+        # {pipeline: {count, p50_ms, p95_ms, stages: {name: latency + share of the pipeline's time}}}
+        with self._lock:
+            stages = {key: {**value, "durations": list(value["durations"])} for key, value in self._stages.items()}
+        pipelines = {}
+        for (pipeline, name), stage in stages.items():
+            entry = pipelines.setdefault(pipeline, {"count": 0, "avg_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0,
+                                                    "stages": {}})
+            if stage["root"] and name == pipeline:
+                entry.update(
+                    count=stage["count"],
+                    avg_ms=round(stage["duration_sum"] / stage["count"], 3),
+                    p50_ms=percentile(stage["durations"], 0.5),
+                    p95_ms=percentile(stage["durations"], 0.95),
+                )
+            entry["stages"][name] = {
+                "count": stage["count"],
+                "errors": stage["errors"],
+                "avg_ms": round(stage["duration_sum"] / stage["count"], 3),
+                "p50_ms": percentile(stage["durations"], 0.5),
+                "p95_ms": percentile(stage["durations"], 0.95),
+                "self_avg_ms": round(stage["self_sum"] / stage["count"], 3),
+                "_self_sum": stage["self_sum"],
+            }
+        for pipeline, entry in pipelines.items():
+            # Share of the pipeline's time spent in each stage itself, children excluded
+            total = sum(stage["_self_sum"] for stage in entry["stages"].values())
+            for stage in entry["stages"].values():
+                self_sum = stage.pop("_self_sum")
+                stage["share"] = round(self_sum / total, 4) if total else 0
+        return pipelines
+
+    def export_stats(self):
+        return self._exporter.stats() if self._exporter else {"exported": 0, "dropped": 0, "failed": 0}
+
+    def flush(self):
+        if self._exporter is not None:
+            self._exporter.flush()
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+class SpanExporter:
+    # Finished spans go to a bounded queue; a daemon thread writes them in batches so exporting never
+    # slows a request. When the queue is full (collector down) spans are dropped and counted.
+
+    def __init__(self, batch_size=512, interval=1.0):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._queue = queue.Queue(maxsize=get_trace_queue_size())
+        self._lock = threading.Lock()
+        self._worker = None
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def export(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get()]
+            except Exception:
+                return
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def flush(self):
+        # Writes whatever is queued from the calling thread, then waits for the worker's batch (shutdown, tests)
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+        self._queue.join()
+
+    def _write(self, spans):
+        exporters = get_trace_exporters()
+        try:
+            if "jsonl" in exporters:
+                write_jsonl(get_trace_file(), spans)
+            if "otlp" in exporters:
+                post_otlp(get_otlp_endpoint(), spans)
+            self.exported += len(spans)
+        except Exception as e:
+            self.failed += len(spans)
+            print(f"❌ Failed to export {len(spans)} spans: {e}")
+        finally:
+            for _ in spans:
+                self._queue.task_done()
+
+    def stats(self):
+        return {"exported": self.exported, "dropped": self.dropped, "failed": self.failed,
+                "queued": self._queue.qsize()}
+
+
+def write_jsonl(path, spans):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "a") as f:
+        for span in spans:
+            f.write(json.dumps(span, default=str) + "\n")
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans):
+    # OTLP/HTTP JSON request body (ids as hex, times as unix nanoseconds)
+    by_service = {}
+    for span in spans:
+        start = int(span["start"] * 1e9)
+        by_service.setdefault(span["service"], []).append({
+            "traceId": span["trace_id"],
+            "spanId": span["span_id"],
+            "parentSpanId": span["parent_id"] or "",
+            "name": span["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int(span["duration_ms"] * 1e6)),
+            "attributes": [
+                {"key": key, "value": otlp_value(value)}
+                for key, value in {**span["attributes"], "pipeline": span["pipeline"]}.items() if value is not None
+            ],
+            "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 1},
+        })
+    return {"resourceSpans": [
+        {
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+            "scopeSpans": [{"scope": {"name": "rag_module.tracing"}, "spans": service_spans}],
+        }
+        for service, service_spans in by_service.items()
+    ]}
+
+
+def post_otlp(endpoint, spans):
+    request = urllib.request.Request(
+        endpoint, data=json.dumps(to_otlp(spans)).encode("utf-8"),
+        headers={"Content-Type": "application/json"}, method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=5) as response:
+        response.read()
+
+
+tracer = Tracer()
@@ -0,0 +1,78 @@
+# Creates the per-file collections used by scoped /query for files indexed before they existed.
+# Chunks are copied from the corpus collection with their stored embeddings (nothing is re-embedded).
+# Old chunks have no file_id metadata; it is recovered from their source path (uploads/<file_id>.pdf)
+# and written back to the corpus so delete_document and the answer cache see it too.
+#
+#     python -m scripts.backfill_file_collections
+#
+# Run it in chroma mode, before scripts.migrate_to_quantized if switching VECTOR_STORE_MODE.
+
+import os
+import uuid
+
+import chromadb
+
+from rag_module.rag_chain import get_persist_dir, get_vector_mode, get_hnsw_config
+from rag_module.retrieval import file_collection_name
+
+CORPUS_COLLECTION = "langchain"
+PAGE_SIZE = 5000
+
+
+def chunk_file_id(metadata):
+    # file_id tag, else the upload's uuid file name; None for chunks that belong to no upload
+    if metadata.get("file_id"):
+        return str(metadata["file_id"])
+    stem = os.path.splitext(os.path.basename(str(metadata.get("source", ""))))[0]
+    try:
+        return str(uuid.UUID(stem))
+    except ValueError:
+        return None
+
+
+def backfill():
+    if get_vector_mode() != "chroma":
+        raise SystemExit("❌ Run with VECTOR_STORE_MODE=chroma, then migrate_to_quantized")
+    client = chromadb.PersistentClient(path=get_persist_dir())
+    corpus = client.get_collection(CORPUS_COLLECTION)
+    existing = {c if isinstance(c, str) else c.name for c in client.list_collections()}
+    copied, tagged, skipped = {}, 0, 0
+    offset = 0
+    while True:
+        page = corpus.get(limit=PAGE_SIZE, offset=offset, include=["embeddings", "documents", "metadatas"])
+        if not page["ids"]:
+            break
+        offset += len(page["ids"])
+        by_file, retag = {}, ([], [])
+        for i, chunk_id in enumerate(page["ids"]):
+            metadata = page["metadatas"][i] or {}
+            file_id = chunk_file_id(metadata)
+            if file_id is None:
+                skipped += 1
+                continue
+            if not metadata.get("file_id"):
+                metadata = {**metadata, "file_id": file_id}
+                retag[0].append(chunk_id)
+                retag[1].append(metadata)
+            by_file.setdefault(file_id, []).append((chunk_id, page["embeddings"][i], page["documents"][i], metadata))
+        if retag[0]:
+            corpus.update(ids=retag[0], metadatas=retag[1])
+            tagged += len(retag[0])
+        for file_id, chunks in by_file.items():
+            name = file_collection_name(file_id)
+            # Files indexed since per-file collections exist already have theirs
+            if name in existing and file_id not in copied:
+                continue
+            collection = client.get_or_create_collection(name, metadata=get_hnsw_config())
+            collection.upsert(
+                ids=[c[0] for c in chunks], embeddings=[c[1] for c in chunks],
+                documents=[c[2] for c in chunks], metadatas=[c[3] for c in chunks]
+            )
+            copied[file_id] = copied.get(file_id, 0) + len(chunks)
+    print(f"✅ Created {len(copied)} file collections ({sum(copied.values())} chunks), "
+          f"tagged {tagged} chunks with file_id, skipped {skipped} without one")
+    return {"files": len(copied), "chunks": sum(copied.values()), "tagged": tagged, "skipped": skipped}
+
+
+if __name__ == "__main__":
+    backfill()
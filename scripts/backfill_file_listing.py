@@ -0,0 +1,36 @@
+# Prepares an existing PDF_Metadata table for the paginated /list:
+# tags items saved before the uploaded_at-index existed and recounts the files.
+#
+#     python -m scripts.backfill_file_listing
+
+from aws_service.dynamo_handler import table, LISTING_PARTITION, FILE_COUNT_ID
+
+
+def backfill():
+    tagged = 0
+    files = 0
+    kwargs = {"ProjectionExpression": "file_id, listing, uploaded_at"}
+    while True:
+        response = table.scan(**kwargs)
+        for item in response.get("Items", []):
+            if item["file_id"] == FILE_COUNT_ID:
+                continue
+            files += 1
+            if item.get("listing") != LISTING_PARTITION and item.get("uploaded_at"):
+                table.update_item(
+                    Key={"file_id": item["file_id"]},
+                    UpdateExpression="SET listing = :listing",
+                    ExpressionAttributeValues={":listing": LISTING_PARTITION}
+                )
+                tagged += 1
+        if "LastEvaluatedKey" not in response:
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    table.put_item(Item={"file_id": FILE_COUNT_ID, "file_count": files})
+    print(f"✅ Tagged {tagged} files for listing, total is now {files}")
+    return {"tagged": tagged, "total": files}
+
+
+if __name__ == "__main__":
+    backfill()
@@ -0,0 +1,21 @@
+# Rebuilds LLM_Metrics_Aggregates from the raw LLM_Metrics table (paginated scan).
+# Run after creating the aggregates table on an existing deployment, or to repair drift;
+# metrics ingested while it runs may be missed, so run it while ingestion is quiet.
+#
+#     python -m scripts.backfill_metrics_aggregates
+
+from aws_service.aws_client import get_resource
+from aws_service.metrics_aggregates import AGGREGATES_TABLE, rebuild
+
+dynamodb = get_resource("dynamodb")
+
+
+def backfill():
+    result = rebuild(dynamodb.Table("LLM_Metrics"), dynamodb.Table(AGGREGATES_TABLE))
+    print(f"✅ Rebuilt {result['aggregates']} aggregates from {result['scanned']} metrics "
+          f"({result['removed']} stale aggregates removed)")
+    return result
+
+
+if __name__ == "__main__":
+    backfill()
@@ -0,0 +1,37 @@
+# Adds time_bucket to QueryLog items written before the time_bucket-timestamp-index existed,
+# so they show up in /query-log.
+#
+#     python -m scripts.backfill_query_log_buckets
+
+from aws_service.aws_client import get_resource
+
+dynamodb = get_resource("dynamodb")
+
+
+def backfill():
+    table = dynamodb.Table("QueryLog")
+    updated = 0
+    kwargs = {
+        "ProjectionExpression": "run_id, #ts, time_bucket",
+        "ExpressionAttributeNames": {"#ts": "timestamp"}
+    }
+    while True:
+        response = table.scan(**kwargs)
+        for item in response.get("Items", []):
+            if item.get("time_bucket") or not item.get("timestamp"):
+                continue
+            table.update_item(
+                Key={"run_id": item["run_id"]},
+                UpdateExpression="SET time_bucket = :bucket",
+                ExpressionAttributeValues={":bucket": item["timestamp"][:10]}
+            )
+            updated += 1
+        if "LastEvaluatedKey" not in response:
+            break
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    print(f"✅ Added time_bucket to {updated} query logs")
+    return updated
+
+
+if __name__ == "__main__":
+    backfill()
@@ -0,0 +1,44 @@
+# Copies the Chroma collections under CHROMA_PERSIST_DIR into quantized stores, reusing the
+# stored embeddings (nothing is re-embedded). Run once before switching VECTOR_STORE_MODE.
+#
+#     VECTOR_STORE_MODE=int8 python -m scripts.migrate_to_quantized
+
+import os
+
+import chromadb
+
+from rag_module.quantized_store import QuantizedVectorStore
+from rag_module.rag_chain import get_persist_dir, get_vector_mode, get_hnsw_config
+
+PAGE_SIZE = 5000
+
+
+def migrate():
+    mode = get_vector_mode()
+    if mode == "chroma":
+        raise SystemExit("❌ Set VECTOR_STORE_MODE to int8 or binary")
+    client = chromadb.PersistentClient(path=get_persist_dir())
+    totals = {}
+    for collection in client.list_collections():
+        name = collection if isinstance(collection, str) else collection.name
+        source = client.get_collection(name)
+        target = QuantizedVectorStore(
+            os.path.join(get_persist_dir(), "quantized", name), None,
+            quantization=mode, space=(source.metadata or {}).get("hnsw:space", get_hnsw_config()["hnsw:space"])
+        )
+        copied = 0
+        while True:
+            page = source.get(limit=PAGE_SIZE, offset=copied, include=["embeddings", "documents", "metadatas"])
+            if not page["ids"]:
+                break
+            target.add_vectors(page["embeddings"], page["documents"], [m or {} for m in page["metadatas"]], page["ids"])
+            copied += len(page["ids"])
+        stats = target.stats()
+        target.close()
+        totals[name] = copied
+        print(f"✅ {name}: {copied} chunks, {stats['memory_bytes'] / 2 ** 20:.1f} MB in memory")
+    return totals
+
+
+if __name__ == "__main__":
+    migrate()
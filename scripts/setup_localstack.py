@@ -42,20 +42,44 @@ def setup_localstack_resources():
             print(f"❌ Error checking buckets: {e}")
             return []
 
-    def create_table_if_not_exists(table_name, key_schema, attribute_definitions):
+    def ensure_indexes(table_name, attribute_definitions, global_secondary_indexes):
+        """Add any missing global secondary indexes to an existing table"""
+        try:
+            description = dynamodb_client.describe_table(TableName=table_name)['Table']
+            existing_indexes = {index['IndexName'] for index in description.get('GlobalSecondaryIndexes', [])}
+            for index in global_secondary_indexes:
+                if index['IndexName'] in existing_indexes:
+                    continue
+                print(f"⏳ Adding index {index['IndexName']} to {table_name}...")
+                dynamodb_client.update_table(
+                    TableName=table_name,
+                    AttributeDefinitions=attribute_definitions,
+                    GlobalSecondaryIndexUpdates=[{'Create': index}]
+                )
+                print(f"✅ Added index {index['IndexName']} to {table_name}")
+        except Exception as e:
+            print(f"❌ Error adding indexes to {table_name}: {e}")
+
+    def create_table_if_not_exists(table_name, key_schema, attribute_definitions, global_secondary_indexes=None):
         """Create table only if it doesn't exist"""
         existing_tables = check_existing_tables()
         
         if table_name in existing_tables:
             print(f"⚠️  Table {table_name} already exists, skipping creation")
+            if global_secondary_indexes:
+                ensure_indexes(table_name, attribute_definitions, global_secondary_indexes)
             return
         
         try:
+            kwargs = {}
+            if global_secondary_indexes:
+                kwargs['GlobalSecondaryIndexes'] = global_secondary_indexes
             table = dynamodb_resource.create_table(
                 TableName=table_name,
                 KeySchema=key_schema,
                 AttributeDefinitions=attribute_definitions,
-                BillingMode='PAY_PER_REQUEST'
+                BillingMode='PAY_PER_REQUEST',
+                **kwargs
             )
             
             # Wait for table to be created
@@ -95,11 +119,38 @@ def setup_localstack_resources():
     # Create DynamoDB Tables
     print("\n📊 Creating DynamoDB tables...")
     
-    # PDF_Metadata table
+    # PDF_Metadata table (content_hash-index finds re-uploads of identical PDFs,
+    # uploaded_at-index pages through all files newest first for /list)
     create_table_if_not_exists(
         'PDF_Metadata',
         [{'AttributeName': 'file_id', 'KeyType': 'HASH'}],
-        [{'AttributeName': 'file_id', 'AttributeType': 'S'}]
+        [
+            {'AttributeName': 'file_id', 'AttributeType': 'S'},
+            {'AttributeName': 'content_hash', 'AttributeType': 'S'},
+            {'AttributeName': 'listing', 'AttributeType': 'S'},
+            {'AttributeName': 'uploaded_at', 'AttributeType': 'S'}
+        ],
+        [
+            {
+                'IndexName': 'content_hash-index',
+                'KeySchema': [{'AttributeName': 'content_hash', 'KeyType': 'HASH'}],
+                'Projection': {
+                    'ProjectionType': 'INCLUDE',
+                    'NonKeyAttributes': ['status', 'uploaded_at', 'filename']
+                }
+            },
+            {
+                'IndexName': 'uploaded_at-index',
+                'KeySchema': [
+                    {'AttributeName': 'listing', 'KeyType': 'HASH'},
+                    {'AttributeName': 'uploaded_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {
+                    'ProjectionType': 'INCLUDE',
+                    'NonKeyAttributes': ['filename', 'status', 'status_updated_at']
+                }
+            }
+        ]
     )
     
     # LLM_Metrics table
@@ -109,11 +160,42 @@ def setup_localstack_resources():
         [{'AttributeName': 'run_id', 'AttributeType': 'S'}]
     )
     
-    # QueryLog table
+    # Running totals for /metrics/summary (maintained by the metrics handler)
+    create_table_if_not_exists(
+        'LLM_Metrics_Aggregates',
+        [{'AttributeName': 'aggregate_id', 'KeyType': 'HASH'}],
+        [{'AttributeName': 'aggregate_id', 'AttributeType': 'S'}]
+    )
+    
+    # QueryLog table (file_id-timestamp-index for one file's logs,
+    # time_bucket-timestamp-index for the most recent logs, one partition per day)
     create_table_if_not_exists(
         'QueryLog',
         [{'AttributeName': 'run_id', 'KeyType': 'HASH'}],
-        [{'AttributeName': 'run_id', 'AttributeType': 'S'}]
+        [
+            {'AttributeName': 'run_id', 'AttributeType': 'S'},
+            {'AttributeName': 'file_id', 'AttributeType': 'S'},
+            {'AttributeName': 'time_bucket', 'AttributeType': 'S'},
+            {'AttributeName': 'timestamp', 'AttributeType': 'S'}
+        ],
+        [
+            {
+                'IndexName': 'file_id-timestamp-index',
+                'KeySchema': [
+                    {'AttributeName': 'file_id', 'KeyType': 'HASH'},
+                    {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            },
+            {
+                'IndexName': 'time_bucket-timestamp-index',
+                'KeySchema': [
+                    {'AttributeName': 'time_bucket', 'KeyType': 'HASH'},
+                    {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
+        ]
     )
 
     # Create S3 Buckets
@@ -12,5 +12,11 @@ def upload_client():
     return TestClient(upload_app)
 
 @pytest.fixture
-def rag_client():
-    return TestClient(rag_app)
+def rag_client(tmp_path, monkeypatch):
+    # Keep the side-effect outbox out of the working tree
+    import rag_module.outbox as outbox
+    monkeypatch.setenv("OUTBOX_PATH", str(tmp_path / "outbox" / "side_effects.sqlite3"))
+    monkeypatch.setattr(outbox, "_outbox", None)
+    yield TestClient(rag_app)
+    if outbox._outbox is not None:
+        outbox._outbox.close()
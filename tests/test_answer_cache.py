@@ -0,0 +1,66 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from rag_module.answer_cache import AnswerCache, IndexVersions
+from unittest.mock import patch
+
+
+def make_cache(tmp_path, **kwargs):
+    return AnswerCache(IndexVersions(str(tmp_path / "index_versions")), **kwargs)
+
+
+def test_hit_on_normalized_question(tmp_path):
+    cache = make_cache(tmp_path, ttl=60, max_bytes=10_000)
+    cache.put("What is the document about?", "file-1", "Apples.")
+
+    assert cache.get("  what is the   document ABOUT ", "file-1") == "Apples."
+    assert cache.get("what is the document about?", "file-2") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_ttl_expiry(tmp_path):
+    cache = make_cache(tmp_path, ttl=10, max_bytes=10_000)
+    with patch("rag_module.answer_cache.time.monotonic", return_value=100.0):
+        cache.put("q", "file-1", "a")
+    with patch("rag_module.answer_cache.time.monotonic", return_value=111.0):
+        assert cache.get("q", "file-1") is None
+
+
+def test_lru_eviction_under_memory_cap(tmp_path):
+    cache = make_cache(tmp_path, ttl=60, max_bytes=700)
+    cache.put("q1", "f", "a" * 100)
+    cache.put("q2", "f", "b" * 100)
+    cache.get("q1", "f")
+    cache.put("q3", "f", "c" * 100)
+
+    assert cache.get("q2", "f") is None
+    assert cache.get("q1", "f") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_indexing_invalidates_across_processes(tmp_path):
+    query_side = make_cache(tmp_path, ttl=60, max_bytes=10_000)
+    upload_side = make_cache(tmp_path, ttl=60, max_bytes=10_000)
+    query_side.put("q", "file-1", "old answer")
+
+    upload_side.invalidate_file("file-1")
+
+    assert query_side.get("q", "file-1") is None
+
+
+@patch("rag_module.main.get_chain")
+@patch("rag_module.main.get_answer_cache")
+def test_answer_from_before_a_reindex_is_not_cached_as_current(mock_get_cache, mock_get_chain, tmp_path):
+    from rag_module.main import answer_question
+    cache = make_cache(tmp_path, ttl=60, max_bytes=10_000)
+    mock_get_cache.return_value = cache
+
+    def invoke(question):
+        # The file is re-indexed while the LLM is answering from its old chunks
+        make_cache(tmp_path).invalidate_file("file-1")
+        return {"answer": "old answer", "confidence": 0.5}
+
+    mock_get_chain.return_value.invoke.side_effect = invoke
+    answer_question("q", ("file-1",))
+
+    assert cache.get("q", ("file-1",)) is None
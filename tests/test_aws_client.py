@@ -0,0 +1,48 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from concurrent.futures import ThreadPoolExecutor
+from moto import mock_aws
+import pytest
+from aws_service import aws_client
+
+
+@pytest.fixture
+def fresh_clients():
+    aws_client.reset_clients()
+    yield
+    aws_client.reset_clients()
+
+
+def test_clients_are_cached_and_tuned(fresh_clients):
+    client = aws_client.get_client("s3")
+    assert aws_client.get_client("s3") is client
+    assert aws_client.get_resource("dynamodb") is aws_client.get_resource("dynamodb")
+
+    config = client.meta.config
+    assert config.max_pool_connections == aws_client.get_max_pool_connections()
+    assert config.retries["mode"] == "adaptive"
+    assert config.tcp_keepalive is True
+
+
+def test_stats_count_requests_errors_and_concurrency(fresh_clients):
+    with mock_aws():
+        dynamodb = aws_client.get_resource("dynamodb")
+        dynamodb.create_table(
+            TableName="t",
+            KeySchema=[{"AttributeName": "k", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "k", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST"
+        )
+        before = aws_client.client_stats()["services"].get("dynamodb", {"requests": 0, "errors": 0})
+        table = dynamodb.Table("t")
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda i: table.put_item(Item={"k": str(i)}), range(40)))
+        with pytest.raises(Exception):
+            dynamodb.meta.client.describe_table(TableName="missing")
+
+    stats = aws_client.client_stats()["services"]["dynamodb"]
+    assert stats["requests"] - before["requests"] == 41
+    assert stats["errors"] - before["errors"] == 1
+    assert stats["in_flight"] == 0
+    assert 0 < stats["pool_saturation"] <= 1
@@ -0,0 +1,110 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from unittest.mock import patch
+
+from rag_module.context_packing import pack_context, overlap_length, estimate_tokens
+
+WORDS = "apple orchard revenue contract clause warranty policy engine manual safety torque".split()
+
+
+def split_page(text, page=0, file_id="f1", start=0):
+    # Same splitter settings as index_document
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, add_start_index=True)
+    chunks = splitter.split_documents([Document(page_content=text, metadata={"source": "a.pdf", "page": page})])
+    for i, chunk in enumerate(chunks):
+        chunk.metadata.update(file_id=file_id, chunk_id=f"{file_id}-{start + i}")
+    return chunks
+
+
+def page_text(seed, words=600):
+    return " ".join(WORDS[(seed * 7 + i * i) % len(WORDS)] + str(i % 13) for i in range(words))
+
+
+def test_overlapping_neighbours_are_merged_into_page_text():
+    text = page_text(1)
+    chunks = split_page(text)
+    hits = [chunks[2], chunks[1], chunks[3]]
+
+    context, report = pack_context(hits, budget=10000)
+
+    assert report["passages"] == 1
+    assert report["merged"] == 2
+    assert context in text
+    assert report["tokens_saved"] > 0
+    assert report["tokens_before"] - report["tokens_after"] == report["tokens_saved"]
+
+
+def test_merging_works_without_start_index():
+    # Chunks indexed before start_index was recorded fall back to the chunk_id ordinal + text overlap
+    chunks = split_page(page_text(2))
+    for chunk in chunks:
+        chunk.metadata.pop("start_index")
+
+    context, report = pack_context([chunks[1], chunks[0]], budget=10000)
+
+    assert report["passages"] == 1
+    assert overlap_length(chunks[0].page_content, chunks[1].page_content) >= 20
+    assert context.startswith(chunks[0].page_content)
+
+
+def test_other_pages_and_files_are_not_merged():
+    first = split_page(page_text(3), page=0)
+    second = split_page(page_text(3), page=1, file_id="f2")
+
+    _, report = pack_context([first[0], second[1]], budget=10000)
+
+    assert report["passages"] == 2
+    assert report["merged"] == 0
+
+
+def test_near_duplicates_dropped_keeping_the_better_ranked():
+    text = page_text(4, words=150)
+    best = Document(page_content=text, metadata={"file_id": "f1", "page": 0})
+    copy = Document(page_content=text.replace("apple0", "apple 0"), metadata={"file_id": "f2", "page": 4})
+
+    context, report = pack_context([best, copy], budget=10000)
+
+    assert report["duplicates"] == 1
+    assert context == text
+
+
+def test_budget_filled_in_relevance_order():
+    docs = [
+        Document(page_content=page_text(seed, words=100), metadata={"file_id": f"f{seed}", "page": 0})
+        for seed in range(5)
+    ]
+    per_doc = estimate_tokens(docs[0].page_content)
+
+    context, report = pack_context(docs, budget=per_doc * 2 + 5)
+
+    assert report["passages"] == 2
+    assert report["over_budget"] == 3
+    assert context == docs[0].page_content + "\n" + docs[1].page_content
+
+
+def test_oversized_best_passage_is_cut_to_budget():
+    doc = Document(page_content=page_text(5, words=2000), metadata={})
+
+    context, report = pack_context([doc], budget=100)
+
+    assert report["tokens_after"] <= 100
+    assert doc.page_content.startswith(context)
+
+
+@patch("rag_module.main.record_side_effects")
+@patch("rag_module.main.get_chain")
+@patch("rag_module.main.get_answer_cache")
+def test_query_reports_tokens_saved(mock_cache, mock_get_chain, mock_side_effects, rag_client):
+    mock_cache.return_value.get.return_value = None
+    mock_get_chain.return_value.invoke.return_value = {
+        "answer": "Apples.", "packing": {"tokens_saved": 42}, "confidence": 0.8, "usage": None
+    }
+
+    response = rag_client.post("/query", json={"query": "what about apples?"})
+
+    assert response.json()["context_tokens_saved"] == 42
+    assert mock_side_effects.call_args.kwargs["metric"]["context_tokens_saved"] == 42
+    assert rag_client.get("/metrics/context-packing").status_code == 200
@@ -10,3 +10,41 @@ def test_save_metadata(mock_table):
     dynamo_handler.save_metadata("abc", "file.pdf")
     mock_table.put_item.assert_called_once()
 
+
+
+def test_only_indexed_or_recent_uploads_count_as_duplicates():
+    import boto3
+    from datetime import datetime, timedelta
+    from moto import mock_aws
+    with mock_aws():
+        table = boto3.resource("dynamodb", region_name="us-east-1").create_table(
+            TableName="PDF_Metadata",
+            KeySchema=[{"AttributeName": "file_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[
+                {"AttributeName": "file_id", "AttributeType": "S"},
+                {"AttributeName": "content_hash", "AttributeType": "S"}
+            ],
+            GlobalSecondaryIndexes=[{
+                "IndexName": "content_hash-index",
+                "KeySchema": [{"AttributeName": "content_hash", "KeyType": "HASH"}],
+                "Projection": {"ProjectionType": "ALL"}
+            }],
+            BillingMode="PAY_PER_REQUEST"
+        )
+        hours_ago = lambda hours: (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+        # A job that died with its process stays "extracting" forever
+        table.put_item(Item={"file_id": "stuck", "content_hash": "h1", "status": "extracting",
+                             "uploaded_at": hours_ago(5), "status_updated_at": hours_ago(5)})
+        table.put_item(Item={"file_id": "failed", "content_hash": "h1", "status": "failed",
+                             "uploaded_at": hours_ago(0)})
+        with patch.object(dynamo_handler, "table", table):
+            assert dynamo_handler.find_by_content_hash("h1", max_pending_age=1800) is None
+
+            table.put_item(Item={"file_id": "running", "content_hash": "h1", "status": "embedding",
+                                 "uploaded_at": hours_ago(0.1), "status_updated_at": hours_ago(0)})
+            assert dynamo_handler.find_by_content_hash("h1", max_pending_age=1800)["file_id"] == "running"
+            assert dynamo_handler.find_by_content_hash("h1") is None
+
+            table.put_item(Item={"file_id": "done", "content_hash": "h1", "status": "indexed",
+                                 "uploaded_at": hours_ago(48)})
+            assert dynamo_handler.find_by_content_hash("h1", max_pending_age=1800)["file_id"] == "done"
@@ -0,0 +1,43 @@
+import sys
+import os
+import threading
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from rag_module.embedding_batcher import BatchingEmbeddings
+from unittest.mock import MagicMock
+import pytest
+
+
+def fake_model():
+    model = MagicMock()
+    model.embed_documents.side_effect = lambda texts: [[float(len(t))] for t in texts]
+    return model
+
+
+def test_concurrent_queries_share_one_encode():
+    model = fake_model()
+    batcher = BatchingEmbeddings(model, max_batch_size=8, max_wait_ms=200)
+    results = {}
+
+    def worker(text):
+        results[text] = batcher.embed_query(text)
+
+    threads = [threading.Thread(target=worker, args=("q" * n,)) for n in range(1, 9)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # Every caller gets back its own vector
+    assert all(results["q" * n] == [float(n)] for n in range(1, 9))
+    stats = batcher.stats()
+    assert stats["queries_embedded"] == 8
+    assert stats["batches"] < 8
+    assert model.embed_documents.call_count == stats["batches"]
+
+
+def test_errors_reach_every_waiting_caller():
+    model = MagicMock()
+    model.embed_documents.side_effect = Exception("model down")
+    batcher = BatchingEmbeddings(model, max_batch_size=4, max_wait_ms=1)
+    with pytest.raises(Exception):
+        batcher.embed_query("hello")
@@ -0,0 +1,51 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from rag_module.embedding_cache import EmbeddingCache, CachedEmbeddings
+from unittest.mock import MagicMock
+
+
+def fake_model():
+    model = MagicMock()
+    model.embed_documents.side_effect = lambda texts: [[float(len(t)), 1.0] for t in texts]
+    return model
+
+
+def test_only_misses_hit_the_model(tmp_path):
+    model = fake_model()
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    embedder = CachedEmbeddings(model, cache, "bge")
+
+    first = embedder.embed_documents(["legal footer", "page one", "legal footer"])
+    second = embedder.embed_documents(["legal footer", "page two"])
+
+    assert first == [[12.0, 1.0], [8.0, 1.0], [12.0, 1.0]]
+    assert second == [[12.0, 1.0], [8.0, 1.0]]
+    # The repeated footer is embedded once across both calls
+    assert model.embed_documents.call_args_list[0].args[0] == ["legal footer", "page one"]
+    assert model.embed_documents.call_args_list[1].args[0] == ["page two"]
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 4
+
+
+def test_cache_persists_and_is_keyed_by_model(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    CachedEmbeddings(fake_model(), EmbeddingCache(path), "bge").embed_documents(["cover page"])
+
+    model = fake_model()
+    CachedEmbeddings(model, EmbeddingCache(path), "bge").embed_documents(["cover page"])
+    model.embed_documents.assert_not_called()
+
+    CachedEmbeddings(model, EmbeddingCache(path), "other-model").embed_documents(["cover page"])
+    model.embed_documents.assert_called_once()
+
+
+def test_eviction_keeps_cache_bounded(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=3)
+    embedder = CachedEmbeddings(fake_model(), cache, "bge")
+    embedder.embed_documents([f"chunk {i}" for i in range(5)])
+
+    stats = cache.stats()
+    assert stats["entries"] == 3
+    assert stats["evictions"] == 2
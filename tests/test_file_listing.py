@@ -0,0 +1,78 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import boto3
+import pytest
+from moto import mock_aws
+from unittest.mock import patch
+from aws_service import dynamo_handler
+
+
+@pytest.fixture
+def metadata_table():
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        table = dynamodb.create_table(
+            TableName="PDF_Metadata",
+            KeySchema=[{"AttributeName": "file_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[
+                {"AttributeName": "file_id", "AttributeType": "S"},
+                {"AttributeName": "listing", "AttributeType": "S"},
+                {"AttributeName": "uploaded_at", "AttributeType": "S"}
+            ],
+            GlobalSecondaryIndexes=[{
+                "IndexName": "uploaded_at-index",
+                "KeySchema": [
+                    {"AttributeName": "listing", "KeyType": "HASH"},
+                    {"AttributeName": "uploaded_at", "KeyType": "RANGE"}
+                ],
+                "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": ["filename", "status", "status_updated_at"]}
+            }],
+            BillingMode="PAY_PER_REQUEST"
+        )
+        with patch.object(dynamo_handler, "table", table):
+            yield table
+
+
+def test_pages_follow_the_cursor_newest_first(metadata_table, upload_client):
+    for i in range(25):
+        dynamo_handler.save_metadata(f"id-{i:02d}", f"file-{i}.pdf", status="indexed")
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 10, **({"cursor": cursor} if cursor else {})}
+        with patch("pdf_services.main.limiter.enabled", False):
+            page = upload_client.get("/list", params=params).json()
+        assert page["total"] == 25
+        seen.extend(item["file_id"] for item in page["files"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert seen == [f"id-{i:02d}" for i in reversed(range(25))]
+    assert set(page["files"][0]) == {"file_id", "filename", "uploaded_at", "status"}
+
+
+def test_saving_the_same_file_twice_counts_it_once(metadata_table):
+    dynamo_handler.save_metadata("same", "a.pdf")
+    dynamo_handler.save_metadata("same", "a.pdf")
+    assert dynamo_handler.count_files() == 1
+
+
+def test_file_count_item_is_not_a_file(metadata_table, upload_client):
+    dynamo_handler.save_metadata("id-1", "a.pdf", status="indexed")
+
+    assert dynamo_handler.get_metadata(dynamo_handler.FILE_COUNT_ID) == {}
+    with patch("pdf_services.main.limiter.enabled", False):
+        status = upload_client.get("/status/%23file_count")
+        retrieved = upload_client.get("/retrieve/%23file_count")
+        page = upload_client.get("/list").json()
+    assert status.status_code == 404
+    assert retrieved.status_code == 404
+    assert [item["file_id"] for item in page["files"]] == ["id-1"]
+
+
+def test_invalid_cursor_is_rejected(metadata_table, upload_client):
+    response = upload_client.get("/list", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
@@ -0,0 +1,180 @@
+import sys
+import os
+import time
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from pdf_services.jobs import IngestionJobs
+from unittest.mock import patch, MagicMock
+import pytest
+
+
+def throw(error):
+    raise error
+
+
+@patch("pdf_services.jobs.update_status")
+@patch("pdf_services.jobs.save_metadata")
+@patch("pdf_services.jobs.index_document")
+@patch("pdf_services.jobs.extract_text", return_value=["page"])
+@patch("pdf_services.jobs.upload_to_s3")
+def test_job_runs_all_stages(mock_s3, mock_extract, mock_index, mock_save, mock_update):
+    jobs = IngestionJobs(max_workers=1)
+    jobs.submit("f1", "a.pdf", "uploads/f1.pdf").result()
+
+    job = jobs.get("f1")
+    assert job["status"] == "indexed"
+    assert list(job["stages"]) == ["queued", "extracting", "embedding", "indexed"]
+    mock_index.assert_called_once_with(["page"], file_id="f1")
+    assert [c.args[1] for c in mock_update.call_args_list] == ["extracting", "embedding", "indexed"]
+
+
+@patch("pdf_services.jobs.update_status")
+@patch("pdf_services.jobs.save_metadata")
+@patch("pdf_services.jobs.delete_from_s3")
+@patch("pdf_services.jobs.extract_text", side_effect=RuntimeError("corrupt PDF"))
+@patch("pdf_services.jobs.upload_to_s3")
+def test_failed_job_reports_error(mock_s3, mock_extract, mock_delete_s3, mock_save, mock_update):
+    jobs = IngestionJobs(max_workers=1)
+    jobs.submit("f2", "b.pdf", "uploads/f2.pdf").result()
+
+    job = jobs.get("f2")
+    assert job["status"] == "failed"
+    assert "corrupt PDF" in job["error"]
+
+
+@patch("pdf_services.jobs.update_status")
+@patch("pdf_services.jobs.save_metadata")
+@patch("pdf_services.jobs.index_document", side_effect=lambda *a, **k: time.sleep(0.3))
+@patch("pdf_services.jobs.extract_text", return_value=[])
+@patch("pdf_services.jobs.upload_to_s3")
+def test_throughput_scales_with_workers(mock_s3, mock_extract, mock_index, mock_save, mock_update):
+    jobs = IngestionJobs(max_workers=4)
+    start = time.time()
+    futures = [jobs.submit(f"f{i}", "c.pdf", "uploads/c.pdf") for i in range(4)]
+    for future in futures:
+        future.result()
+    assert time.time() - start < 0.9
+
+
+@patch("pdf_services.main.jobs")
+def test_status_endpoint(mock_jobs, upload_client):
+    mock_jobs.get.return_value = {"file_id": "f1", "status": "embedding", "stages": {}, "error": None}
+    response = upload_client.get("/status/f1")
+    assert response.status_code == 200
+    assert response.json()["status"] == "embedding"
+
+
+@patch("pdf_services.jobs.update_status")
+@patch("pdf_services.jobs.save_metadata")
+@patch("pdf_services.jobs.index_document", side_effect=lambda *a, **k: time.sleep(0.3))
+@patch("pdf_services.jobs.extract_text", return_value=[])
+@patch("pdf_services.jobs.upload_to_s3", side_effect=lambda *a: time.sleep(0.3))
+def test_s3_upload_overlaps_with_indexing(mock_s3, mock_extract, mock_index, mock_save, mock_update):
+    jobs = IngestionJobs(max_workers=1)
+    start = time.time()
+    jobs.submit("f1", "a.pdf", "uploads/f1.pdf").result()
+
+    assert time.time() - start < 0.55
+    timings = jobs.get("f1")["timings"]
+    assert set(timings) >= {"s3_upload", "extract", "index", "total", "critical_path"}
+    assert mock_update.call_args.kwargs["timings"]["total"] == timings["total"]
+
+
+@patch("pdf_services.jobs.update_status")
+@patch("pdf_services.jobs.save_metadata")
+@patch("pdf_services.jobs.delete_document")
+@patch("pdf_services.jobs.delete_from_s3")
+@patch("pdf_services.jobs.index_document", side_effect=RuntimeError("chroma down"))
+@patch("pdf_services.jobs.extract_text", return_value=[])
+@patch("pdf_services.jobs.upload_to_s3")
+def test_failure_rolls_back_both_branches(mock_s3, mock_extract, mock_index, mock_delete_s3,
+                                          mock_delete_doc, mock_save, mock_update):
+    jobs = IngestionJobs(max_workers=1)
+    jobs.submit("f1", "a.pdf", "uploads/f1.pdf").result()
+
+    assert jobs.get("f1")["status"] == "failed"
+    mock_delete_s3.assert_called_once_with("f1.pdf")
+    mock_delete_doc.assert_called_once_with("f1")
+
+
+@patch("pdf_services.jobs.update_status")
+@patch("pdf_services.jobs.save_metadata")
+@patch("pdf_services.jobs.delete_document")
+@patch("pdf_services.jobs.delete_from_s3")
+@patch("pdf_services.jobs.index_document")
+@patch("pdf_services.jobs.extract_text", return_value=[])
+@patch("pdf_services.jobs.upload_to_s3", side_effect=lambda *a: time.sleep(0.1) or throw(RuntimeError("S3 down")))
+def test_s3_failure_removes_indexed_chunks(mock_s3, mock_extract, mock_index, mock_delete_s3,
+                                           mock_delete_doc, mock_save, mock_update):
+    jobs = IngestionJobs(max_workers=1)
+    jobs.submit("f1", "a.pdf", "uploads/f1.pdf").result()
+
+    job = jobs.get("f1")
+    assert job["status"] == "failed"
+    assert "S3 down" in job["error"]
+    mock_delete_s3.assert_not_called()
+    mock_delete_doc.assert_called_once_with("f1")
+
+
+@patch("pdf_services.jobs.update_status")
+@patch("pdf_services.jobs.save_metadata")
+@patch("pdf_services.jobs.delete_document")
+@patch("pdf_services.jobs.index_document")
+@patch("pdf_services.jobs.extract_text", side_effect=lambda *a: time.sleep(0.1) or ["page"])
+@patch("pdf_services.jobs.upload_to_s3", side_effect=RuntimeError("S3 down"))
+def test_s3_failure_stops_the_job_before_indexing(mock_s3, mock_extract, mock_index, mock_delete_doc, mock_save,
+                                                  mock_update):
+    jobs = IngestionJobs(max_workers=1)
+    jobs.submit("f1", "a.pdf", "uploads/f1.pdf").result()
+
+    assert "S3 down" in jobs.get("f1")["error"]
+    mock_index.assert_not_called()
+    mock_delete_doc.assert_not_called()
+
+
+@patch("pdf_services.jobs.update_status")
+@patch("pdf_services.jobs.save_metadata")
+@patch("pdf_services.jobs.index_document", side_effect=lambda *a, **k: time.sleep(0.2))
+@patch("pdf_services.jobs.extract_text", return_value=[])
+@patch("pdf_services.jobs.upload_to_s3")
+def test_identical_uploads_at_the_same_time_are_indexed_once(mock_s3, mock_extract, mock_index, mock_save,
+                                                            mock_update):
+    import threading
+    jobs = IngestionJobs(max_workers=2)
+    results = []
+    start = threading.Barrier(8)
+
+    def upload(i):
+        start.wait()
+        results.append(jobs.submit_unless_running(f"f{i}", "a.pdf", "uploads/a.pdf", content_hash="same"))
+
+    threads = [threading.Thread(target=upload, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    submitted = [future for existing, future in results if future is not None]
+    assert len(submitted) == 1
+    submitted[0].result()
+    assert mock_index.call_count == 1
+    assert len({existing["file_id"] for existing, _ in results if existing}) == 1
+
+
+@patch("pdf_services.jobs.update_status")
+@patch("pdf_services.jobs.save_metadata", side_effect=[RuntimeError("DynamoDB unavailable"), None])
+@patch("pdf_services.jobs.index_document")
+@patch("pdf_services.jobs.extract_text", return_value=[])
+@patch("pdf_services.jobs.upload_to_s3")
+def test_job_not_registered_when_metadata_write_fails(mock_s3, mock_extract, mock_index, mock_save, mock_update):
+    jobs = IngestionJobs(max_workers=1)
+
+    with pytest.raises(RuntimeError):
+        jobs.submit_unless_running("f1", "a.pdf", "uploads/f1.pdf", content_hash="same")
+
+    assert jobs.get("f1") is None
+    assert jobs.find_by_hash("same") is None
+    # The same bytes uploaded again get their own job
+    existing, future = jobs.submit_unless_running("f2", "a.pdf", "uploads/f2.pdf", content_hash="same")
+    assert existing is None
+    future.result()
+    assert jobs.get("f2")["status"] == "indexed"
@@ -0,0 +1,131 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import boto3
+import pytest
+from moto import mock_aws
+from unittest.mock import patch
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from aws_service import metrics_store
+from aws_service.metrics_aggregates import rebuild
+from metrics_lambda import metrics_summary
+
+
+def metric(run_id, file_id, tokens, latency, day="2026-10-01"):
+    return {"run_id": run_id, "tokens_used": tokens, "confidence_score": 0.9, "response_time": latency,
+            "file_id": file_id, "timestamp": f"{day}T12:00:00"}
+
+
+@pytest.fixture
+def tables():
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        for name, key in (("LLM_Metrics", "run_id"), ("LLM_Metrics_Aggregates", "aggregate_id")):
+            dynamodb.create_table(
+                TableName=name,
+                KeySchema=[{"AttributeName": key, "KeyType": "HASH"}],
+                AttributeDefinitions=[{"AttributeName": key, "AttributeType": "S"}],
+                BillingMode="PAY_PER_REQUEST"
+            )
+        with patch.object(metrics_store, "dynamodb", dynamodb), patch.object(metrics_summary, "dynamodb", dynamodb):
+            yield dynamodb
+
+
+def test_summary_reads_the_running_aggregates(tables):
+    metrics_store.ingest_metrics([metric("a", "f1", 100, 1.0), metric("b", "f2", 300, 3.0, day="2026-10-02")])
+    metrics_store.ingest_metrics([metric("c", "f1", 200, 2.0)])
+    client = TestClient(metrics_summary.app)
+
+    overall = client.get("/metrics/summary").json()
+    assert overall["total_queries"] == 3
+    assert overall["avg_tokens_used"] == 200
+    assert overall["avg_response_time"] == 2.0
+    assert client.get("/metrics/summary", params={"file_id": "f1"}).json()["total_queries"] == 2
+    assert client.get("/metrics/summary", params={"day": "2026-10-02"}).json()["avg_tokens_used"] == 300
+
+
+def test_redelivered_metrics_are_not_counted_twice(tables):
+    metrics_store.ingest_metrics([metric("a", "f1", 100, 1.0)])
+    metrics_store.ingest_metrics([metric("a", "f1", 100, 1.0), metric("b", "f1", 100, 1.0)])
+
+    aggregate = tables.Table("LLM_Metrics_Aggregates").get_item(Key={"aggregate_id": "ALL"})["Item"]
+    assert aggregate["query_count"] == 2
+
+
+def test_concurrent_redeliveries_are_counted_once(tables):
+    import threading
+    start = threading.Barrier(8)
+    # DynamoDB serializes transactions on the same items; moto needs a lock for that
+    client = tables.meta.client
+    real_transact = client.transact_write_items
+    serial = threading.Lock()
+
+    def transact_write_items(**kwargs):
+        with serial:
+            return real_transact(**kwargs)
+
+    def deliver():
+        start.wait()
+        metrics_store.ingest_metrics([metric("a", "f1", 100, 1.0)])
+
+    threads = [threading.Thread(target=deliver) for _ in range(8)]
+    with patch.object(client, "transact_write_items", side_effect=transact_write_items):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    aggregates = tables.Table("LLM_Metrics_Aggregates")
+    assert aggregates.get_item(Key={"aggregate_id": "ALL"})["Item"]["query_count"] == 1
+    assert aggregates.get_item(Key={"aggregate_id": "FILE#f1"})["Item"]["tokens_sum"] == 100
+
+
+def test_failed_aggregate_update_is_retried_with_the_record(tables):
+    metrics = tables.Table("LLM_Metrics")
+
+    # The aggregate ADD cannot be applied (here: wrong table), so the record is not stored either
+    stored, failed = metrics_store.ingest_metrics([metric("a", "f1", 100, 1.0)], metrics, tables.Table("Missing"))
+    assert stored == 0
+    assert failed[0]["retryable"] is True
+    assert "Item" not in metrics.get_item(Key={"run_id": "a"})
+
+    # The redelivery stores it and counts it
+    metrics_store.ingest_metrics([metric("a", "f1", 100, 1.0)])
+    aggregate = tables.Table("LLM_Metrics_Aggregates").get_item(Key={"aggregate_id": "ALL"})["Item"]
+    assert aggregate["query_count"] == 1
+
+
+def test_rebuild_matches_incremental_aggregates(tables):
+    metrics_store.ingest_metrics([metric(str(i), f"f{i % 3}", 100 + i, 1.5) for i in range(40)])
+    aggregates = tables.Table("LLM_Metrics_Aggregates")
+    incremental = {item["aggregate_id"]: item for item in aggregates.scan()["Items"]}
+    aggregates.put_item(Item={"aggregate_id": "FILE#gone", "query_count": 5})
+
+    result = rebuild(tables.Table("LLM_Metrics"), aggregates)
+
+    assert result == {"scanned": 40, "aggregates": len(incremental), "removed": 1}
+    assert {item["aggregate_id"]: item for item in aggregates.scan()["Items"]} == incremental
+
+
+def test_summary_without_metrics(tables):
+    response = TestClient(metrics_summary.app).get("/metrics/summary")
+    assert response.json()["total_queries"] == 0
+
+
+def test_percentiles_for_a_time_window_and_file(tables):
+    now = datetime.utcnow()
+    recent = now.strftime("%Y-%m-%dT%H:%M:%S")
+    old = (now - timedelta(hours=48)).strftime("%Y-%m-%dT%H:%M:%S")
+    records = [{**metric(str(i), "f1" if i % 2 else "f2", i, i / 10), "timestamp": recent} for i in range(1, 101)]
+    records.append({**metric("old", "f1", 10000, 60.0), "timestamp": old})
+    metrics_store.ingest_metrics(records)
+    client = TestClient(metrics_summary.app)
+
+    last_day = client.get("/metrics/percentiles", params={"hours": 24}).json()
+    assert last_day["count"] == 100
+    assert abs(last_day["response_time"]["p50"] - 5.0) <= 0.05 * 5.0
+    assert abs(last_day["tokens_used"]["p99"] - 99) <= 0.02 * 99
+
+    assert client.get("/metrics/percentiles", params={"hours": 72}).json()["response_time"]["p99"] >= 9.9
+    assert client.get("/metrics/percentiles", params={"file_id": "f1"}).json()["count"] == 50
@@ -0,0 +1,90 @@
+import sys
+import os
+import json
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import boto3
+import pytest
+from moto import mock_aws
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from metrics_lambda import handler
+from aws_service import router, metrics_store
+
+
+def metric(run_id, **overrides):
+    return {"run_id": run_id, "tokens_used": 345, "confidence_score": 0.92, "response_time": 1.5, **overrides}
+
+
+@pytest.fixture
+def metrics_table():
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        table = dynamodb.create_table(
+            TableName="LLM_Metrics",
+            KeySchema=[{"AttributeName": "run_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "run_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST"
+        )
+        dynamodb.create_table(
+            TableName="LLM_Metrics_Aggregates",
+            KeySchema=[{"AttributeName": "aggregate_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "aggregate_id", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST"
+        )
+        with patch.object(handler, "dynamodb", dynamodb), patch.object(metrics_store, "dynamodb", dynamodb):
+            yield table
+
+
+def test_handler_stores_a_single_direct_invoke_payload(metrics_table):
+    response = handler.lambda_handler(metric("a"), None)
+    assert response["statusCode"] == 200
+    assert metrics_table.get_item(Key={"run_id": "a"})["Item"]["tokens_used"] == 345
+
+
+def test_handler_reports_invalid_records_in_a_batch(metrics_table):
+    event = {"body": json.dumps({"metrics": [metric(str(i)) for i in range(30)] + [{"run_id": "bad"}]})}
+
+    response = handler.lambda_handler(event, None)
+
+    body = json.loads(response["body"])
+    assert response["statusCode"] == 207
+    assert body["stored"] == 30
+    assert [failure["run_id"] for failure in body["failed"]] == ["bad"]
+    assert metrics_table.scan(Select="COUNT")["Count"] == 30
+
+
+def test_handler_drops_invalid_sqs_messages(metrics_table):
+    event = {"Records": [
+        {"messageId": "m1", "body": json.dumps(metric("a"))},
+        {"messageId": "m2", "body": json.dumps({"metrics": [metric("b"), {"run_id": "c"}]})},
+        {"messageId": "m3", "body": "not json"},
+    ]}
+
+    response = handler.lambda_handler(event, None)
+
+    # Redelivering them would fail again; the valid records are stored
+    assert response == {"batchItemFailures": []}
+    assert metrics_table.scan(Select="COUNT")["Count"] == 2
+
+
+def test_handler_returns_sqs_messages_whose_write_failed(metrics_table):
+    event = {"Records": [
+        {"messageId": "m1", "body": json.dumps(metric("a"))},
+        {"messageId": "m2", "body": json.dumps({"metrics": [metric("b"), {"run_id": "c"}]})},
+    ]}
+    throttled = [{"index": 0, "run_id": "a", "error": "ProvisionedThroughputExceededException", "retryable": True},
+                 {"index": 1, "run_id": "b", "error": "ProvisionedThroughputExceededException", "retryable": True}]
+
+    with patch.object(metrics_store, "store_metrics", return_value=([], throttled)):
+        response = handler.lambda_handler(event, None)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "m1"}, {"itemIdentifier": "m2"}]}
+
+
+def test_router_accepts_one_metric_or_a_list(metrics_table):
+    client = TestClient(router.app)
+
+    assert client.post("/metrics", json=metric("a")).json() == {"status": "Metric stored."}
+    response = client.post("/metrics", json=[metric("b"), metric("c", tokens_used="many")]).json()
+    assert response["stored"] == 1
+    assert response["failed"][0]["index"] == 1
@@ -0,0 +1,40 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import random
+from aws_service.metrics_sketch import LogHistogram
+
+
+def exact(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+def test_quantiles_within_relative_accuracy():
+    random.seed(1)
+    values = [random.lognormvariate(0, 1) for _ in range(5000)]
+    sketch = LogHistogram(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+
+    for q in (0.5, 0.95, 0.99):
+        assert abs(sketch.quantile(q) - exact(values, q)) <= 0.01 * exact(values, q) + 1e-9
+
+
+def test_merged_sketches_equal_one_sketch_of_all_values():
+    values = [i / 10 for i in range(1, 1000)]
+    whole, left, right = LogHistogram(0.01), LogHistogram(0.01), LogHistogram(0.01)
+    for value in values:
+        whole.add(value)
+        (left if value < 50 else right).add(value)
+
+    left.merge(right)
+    assert left.percentiles() == whole.percentiles()
+
+
+def test_zero_values_and_empty_sketch():
+    sketch = LogHistogram(0.01)
+    assert sketch.quantile(0.5) is None
+    for value in (0, 0, 0, 100):
+        sketch.add(value)
+    assert sketch.quantile(0.5) == 0.0
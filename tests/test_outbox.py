@@ -0,0 +1,118 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from unittest.mock import patch, MagicMock
+from rag_module.outbox import Outbox, METRIC, QUERY_LOG
+from aws_service.query_log_handler import write_query_logs
+
+
+def make_outbox(tmp_path, senders, **kwargs):
+    return Outbox(str(tmp_path / "outbox.sqlite3"), senders, flush_interval_ms=60000, **kwargs)
+
+
+def test_flush_sends_batches_of_at_most_25(tmp_path):
+    batches = []
+    outbox = make_outbox(tmp_path, {QUERY_LOG: lambda records: batches.append(records) or []})
+    outbox.add([(QUERY_LOG, {"run_id": str(i)}) for i in range(60)])
+
+    assert outbox.flush() == 60
+    assert [len(batch) for batch in batches] == [25, 25, 10]
+    assert outbox.pending() == 0
+    outbox.close()
+
+
+def test_failed_records_are_kept_and_retried_with_backoff(tmp_path):
+    sender = MagicMock(return_value=[1])
+    outbox = make_outbox(tmp_path, {METRIC: sender})
+    outbox.add([(METRIC, {"run_id": "a"}), (METRIC, {"run_id": "b"})])
+
+    assert outbox.flush() == 1
+    # "b" is waiting for its backoff, so a second flush sends nothing
+    assert outbox.flush() == 0
+    assert outbox.stats()["pending"] == 1
+    assert outbox.stats()["retries"] == 1
+    outbox.close()
+
+
+def test_records_survive_a_restart(tmp_path):
+    failing = MagicMock(side_effect=Exception("AWS unavailable"))
+    outbox = make_outbox(tmp_path, {METRIC: failing})
+    outbox.add([(METRIC, {"run_id": "a"})])
+    outbox.flush()
+    outbox.close()
+
+    sender = MagicMock(return_value=[])
+    reopened = make_outbox(tmp_path, {METRIC: sender})
+    with patch("rag_module.outbox.time.time", return_value=10 ** 10):
+        assert reopened.flush() == 1
+    assert sender.call_args.args[0] == [{"run_id": "a"}]
+    reopened.close()
+
+
+def test_records_become_dead_after_max_attempts(tmp_path):
+    outbox = make_outbox(tmp_path, {METRIC: MagicMock(return_value=[0])}, max_attempts=1)
+    outbox.add([(METRIC, {"run_id": "a"})])
+    outbox.flush()
+    assert outbox.stats()["dead"] == 1
+    assert outbox.pending() == 0
+    outbox.close()
+
+
+@patch("aws_service.query_log_handler.dynamodb")
+def test_write_query_logs_returns_unprocessed_records(mock_dynamodb):
+    mock_dynamodb.batch_write_item.return_value = {
+        "UnprocessedItems": {"QueryLog": [{"PutRequest": {"Item": {"run_id": "2"}}}]}
+    }
+    records = [
+        {"run_id": str(i), "query_text": "q", "response_text": "r", "confidence_score": 0.9}
+        for i in range(3)
+    ]
+
+    assert write_query_logs(records) == [2]
+    request = mock_dynamodb.batch_write_item.call_args.kwargs["RequestItems"]["QueryLog"]
+    assert len(request) == 3
+
+
+def test_stop_during_a_slow_send_does_not_send_twice(tmp_path):
+    import threading
+    import time
+    sent = []
+    sending = threading.Event()
+
+    def slow_sender(records):
+        sending.set()
+        time.sleep(0.3)
+        sent.extend(record["run_id"] for record in records)
+        return []
+
+    outbox = make_outbox(tmp_path, {METRIC: slow_sender})
+    outbox.add([(METRIC, {"run_id": str(i)}) for i in range(3)])
+    worker = threading.Thread(target=outbox.flush)
+    worker.start()
+    sending.wait()
+
+    # Shutdown flushes while the worker's batch is still in flight
+    outbox.stop(flush=True)
+    worker.join()
+
+    assert sorted(sent) == ["0", "1", "2"]
+    assert outbox.pending() == 0
+    outbox.close()
+
+
+def test_service_lifespan_starts_and_drains_the_outbox(rag_client, monkeypatch):
+    from fastapi.testclient import TestClient
+    from rag_module.main import app
+    from rag_module.outbox import get_outbox
+    monkeypatch.setenv("WARMUP_ON_STARTUP", "false")
+    sender = MagicMock(return_value=[])
+
+    with TestClient(app):
+        outbox = get_outbox()
+        outbox.senders = {METRIC: sender}
+        assert outbox._worker.is_alive()
+        outbox.add([(METRIC, {"run_id": "a"})])
+
+    assert not outbox._worker.is_alive()
+    assert outbox.pending() == 0
+    assert sender.call_count == 1
@@ -6,7 +6,7 @@ def test_upload_endpoint(upload_client):
     test_file_path = r"C:\Users\LEGION\OneDrive\Desktop\Apple_fruit_company.pdf"
     with open(test_file_path, "rb") as f:
         response = upload_client.post("/upload", files={"file": ("sample.pdf", f, "application/pdf")})
-    assert response.status_code == 200
+    assert response.status_code == 202
     assert "file_id" in response.json()
 
 def test_upload_with_no_file(upload_client):
@@ -16,3 +16,37 @@ def test_upload_with_no_file(upload_client):
 def test_upload_with_wrong_file_type(upload_client):
     response = upload_client.post("/upload", files={"file": ("not_a_pdf.txt", "text data", "text/plain")})
     assert response.status_code in [400, 422]
+
+def make_pdf_bytes():
+    import fitz
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "apple is a fruit company")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def test_duplicate_upload_short_circuits(upload_client):
+    from unittest.mock import patch
+    existing = {"file_id": "existing-id", "status": "indexed"}
+    with patch("pdf_services.main.jobs") as mock_jobs, \
+            patch("pdf_services.main.find_by_content_hash", return_value=existing) as mock_lookup:
+        mock_jobs.find_by_hash.return_value = None
+        response = upload_client.post("/upload", files={"file": ("sample.pdf", make_pdf_bytes(), "application/pdf")})
+
+    assert response.status_code == 200
+    assert response.json()["file_id"] == "existing-id"
+    assert response.json()["duplicate"] is True
+    mock_jobs.submit.assert_not_called()
+    assert len(mock_lookup.call_args.args[0]) == 64  # sha256 of the uploaded bytes
+
+def test_failed_submit_removes_the_upload(upload_client, tmp_path, monkeypatch):
+    from unittest.mock import patch
+    monkeypatch.setattr("pdf_services.main.UPLOAD_DIR", str(tmp_path))
+    with patch("pdf_services.main.jobs") as mock_jobs, \
+            patch("pdf_services.main.find_by_content_hash", return_value=None):
+        mock_jobs.find_by_hash.return_value = None
+        mock_jobs.submit_unless_running.side_effect = RuntimeError("DynamoDB unavailable")
+        response = upload_client.post("/upload", files={"file": ("sample.pdf", make_pdf_bytes(), "application/pdf")})
+
+    assert response.status_code == 500
+    assert os.listdir(tmp_path) == []
@@ -14,3 +14,59 @@ def test_invalid_pdf_extraction():
     with pytest.raises(RuntimeError):
         extract_text("tests/not_a_pdf.txt")
 
+
+def make_pdf(path, pages):
+    import fitz
+    doc = fitz.open()
+    for number in range(pages):
+        doc.new_page().insert_text((72, 72), f"page number {number}")
+    doc.save(path)
+    doc.close()
+
+def test_parallel_extraction_keeps_page_order(tmp_path, monkeypatch):
+    path = str(tmp_path / "manual.pdf")
+    make_pdf(path, 12)
+    monkeypatch.setenv("PDF_EXTRACT_WORKERS", "2")
+    monkeypatch.setenv("PDF_PARALLEL_MIN_PAGES", "10")
+
+    docs = extract_text(path)
+
+    assert [d.metadata["page"] for d in docs] == list(range(12))
+    assert all(f"page number {i}" in d.page_content for i, d in enumerate(docs))
+    assert docs[0].metadata["total_pages"] == 12
+    assert docs[0].metadata["source"] == path
+
+
+def test_pymupdf_is_never_used_from_two_threads(tmp_path, monkeypatch):
+    import threading
+    import time
+    from unittest.mock import patch
+    from pdf_services import processor
+    monkeypatch.setenv("PDF_EXTRACT_WORKERS", "1")
+    paths = []
+    for i in range(4):
+        paths.append(str(tmp_path / f"{i}.pdf"))
+        make_pdf(paths[-1], 2)
+    active, overlaps = [], []
+    real_loader = processor.PyMuPDFLoader
+
+    class Loader(real_loader):
+        def load(self):
+            active.append(1)
+            overlaps.append(len(active))
+            time.sleep(0.05)
+            try:
+                return super().load()
+            finally:
+                active.pop()
+
+    with patch.object(processor, "PyMuPDFLoader", Loader):
+        threads = [threading.Thread(target=extract_text, args=(path,)) for path in paths]
+        threads += [threading.Thread(target=processor.is_encrypted, args=(path,)) for path in paths]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert overlaps == [1, 1, 1, 1]
+    assert processor.is_encrypted(paths[0]) is False
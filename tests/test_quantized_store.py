@@ -0,0 +1,131 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import numpy as np
+import pytest
+from unittest.mock import patch, MagicMock
+
+from rag_module import rag_chain
+from rag_module.quantized_store import QuantizedVectorStore, exact_distances
+
+
+def make_vectors(count, dim=64, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(8, dim))
+    return (centers[rng.integers(0, 8, count)] + rng.normal(scale=0.5, size=(count, dim))).astype(np.float32)
+
+
+def fill(store, vectors, files=4):
+    ids = [f"c{i}" for i in range(len(vectors))]
+    metadatas = [{"file_id": f"f{i % files}", "chunk_id": ids[i]} for i in range(len(vectors))]
+    store.add_vectors(vectors, [f"text {i}" for i in range(len(vectors))], metadatas, ids)
+
+
+@pytest.mark.parametrize("quantization,space", [("int8", "l2"), ("int8", "cosine"), ("binary", "l2")])
+def test_search_matches_exact_top_k(tmp_path, quantization, space):
+    vectors = make_vectors(2000)
+    store = QuantizedVectorStore(str(tmp_path), None, quantization=quantization, space=space, rescore_factor=50)
+    fill(store, vectors)
+
+    query = vectors[7] + 0.01
+    expected = np.argsort(exact_distances(vectors, np.linalg.norm(vectors, axis=1), query, space))[:4]
+    hits = store.search_by_vector(query, k=4)
+
+    assert [row for row, _ in hits] == expected.tolist()
+    assert hits[0][1] <= hits[-1][1]
+
+
+def test_memory_is_a_fraction_of_float32(tmp_path):
+    vectors = make_vectors(1000, dim=384)
+    int8 = QuantizedVectorStore(str(tmp_path / "int8"), None, quantization="int8")
+    binary = QuantizedVectorStore(str(tmp_path / "binary"), None, quantization="binary")
+    fill(int8, vectors)
+    fill(binary, vectors)
+
+    float32_bytes = vectors.nbytes
+    assert int8.stats()["memory_bytes"] < float32_bytes / 3.5
+    assert binary.stats()["memory_bytes"] < float32_bytes / 20
+
+
+def test_delete_by_file_and_upsert_by_id(tmp_path):
+    store = QuantizedVectorStore(str(tmp_path), None)
+    vectors = make_vectors(40)
+    fill(store, vectors)
+
+    store.delete(where={"file_id": "f0"})
+    # Re-adding an id replaces the old row
+    store.add_vectors(vectors[1:2] * -1, ["replaced"], [{"file_id": "f1"}], ["c1"])
+
+    docs = [doc for doc, _ in store.similarity_search_by_vector_with_relevance_scores(vectors[0], k=40)]
+    assert len(docs) == 30
+    assert all(doc.metadata["file_id"] != "f0" for doc in docs)
+    assert sum(1 for doc in docs if doc.page_content in ("text 1", "replaced")) == 1
+    with pytest.raises(ValueError):
+        store.delete(where={"page": 1})
+
+
+def test_reader_sees_rows_written_by_another_instance(tmp_path):
+    # The upload service writes while the query service keeps its store open
+    reader = QuantizedVectorStore(str(tmp_path), None)
+    writer = QuantizedVectorStore(str(tmp_path), None)
+    vectors = make_vectors(100)
+    fill(writer, vectors)
+
+    assert reader.search_by_vector(vectors[3], k=1)[0][0] == 3
+    writer.delete(ids=["c3"])
+    assert reader.search_by_vector(vectors[3], k=1)[0][0] != 3
+
+
+def test_other_quantization_is_refused(tmp_path):
+    # Rewriting the codes in place would corrupt them for a process still using the stored mode
+    vectors = make_vectors(200)
+    fill(QuantizedVectorStore(str(tmp_path / "built"), None, quantization="int8"), vectors)
+    codes = (tmp_path / "built" / "codes.bin").read_bytes()
+
+    with pytest.raises(ValueError, match="int8"):
+        QuantizedVectorStore(str(tmp_path / "built"), None, quantization="binary")
+    assert (tmp_path / "built" / "codes.bin").read_bytes() == codes
+
+    # Opened while still empty, then built by another process in the other mode
+    binary = QuantizedVectorStore(str(tmp_path / "empty"), None, quantization="binary")
+    fill(QuantizedVectorStore(str(tmp_path / "empty"), None, quantization="int8"), vectors)
+    with pytest.raises(ValueError):
+        binary.search_by_vector(vectors[5], k=1)
+    with pytest.raises(ValueError):
+        fill(binary, vectors)
+
+
+@patch("rag_module.rag_chain.Chroma")
+@patch("rag_module.rag_chain.get_batching_embedding")
+def test_rag_chain_uses_quantized_store_when_configured(mock_embedding, mock_chroma, tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path))
+    monkeypatch.setenv("VECTOR_STORE_MODE", "int8")
+    mock_embedding.return_value = MagicMock(embed_documents=lambda texts: make_vectors(len(texts)).tolist())
+    rag_chain.reset_singletons()
+
+    store = rag_chain.get_vectorstore()
+    rag_chain.get_file_vectorstore("f1", create=True).add_texts(["a", "b"], [{"file_id": "f1"}] * 2)
+    rag_chain.drop_file_vectorstore("f1")
+
+    assert isinstance(store, QuantizedVectorStore)
+    assert store.directory == os.path.join(str(tmp_path), "quantized", "langchain")
+    assert not os.path.exists(os.path.join(str(tmp_path), "quantized", "file-f1"))
+    mock_chroma.assert_not_called()
+    rag_chain.reset_singletons()
+
+
+@patch("rag_module.rag_chain.get_batching_embedding")
+def test_evicted_file_stores_are_closed(mock_embedding, tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path))
+    monkeypatch.setenv("VECTOR_STORE_MODE", "int8")
+    monkeypatch.setattr(rag_chain, "MAX_OPEN_FILE_STORES", 2)
+    rag_chain.reset_singletons()
+
+    first = rag_chain.get_file_vectorstore("f1", create=True)
+    with patch.object(QuantizedVectorStore, "close", autospec=True) as mock_close:
+        rag_chain.get_file_vectorstore("f2", create=True)
+        rag_chain.get_file_vectorstore("f3", create=True)
+        mock_close.assert_called_once_with(first)
+
+        rag_chain.reset_singletons()
+        assert mock_close.call_count == 3
@@ -0,0 +1,11 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.query_load import run
+
+
+def test_single_worker_serves_concurrent_queries():
+    # 20 queries that each block for 0.3s must overlap instead of running back to back (6s)
+    wall, latencies = run(concurrency=20, delay=0.3)
+    assert len(latencies) == 20
+    assert wall < 2.0
@@ -0,0 +1,177 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import boto3
+import pytest
+import csv
+import gzip
+import io
+import json
+import asyncio
+from datetime import datetime, timedelta
+from moto import mock_aws
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+from metrics_lambda import query_log_api
+from aws_service.query_log_handler import build_log_item
+from benchmarks.query_log_reads import create_query_log_table
+
+
+@pytest.fixture
+def log_table():
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+        table = create_query_log_table(dynamodb)
+        with patch.object(query_log_api, "dynamodb", dynamodb):
+            yield table
+
+
+def add_logs(table, count, file_id="f1", start=None):
+    start = start or datetime.utcnow()
+    for i in range(count):
+        timestamp = (start - timedelta(hours=i * 6)).isoformat()
+        table.put_item(Item=build_log_item(f"{file_id}-{i}", f"q{i}", "a", 0.9, file_id=file_id, timestamp=timestamp))
+
+
+def pages(client, path, limit):
+    seen, cursor = [], None
+    while True:
+        response = client.get(path, params={"limit": limit, **({"cursor": cursor} if cursor else {})}).json()
+        seen.extend(item["run_id"] for item in response["items"])
+        cursor = response["next_cursor"]
+        if not cursor:
+            return seen
+
+
+def test_recent_logs_are_newest_first_across_days(log_table):
+    add_logs(log_table, 12)
+    client = TestClient(query_log_api.app)
+
+    first = client.get("/query-log", params={"limit": 3}).json()
+    assert [item["run_id"] for item in first["items"]] == ["f1-0", "f1-1", "f1-2"]
+    assert pages(client, "/query-log", 5) == [f"f1-{i}" for i in range(12)]
+
+
+def test_logs_for_one_file_use_the_file_index(log_table):
+    add_logs(log_table, 7, file_id="f1")
+    add_logs(log_table, 4, file_id="f2")
+    client = TestClient(query_log_api.app)
+
+    assert pages(client, "/query-log/f2", 3) == [f"f2-{i}" for i in range(4)]
+
+
+def test_recent_logs_walk_past_quiet_days(log_table, monkeypatch):
+    monkeypatch.setenv("QUERY_LOG_LOOKBACK_DAYS", "5")
+    now = datetime.utcnow()
+    # One log every 4 days for 60 days: far older than the lookback, but never 5 empty days in a row
+    for i in range(15):
+        timestamp = (now - timedelta(days=i * 4)).isoformat()
+        log_table.put_item(Item=build_log_item(f"r{i}", "q", "a", 0.9, file_id="f1", timestamp=timestamp))
+    # Beyond a 10 day gap
+    log_table.put_item(Item=build_log_item("lost", "q", "a", 0.9, file_id="f1",
+                                           timestamp=(now - timedelta(days=70)).isoformat()))
+    client = TestClient(query_log_api.app)
+
+    assert pages(client, "/query-log", 4) == [f"r{i}" for i in range(15)]
+
+
+@pytest.mark.parametrize("state", [
+    None,
+    {"bucket": "2026-10-01", "key": None, "empty": "many"},
+    {"bucket": "2026-10-01", "key": "f1-0", "empty": 0},
+    {"bucket": "2026-10-01", "key": {"run_id": "f1-0"}, "empty": 0},
+    {"bucket": "2026-10-01", "key": {"run_id": "f1-0", "time_bucket": "2026-09-01", "timestamp": "x"}},
+])
+def test_invalid_cursor(log_table, state):
+    cursor = "???" if state is None else query_log_api.encode_cursor(state)
+    response = TestClient(query_log_api.app).get("/query-log", params={"cursor": cursor})
+    assert response.status_code == 400
+
+
+def test_invalid_file_cursor(log_table):
+    client = TestClient(query_log_api.app)
+    for key in ({"run_id": 1}, {"run_id": "r", "file_id": "f2", "timestamp": "t"}):
+        response = client.get("/query-log/f1", params={"cursor": query_log_api.encode_cursor(key)})
+        assert response.status_code == 400
+
+
+def test_export_streams_every_page_of_every_segment(log_table):
+    for i in range(300):
+        log_table.put_item(Item=build_log_item(f"r{i}", "q", "a" * 5000, 0.9, file_id=f"f{i % 3}",
+                                               timestamp=f"2026-10-{1 + i % 10:02d}T10:00:00"))
+    client = TestClient(query_log_api.app)
+
+    response = client.get("/query-log/export", params={"format": "ndjson"})
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    # 300 x 5 KB is past the 1 MB page a single scan returns
+    assert sorted(row["run_id"] for row in rows) == sorted(f"r{i}" for i in range(300))
+
+
+def test_export_csv_gzip_with_filters(log_table):
+    for i in range(20):
+        log_table.put_item(Item=build_log_item(f"r{i}", "q", "a", 0.9, file_id=f"f{i % 2}",
+                                               timestamp=f"2026-10-{1 + i:02d}T10:00:00"))
+    client = TestClient(query_log_api.app)
+
+    response = client.get("/query-log/export", params={
+        "format": "csv", "gzip": True, "file_id": "f0", "since": "2026-10-05", "until": "2026-10-11"
+    })
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(response.content).decode("utf-8"))))
+    assert sorted(row["run_id"] for row in rows) == ["r10", "r4", "r6", "r8"]
+
+    by_date = client.get("/query-log/export", params={"since": "2026-10-19"}).json()
+    assert sorted(row["run_id"] for row in by_date) == ["r18", "r19"]
+
+
+def test_export_rejects_bad_dates(log_table):
+    assert TestClient(query_log_api.app).get("/query-log/export", params={"since": "yesterday"}).status_code == 400
+
+
+def test_export_fails_with_500_before_streaming(log_table):
+    log_table.delete()
+
+    response = TestClient(query_log_api.app).get("/query-log/export")
+
+    assert response.status_code == 500
+    assert response.json()["detail"].startswith("Export failed")
+
+
+@pytest.mark.parametrize("format", ["json", "ndjson", "csv"])
+def test_export_marks_a_scan_that_fails_mid_stream(log_table, format):
+    for i in range(10):
+        log_table.put_item(Item=build_log_item(f"r{i}", "q", "a", 0.9, file_id="f1",
+                                               timestamp=f"2026-10-{1 + i:02d}T10:00:00"))
+    real_scan = log_table.scan
+    calls = []
+
+    def scan(**kwargs):
+        # The first page of segment 0 arrives, then the table is throttled
+        calls.append(kwargs["Segment"])
+        if len(calls) > 1:
+            raise RuntimeError("ProvisionedThroughputExceededException")
+        return {**real_scan(**kwargs), "LastEvaluatedKey": {"run_id": "r0"}}
+
+    with patch.object(query_log_api.dynamodb, "Table", return_value=MagicMock(scan=scan)), \
+            patch.object(query_log_api, "get_export_segments", return_value=1):
+        # Headers are out by then: the client sees the connection fail, not a clean end of the file
+        with pytest.raises(RuntimeError):
+            TestClient(query_log_api.app).get("/query-log/export", params={"format": format})
+
+        calls.clear()
+        response = query_log_api.export_logs(format=format, gzip=False, file_id=None, since=None, until=None)
+        body = []
+
+        async def read():
+            async for chunk in response.body_iterator:
+                body.append(chunk.decode("utf-8"))
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(read())
+
+    text = "".join(body)
+    assert "r0" in text
+    assert "Export failed: ProvisionedThroughputExceededException" in text.strip().splitlines()[-1]
+    if format == "json":
+        with pytest.raises(ValueError):
+            json.loads(text)
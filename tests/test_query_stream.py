@@ -0,0 +1,183 @@
+import sys
+import os
+import json
+import time
+import asyncio
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from langchain_core.documents import Document
+from unittest.mock import patch, MagicMock
+
+
+class FakeAnswerChain:
+    async def astream(self, inputs):
+        for token in ["Apples ", "are ", "fruit."]:
+            yield token
+
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = block.split("\n")
+        events.append((lines[0][len("event: "):], json.loads(lines[1][len("data: "):])))
+    return events
+
+
+@patch("rag_module.main.unknown_file_ids", return_value=[])
+@patch("rag_module.main.record_side_effects")
+@patch("rag_module.main.create_answer_chain", return_value=FakeAnswerChain())
+@patch("rag_module.main.get_retriever")
+@patch("rag_module.main.get_answer_cache")
+def test_stream_sends_sources_then_tokens(mock_cache, mock_retriever, mock_chain, mock_side_effect, mock_unknown,
+                                          rag_client):
+    mock_cache.return_value.get.return_value = None
+    mock_retriever.return_value.invoke.return_value = [
+        Document(page_content="apples", metadata={"chunk_id": "f1-0"}),
+        Document(page_content="fruit", metadata={"chunk_id": "f1-3"}),
+    ]
+
+    response = rag_client.post("/query/stream", json={"query": "what is the document about?", "file_key": "f1"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_events(response.text)
+    assert events[0][0] == "start"
+    assert events[0][1]["sources"] == ["f1-0", "f1-3"]
+    assert "".join(data["token"] for name, data in events if name == "token") == "Apples are fruit."
+    assert events[-1][0] == "end"
+    assert events[-1][1]["run_id"] == events[0][1]["run_id"]
+
+    # Metrics and the query log are written after the stream, with time-to-first-token
+    side_effects = mock_side_effect.call_args.kwargs
+    assert side_effects["metric"]["time_to_first_token"] <= side_effects["metric"]["response_time"]
+    assert side_effects["log"]["response_text"] == "Apples are fruit."
+
+
+def test_stream_with_empty_query(rag_client):
+    response = rag_client.post("/query/stream", json={"query": ""})
+    assert response.status_code == 400
+
+
+def test_stream_with_invalid_json(rag_client):
+    response = rag_client.post("/query/stream", content=b"{not json", headers={"content-type": "application/json"})
+    assert response.status_code == 400
+    response = rag_client.post("/query", content=b"[1, 2]", headers={"content-type": "application/json"})
+    assert response.status_code == 400
+
+
+class HangingAnswerChain:
+    async def astream(self, inputs):
+        yield "Apples "
+        # Gemini stalls; the client gives up
+        await asyncio.Event().wait()
+
+
+@patch("rag_module.main.record_side_effects")
+@patch("rag_module.main.create_answer_chain", return_value=HangingAnswerChain())
+@patch("rag_module.main.get_retriever")
+@patch("rag_module.main.get_answer_cache")
+def test_client_disconnect_still_records_side_effects(mock_cache, mock_retriever, mock_chain, mock_side_effect):
+    from rag_module.main import app
+    mock_cache.return_value.get.return_value = None
+    mock_retriever.return_value.invoke.return_value = [Document(page_content="apples", metadata={"chunk_id": "f1-0"})]
+    body = json.dumps({"query": "what is the document about?"}).encode()
+
+    async def run():
+        requests = [{"type": "http.request", "body": body, "more_body": False}]
+        got_token = asyncio.Event()
+
+        async def receive():
+            if requests:
+                return requests.pop(0)
+            await got_token.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if b"event: token" in message.get("body", b""):
+                got_token.set()
+
+        scope = {
+            "type": "http", "method": "POST", "path": "/query/stream", "raw_path": b"/query/stream",
+            "query_string": b"", "root_path": "", "scheme": "http", "http_version": "1.1",
+            "headers": [(b"content-type", b"application/json")],
+            "client": ("10.0.0.7", 5000), "server": ("testserver", 80),
+        }
+        await asyncio.wait_for(app(scope, receive, send), timeout=5)
+
+    asyncio.run(run())
+
+    deadline = time.time() + 5
+    while not mock_side_effect.called and time.time() < deadline:
+        time.sleep(0.01)
+    log = mock_side_effect.call_args.kwargs["log"]
+    assert log["response_text"] == "Apples "
+    # A partial answer is never cached
+    mock_cache.return_value.put.assert_not_called()
+
+
+class QuickAnswerChain:
+    async def astream(self, inputs):
+        yield "Apples."
+
+
+@patch("rag_module.main.finish_stream")
+@patch("rag_module.main.create_answer_chain", return_value=QuickAnswerChain())
+@patch("rag_module.main.get_retriever")
+@patch("rag_module.main.get_answer_cache")
+def test_disconnect_while_recording_does_not_record_twice(mock_cache, mock_retriever, mock_chain, mock_finish):
+    import threading
+    from rag_module.main import app
+    mock_cache.return_value.get.return_value = None
+    mock_retriever.return_value.invoke.return_value = [Document(page_content="apples", metadata={"chunk_id": "f1-0"})]
+    recording = threading.Event()
+
+    def slow_finish(state, complete):
+        recording.set()
+        time.sleep(0.3)
+        return {"confidence": 0.0, "tokens_used": 0}
+
+    mock_finish.side_effect = slow_finish
+    body = json.dumps({"query": "what is the document about?"}).encode()
+
+    async def run():
+        requests = [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def receive():
+            if requests:
+                return requests.pop(0)
+            # The client leaves while the metric and log are being written
+            while not recording.is_set():
+                await asyncio.sleep(0.01)
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            pass
+
+        scope = {
+            "type": "http", "method": "POST", "path": "/query/stream", "raw_path": b"/query/stream",
+            "query_string": b"", "root_path": "", "scheme": "http", "http_version": "1.1",
+            "headers": [(b"content-type", b"application/json")],
+            "client": ("10.0.0.8", 5000), "server": ("testserver", 80),
+        }
+        await asyncio.wait_for(app(scope, receive, send), timeout=5)
+
+    asyncio.run(run())
+    time.sleep(0.5)
+
+    assert mock_finish.call_count == 1
+    assert mock_finish.call_args.kwargs["complete"] is True
+
+
+def test_background_failures_are_logged(capsys):
+    from rag_module.executors import submit_blocking
+
+    def record():
+        raise RuntimeError("outbox is read-only")
+
+    future = submit_blocking(record)
+    try:
+        future.result()
+    except RuntimeError:
+        pass
+    time.sleep(0.05)
+
+    assert "❌ Background record failed: outbox is read-only" in capsys.readouterr().out
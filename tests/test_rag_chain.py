@@ -0,0 +1,92 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from rag_module import rag_chain
+from unittest.mock import patch, MagicMock
+
+
+@patch("rag_module.rag_chain.Chroma")
+@patch("rag_module.rag_chain.HuggingFaceEmbeddings")
+def test_embedding_and_vectorstore_built_once(mock_embeddings, mock_chroma, tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path))
+    rag_chain.reset_singletons()
+
+    first = rag_chain.get_vectorstore()
+    second = rag_chain.get_vectorstore()
+
+    assert first is second
+    assert rag_chain.get_embedding() is rag_chain.get_embedding()
+    mock_embeddings.assert_called_once()
+    mock_chroma.assert_called_once()
+    rag_chain.reset_singletons()
+
+
+@patch("rag_module.rag_chain.create_chain_from_retriever")
+@patch("rag_module.rag_chain.Chroma")
+@patch("rag_module.rag_chain.HuggingFaceEmbeddings")
+def test_rebuilt_when_config_changes(mock_embeddings, mock_chroma, mock_create_chain, tmp_path, monkeypatch):
+    mock_chroma.side_effect = lambda **kwargs: MagicMock()
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path / "a"))
+    rag_chain.reset_singletons()
+
+    chain = rag_chain.get_chain()
+    assert rag_chain.get_chain() is chain
+    mock_create_chain.assert_called_once()
+
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path / "b"))
+    rag_chain.get_chain()
+
+    assert mock_chroma.call_count == 2
+    assert mock_create_chain.call_count == 2
+    mock_embeddings.assert_called_once()
+    rag_chain.reset_singletons()
+
+
+def chroma_collection(persist_dir, **metadata):
+    # The corpus collection as an earlier run of the service left it, with Chroma's own ef_search
+    import chromadb
+    client = chromadb.PersistentClient(path=str(persist_dir))
+    collection = client.create_collection("langchain", metadata=metadata or None)
+    return client, collection
+
+
+def ef_search(client):
+    return client.get_collection("langchain").configuration["hnsw"]["ef_search"]
+
+
+@patch("rag_module.rag_chain.HuggingFaceEmbeddings")
+def test_hnsw_settings_and_k_from_env(mock_embeddings, tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path))
+    monkeypatch.setenv("HNSW_SPACE", "cosine")
+    monkeypatch.setenv("HNSW_M", "32")
+    monkeypatch.setenv("HNSW_CONSTRUCTION_EF", "200")
+    monkeypatch.setenv("HNSW_SEARCH_EF", "64")
+    monkeypatch.setenv("RETRIEVER_K", "8")
+    client, _ = chroma_collection(tmp_path, **{"hnsw:space": "cosine"})
+    assert ef_search(client) == 100
+    rag_chain.reset_singletons()
+
+    rag_chain.get_vectorstore()
+
+    assert rag_chain.get_hnsw_config() == {
+        "hnsw:space": "cosine", "hnsw:M": 32, "hnsw:construction_ef": 200, "hnsw:search_ef": 64
+    }
+    assert ef_search(client) == 64
+
+    assert rag_chain.get_retriever().k == 8
+    assert rag_chain.get_retriever(("file-1",)).k == 8
+    rag_chain.reset_singletons()
+
+
+@patch("rag_module.rag_chain.HuggingFaceEmbeddings")
+def test_search_ef_left_alone_when_not_configured(mock_embeddings, tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path))
+    monkeypatch.delenv("HNSW_SEARCH_EF", raising=False)
+    client, _ = chroma_collection(tmp_path)
+    rag_chain.reset_singletons()
+
+    rag_chain.get_vectorstore()
+
+    assert "hnsw:search_ef" not in rag_chain.get_hnsw_config()
+    assert ef_search(client) == 100
+    rag_chain.reset_singletons()
@@ -0,0 +1,114 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import uuid
+import chromadb
+import pytest
+from rag_module import rag_chain
+from rag_module.retrieval import ScopedRetriever, file_collection_name
+from rag_module.rag_chain import normalize_file_ids, UnknownFileError
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from unittest.mock import MagicMock, patch
+from scripts.backfill_file_collections import backfill
+
+
+def fake_store(hits):
+    store = MagicMock()
+    store.similarity_search_by_vector_with_relevance_scores.return_value = hits
+    return store
+
+
+def test_scoped_retriever_merges_only_requested_files():
+    stores = {
+        "a": fake_store([(Document(page_content="a1"), 0.1), (Document(page_content="a2"), 0.9)]),
+        "b": fake_store([(Document(page_content="b1"), 0.3)]),
+        "c": fake_store([(Document(page_content="c1"), 0.0)]),
+    }
+    embedding = MagicMock()
+    embedding.embed_query.return_value = [0.5, 0.5]
+    retriever = ScopedRetriever(file_ids=("a", "b"), get_store=stores.__getitem__, embedding=embedding, k=2)
+
+    docs = retriever.invoke("question")
+
+    assert [d.page_content for d in docs] == ["a1", "b1"]
+    embedding.embed_query.assert_called_once_with("question")
+    stores["c"].similarity_search_by_vector_with_relevance_scores.assert_not_called()
+
+
+def test_normalize_file_ids():
+    assert normalize_file_ids(None) == ()
+    assert normalize_file_ids("abc") == ("abc",)
+    assert normalize_file_ids("b, a") == ("a", "b")
+    assert normalize_file_ids(["b", "a", "b"]) == ("a", "b")
+
+
+def test_file_collection_name_is_valid_for_chroma():
+    assert file_collection_name("3f2b-uuid") == "file-3f2b-uuid"
+    assert file_collection_name("../x y") == "file-x_y"
+
+
+@pytest.fixture
+def fake_embedding_store(tmp_path, monkeypatch):
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path))
+    rag_chain.reset_singletons()
+    with patch("rag_module.rag_chain.get_batching_embedding", return_value=DeterministicFakeEmbedding(size=8)):
+        yield tmp_path
+    rag_chain.reset_singletons()
+
+
+@pytest.mark.parametrize("mode", ["chroma", "int8"])
+def test_unknown_file_key_is_rejected_without_creating_a_collection(fake_embedding_store, monkeypatch, rag_client,
+                                                                    mode):
+    monkeypatch.setenv("VECTOR_STORE_MODE", mode)
+    rag_chain.get_file_vectorstore("known", create=True).add_texts(["apples"], [{"file_id": "known"}])
+
+    with pytest.raises(UnknownFileError):
+        rag_chain.get_file_vectorstore("typo")
+    response = rag_client.post("/query", json={"query": "apples?", "file_key": ["known", "typo"]})
+
+    assert response.status_code == 404
+    assert "typo" in response.json()["detail"]
+    assert rag_chain.unknown_file_ids(("known", "typo")) == ["typo"]
+    if mode == "chroma":
+        names = {c.name for c in rag_chain.get_vectorstore()._client.list_collections()}
+        assert file_collection_name("typo") not in names
+    else:
+        assert not os.path.exists(os.path.join(str(fake_embedding_store), "quantized", file_collection_name("typo")))
+
+
+def test_dropping_a_file_collection_reports_real_failures(fake_embedding_store):
+    rag_chain.get_file_vectorstore("known", create=True).add_texts(["apples"], [{"file_id": "known"}])
+    # A file whose ingestion failed before its collection was created
+    rag_chain.drop_file_vectorstore("never-indexed")
+
+    client = rag_chain.get_vectorstore()._client
+    with patch.object(client, "delete_collection", side_effect=OSError("disk I/O error")):
+        with pytest.raises(OSError):
+            rag_chain.drop_file_vectorstore("known")
+    assert rag_chain.unknown_file_ids(("known",)) == []
+
+    rag_chain.drop_file_vectorstore("known")
+    assert rag_chain.unknown_file_ids(("known",)) == ["known"]
+
+
+def test_backfill_creates_collections_for_files_indexed_before_scoping(fake_embedding_store, monkeypatch):
+    monkeypatch.setenv("VECTOR_STORE_MODE", "chroma")
+    old_file = str(uuid.uuid4())
+    # Chunks written before file_id tagging only carry PyMuPDFLoader's source path
+    rag_chain.get_vectorstore().add_texts(
+        ["old apples", "old pears", "no upload"],
+        [{"source": f"uploads/{old_file}.pdf", "page": 0}, {"source": f"uploads/{old_file}.pdf", "page": 1},
+         {"source": "notes.txt"}]
+    )
+    assert rag_chain.unknown_file_ids((old_file,)) == [old_file]
+
+    result = backfill()
+
+    assert result == {"files": 1, "chunks": 2, "tagged": 2, "skipped": 1}
+    rag_chain.reset_singletons()
+    docs = rag_chain.get_file_vectorstore(old_file).similarity_search("apples", k=4)
+    assert {d.page_content for d in docs} == {"old apples", "old pears"}
+    assert all(d.metadata["file_id"] == old_file for d in docs)
+    # A second run finds nothing left to copy
+    assert backfill()["files"] == 0
@@ -0,0 +1,81 @@
+import sys
+import os
+import subprocess
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from unittest.mock import patch, MagicMock
+from rag_module import rag_chain
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def test_import_loads_no_heavy_modules():
+    # A fresh interpreter: importing the service must not pull the models, chromadb or the hub
+    code = (
+        "import sys, rag_module.main; "
+        "print(sorted(m for m in ('chromadb', 'torch', 'sentence_transformers', 'langchain_google_genai') "
+        "if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert output.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_prompt_is_vendored():
+    text = rag_chain.prompt.format(context="C", question="Q")
+    assert "Question: Q" in text and "Context: C" in text
+
+
+@patch("rag_module.rag_chain.get_tokenizer")
+@patch("rag_module.rag_chain.ChatGoogleGenerativeAI")
+@patch("rag_module.rag_chain.Chroma")
+@patch("rag_module.rag_chain.HuggingFaceEmbeddings")
+def test_ready_only_after_warm_up(mock_embeddings, mock_chroma, mock_llm, mock_tokenizer, rag_client, tmp_path,
+                                  monkeypatch):
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path))
+    rag_chain.reset_singletons()
+
+    assert rag_client.get("/ready").status_code == 503
+    timings = rag_chain.warm_up()
+    response = rag_client.get("/ready")
+
+    assert response.status_code == 200
+    assert set(response.json()["timings"]) == set(timings) == {
+        "embedding_model", "vectorstore", "llm", "chain", "answer_cache", "tokenizer"
+    }
+    mock_llm.assert_called_once()
+    rag_chain.reset_singletons()
+
+
+def test_ready_when_warm_up_is_disabled(rag_client, monkeypatch):
+    monkeypatch.setenv("WARMUP_ON_STARTUP", "false")
+    rag_chain.reset_singletons()
+
+    response = rag_client.get("/ready")
+
+    assert response.status_code == 200
+    assert response.json()["warm_up"] == "disabled"
+
+
+@patch("rag_module.rag_chain.get_tokenizer")
+@patch("rag_module.rag_chain.ChatGoogleGenerativeAI", side_effect=[RuntimeError("Gemini unreachable"), MagicMock()])
+@patch("rag_module.rag_chain.Chroma")
+@patch("rag_module.rag_chain.HuggingFaceEmbeddings")
+def test_failed_warm_up_is_retried(mock_embeddings, mock_chroma, mock_llm, mock_tokenizer, rag_client, tmp_path,
+                                   monkeypatch):
+    monkeypatch.setenv("CHROMA_PERSIST_DIR", str(tmp_path))
+    rag_chain.reset_singletons()
+    pauses = []
+
+    def sleep(delay):
+        # The probe sees the failure between attempts
+        response = rag_client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["error"] == "Gemini unreachable"
+        pauses.append(delay)
+
+    rag_chain.warm_up_with_retry(sleep=sleep)
+
+    response = rag_client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["attempts"] == 2
+    assert pauses == [2]
+    rag_chain.reset_singletons()
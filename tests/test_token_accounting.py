@@ -0,0 +1,141 @@
+import sys
+import os
+import json
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, AIMessageChunk
+from unittest.mock import patch, MagicMock
+
+from aws_service.metrics_aggregates import item_deltas, summarize
+from rag_module.retrieval import CorpusRetriever, retrieval_confidence
+from rag_module.tokens import token_usage, estimate_tokens
+
+
+def usage(prompt, completion):
+    return {"input_tokens": prompt, "output_tokens": completion, "total_tokens": prompt + completion}
+
+
+def test_usage_from_gemini_metadata():
+    message = AIMessage(content="Apples.", usage_metadata=usage(812, 9))
+
+    assert token_usage(message, "prompt", "Apples.") == {
+        "prompt_tokens": 812, "completion_tokens": 9, "total_tokens": 821, "source": "gemini"
+    }
+
+
+@patch("rag_module.tokens.get_tokenizer")
+def test_usage_falls_back_to_tokenizer_then_estimate(mock_tokenizer):
+    mock_tokenizer.return_value.encode.side_effect = lambda text, add_special_tokens: text.split()
+    counted = token_usage(AIMessage(content="a b"), "one two three", "a b")
+    assert counted == {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5, "source": "tokenizer"}
+
+    mock_tokenizer.return_value = None
+    estimated = token_usage(AIMessage(content="a b"), "x" * 400, "a b")
+    assert estimated["prompt_tokens"] == estimate_tokens("x" * 400) == 100
+    assert estimated["source"] == "estimate"
+
+
+def test_confidence_weights_the_top_chunks_most():
+    def doc(score):
+        return Document(page_content="x", metadata={"relevance_score": score})
+
+    assert retrieval_confidence([]) == 0.0
+    assert retrieval_confidence([doc(0.9), doc(0.9)]) == 0.9
+    assert retrieval_confidence([doc(0.9), doc(0.3)]) > retrieval_confidence([doc(0.3), doc(0.9)])
+
+
+def test_corpus_retriever_scores_hits():
+    store = MagicMock()
+    store._select_relevance_score_fn.return_value = lambda distance: 1.0 - distance
+    store.similarity_search_with_score.return_value = [
+        (Document(page_content="near", metadata={}), 0.2),
+        (Document(page_content="far", metadata={}), 1.7),
+    ]
+
+    docs = CorpusRetriever(store=store, k=2).invoke("question")
+
+    store.similarity_search_with_score.assert_called_once_with("question", k=2)
+    assert [doc.metadata["relevance_score"] for doc in docs] == [0.8, 0.0]
+
+
+@patch("rag_module.main.record_side_effects")
+@patch("rag_module.main.get_chain")
+@patch("rag_module.main.get_answer_cache")
+def test_query_reports_usage_and_confidence(mock_cache, mock_get_chain, mock_side_effects, rag_client):
+    mock_cache.return_value.get.return_value = None
+    mock_get_chain.return_value.invoke.return_value = {
+        "answer": "Apples.", "packing": None, "confidence": 0.72,
+        "usage": {"prompt_tokens": 812, "completion_tokens": 9, "total_tokens": 821, "source": "gemini"}
+    }
+
+    body = rag_client.post("/query", json={"query": "what about apples?"}).json()
+
+    assert body["tokens_used"] == 821
+    assert body["confidence"] == 0.72
+    side_effects = mock_side_effects.call_args.kwargs
+    assert side_effects["metric"]["prompt_tokens"] == 812
+    assert side_effects["metric"]["confidence"] == 0.72
+    assert side_effects["log"]["tokens_used"] == 821
+    assert side_effects["log"]["confidence_score"] == 0.72
+
+
+@patch("rag_module.main.record_side_effects")
+@patch("rag_module.main.get_chain")
+@patch("rag_module.main.get_answer_cache")
+def test_cache_hit_uses_no_tokens(mock_cache, mock_get_chain, mock_side_effects, rag_client):
+    mock_cache.return_value.get.return_value = {"answer": "Apples.", "confidence": 0.6}
+
+    body = rag_client.post("/query", json={"query": "what about apples?"}).json()
+
+    assert body["cached"] is True
+    assert body["tokens_used"] == 0
+    assert body["confidence"] == 0.6
+    mock_get_chain.assert_not_called()
+    assert mock_side_effects.call_args.kwargs["metric"]["prompt_tokens"] is None
+
+
+class UsageChain:
+    async def astream(self, inputs):
+        # Gemini sends the usage on the final chunk
+        yield AIMessageChunk(content="Apples ")
+        yield AIMessageChunk(content="are fruit.")
+        yield AIMessageChunk(content="", usage_metadata=usage(640, 4))
+
+
+@patch("rag_module.main.unknown_file_ids", return_value=[])
+@patch("rag_module.main.record_side_effects")
+@patch("rag_module.main.create_answer_chain", return_value=UsageChain())
+@patch("rag_module.main.get_retriever")
+@patch("rag_module.main.get_answer_cache")
+def test_stream_reports_usage_from_the_last_chunk(mock_cache, mock_retriever, mock_chain, mock_side_effects,
+                                                  mock_unknown, rag_client):
+    mock_cache.return_value.get.return_value = None
+    mock_retriever.return_value.invoke.return_value = [
+        Document(page_content="apples", metadata={"chunk_id": "f1-0", "relevance_score": 0.5}),
+    ]
+
+    response = rag_client.post("/query/stream", json={"query": "what is it about?", "file_key": "f1"})
+
+    events = [json.loads(block.split("\n")[1][len("data: "):]) for block in response.text.strip().split("\n\n")]
+    assert [event["token"] for event in events if "token" in event] == ["Apples ", "are fruit."]
+    assert events[-1]["tokens_used"] == 644
+    assert events[-1]["confidence"] == 0.5
+    assert mock_side_effects.call_args.kwargs["metric"]["completion_tokens"] == 4
+
+
+def test_summary_splits_tokens_per_llm_call():
+    items = [
+        {"tokens_used": 900, "prompt_tokens": 800, "completion_tokens": 100, "response_time": 1.0},
+        {"tokens_used": 500, "prompt_tokens": 450, "completion_tokens": 50, "response_time": 1.0},
+        {"tokens_used": 0, "cache_hit": True, "response_time": 0.1},
+    ]
+    aggregate = {}
+    for item in items:
+        for name, value in item_deltas(item).items():
+            aggregate[name] = aggregate.get(name, 0) + value
+
+    summary = summarize(aggregate)
+
+    assert summary["avg_tokens_per_llm_call"] == 700
+    assert summary["avg_prompt_tokens"] == 625
+    assert summary["avg_completion_tokens"] == 75
@@ -0,0 +1,122 @@
+import sys
+import os
+import json
+import time
+import threading
+import contextvars
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from unittest.mock import patch, MagicMock
+
+from pdf_services.jobs import IngestionJobs
+from rag_module.embedding_batcher import BatchingEmbeddings
+from rag_module.rag_chain import create_chain_from_retriever
+from rag_module.retrieval import CorpusRetriever
+from rag_module.tracing import Tracer, tracer, post_otlp
+
+
+def test_spans_nest_across_threads_and_report_self_time():
+    local = Tracer()
+    with local.trace("query", run_id="r1"):
+        with local.span("vector_search"):
+            with local.span("embed_query"):
+                time.sleep(0.02)
+        # Work handed to a thread with the caller's context, as run_blocking does
+        def call_llm():
+            with local.span("llm_call"):
+                time.sleep(0.01)
+
+        context = contextvars.copy_context()
+        worker = threading.Thread(target=context.run, args=(call_llm,))
+        with local.span("prompt_build"):
+            worker.start()
+            worker.join()
+    with local.span("orphan"):
+        pass
+
+    pipeline = local.breakdown()["query"]
+    stages = pipeline["stages"]
+    assert pipeline["count"] == 1
+    assert "orphan" not in stages
+    assert stages["embed_query"]["avg_ms"] >= 20
+    # vector_search itself did nothing besides waiting for its embed_query child
+    assert stages["vector_search"]["self_avg_ms"] < stages["embed_query"]["avg_ms"]
+    assert abs(sum(stage["share"] for stage in stages.values()) - 1) < 0.01
+
+
+@patch("rag_module.rag_chain.token_usage", return_value={"prompt_tokens": 5, "completion_tokens": 1,
+                                                         "total_tokens": 6, "source": "estimate"})
+@patch("rag_module.rag_chain.get_llm", return_value=FakeListChatModel(responses=["Apples."]))
+@patch("rag_module.main.get_outbox")
+@patch("rag_module.main.get_chain")
+@patch("rag_module.main.get_answer_cache")
+def test_query_spans_share_the_run_id(mock_cache, mock_get_chain, mock_outbox, mock_llm, mock_usage, rag_client,
+                                      tmp_path, monkeypatch):
+    monkeypatch.setenv("TRACE_EXPORT", "jsonl")
+    monkeypatch.setenv("TRACE_FILE", str(tmp_path / "spans.jsonl"))
+    tracer.reset()
+    mock_cache.return_value.get.return_value = None
+    embedding = BatchingEmbeddings(DeterministicFakeEmbedding(size=8), max_wait_ms=0)
+    store = MagicMock()
+    store.similarity_search_with_score.side_effect = lambda query, k: (
+        embedding.embed_query(query) and [(Document(page_content="apples", metadata={"chunk_id": "f1-0"}), 0.3)]
+    )
+    mock_get_chain.return_value = create_chain_from_retriever(CorpusRetriever(store=store, k=1))
+
+    run_id = rag_client.post("/query", json={"query": "what about apples?"}).json()["run_id"]
+    tracer.flush()
+
+    with open(tmp_path / "spans.jsonl") as f:
+        spans = [json.loads(line) for line in f]
+    assert {span["name"] for span in spans} == {
+        "query", "answer_cache", "vector_search", "embed_query", "prompt_build", "llm_call", "outbox_write"
+    }
+    assert {span["attributes"]["run_id"] for span in spans} == {run_id}
+    assert len({span["trace_id"] for span in spans}) == 1
+    stages = rag_client.get("/metrics/stages").json()["pipelines"]["query"]["stages"]
+    assert stages["llm_call"]["count"] == 1
+
+
+@patch("pdf_services.jobs.update_status")
+@patch("pdf_services.jobs.save_metadata")
+@patch("pdf_services.jobs.index_document")
+@patch("pdf_services.jobs.extract_text", side_effect=lambda *a, **k: time.sleep(0.05) or ["page"])
+@patch("pdf_services.jobs.upload_to_s3", side_effect=RuntimeError("S3 down"))
+@patch("pdf_services.jobs.delete_document")
+def test_ingestion_spans_join_the_upload_trace(mock_delete, mock_s3, mock_extract, mock_index, mock_save,
+                                               mock_update, upload_client):
+    tracer.reset()
+    jobs = IngestionJobs(max_workers=1)
+    with tracer.trace("upload", file_id="f1"):
+        future = jobs.submit("f1", "a.pdf", "uploads/f1.pdf")
+    future.result()
+
+    stages = upload_client.get("/metrics/stages").json()["pipelines"]["upload"]["stages"]
+    # The S3 failure stops the job before indexing
+    assert set(stages) == {"upload", "ingest", "s3_upload", "extract"}
+    assert stages["s3_upload"]["errors"] == 1
+    assert stages["extract"]["avg_ms"] >= 50
+    mock_index.assert_not_called()
+
+
+@patch("rag_module.tracing.urllib.request.urlopen")
+def test_otlp_payload(mock_urlopen):
+    span = {
+        "trace_id": "ab" * 16, "span_id": "cd" * 8, "parent_id": None, "name": "query", "pipeline": "query",
+        "service": "rag", "start": 1700000000.5, "duration_ms": 12.5, "self_ms": 2.0, "status": "error",
+        "error": "RuntimeError: boom", "attributes": {"run_id": "r1", "k": 4, "run_ids": ["r1", "r2"]},
+    }
+
+    post_otlp("http://localhost:4318/v1/traces", [span])
+
+    request = mock_urlopen.call_args.args[0]
+    body = json.loads(request.data)
+    resource = body["resourceSpans"][0]
+    exported = resource["scopeSpans"][0]["spans"][0]
+    assert resource["resource"]["attributes"][0]["value"] == {"stringValue": "rag"}
+    assert exported["traceId"] == "ab" * 16
+    assert int(exported["endTimeUnixNano"]) - int(exported["startTimeUnixNano"]) == 12500000
+    assert {"key": "k", "value": {"intValue": "4"}} in exported["attributes"]
+    assert exported["status"]["code"] == 2